@@ -0,0 +1,22 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+# Common names of device certificates, for the instance scripts which take them as file names or
+# command arguments. The certificate functions strip every other character before a certificate
+# is issued, see CreateDeviceVpnCertificate, the characters IoT Core allows in thing names.
+#
+# Installed next to the scripts in /usr/share, the first directory on their import path.
+
+import re
+
+NAME = re.compile(r"^[a-zA-Z0-9:_-]{1,128}$")
@@ -0,0 +1,79 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+# The OpenVPN servers of an instance, for the instance scripts which read their configuration
+# or ask them about their clients. The TCP server only runs in dual protocol mode, see
+# TcpFallbackPort.
+#
+# Installed next to the scripts in /usr/share, the first directory on their import path.
+
+import ipaddress
+import os
+import re
+import socket
+
+MGMT_SOCKET = "/run/openvpn-mgmt.sock"
+TCP_MGMT_SOCKET = "/run/openvpn-tcp-mgmt.sock"
+# management socket and configuration of each server
+SERVERS = [
+    (MGMT_SOCKET, "/mnt/efs/fs1/ovpn_data/openvpn.conf"),
+    (TCP_MGMT_SOCKET, "/mnt/efs/fs1/ovpn_data/openvpn-tcp.conf"),
+]
+# OpenVPN's default
+DEFAULT_MAX_CLIENTS = 1024
+# the tunnel network of init-instance, each server of dual protocol mode has half of it
+DEFAULT_NETMASK = "255.255.0.0"
+
+
+def pool_clients(netmask):
+    """
+    net30 clients the address pool of a 'server' network holds. Each client takes a /30, the
+    server the first one, and the pool leaves out the last one.
+    """
+    prefix = ipaddress.IPv4Network(f"0.0.0.0/{netmask}").prefixlen
+    return 2 ** (32 - prefix) // 4 - 2
+
+
+def client_slots(conf):
+    """Clients a server configuration admits, the smaller of max-clients and its pool"""
+    match = re.search(r"^max-clients (\d+)$", conf, re.M)
+    max_clients = int(match.group(1)) if match else DEFAULT_MAX_CLIENTS
+    match = re.search(r"^server \S+ (\S+)", conf, re.M)
+    return min(max_clients, pool_clients(match.group(1) if match else DEFAULT_NETMASK))
+
+
+def management_status(path):
+    """Returns the 'status 2' output of the OpenVPN management interface."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(5)
+        s.connect(path)
+        s.sendall(b"status 2\nquit\n")
+        chunks = []
+        while True:
+            chunk = s.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b"".join(chunks).decode("utf-8", "replace")
+
+
+def connected():
+    """Common names of the clients connected to either server"""
+    names = set()
+    for path in [MGMT_SOCKET, TCP_MGMT_SOCKET]:
+        if path == MGMT_SOCKET or os.path.exists(path):
+            for line in management_status(path).splitlines():
+                fields = line.split(",")
+                if fields[0] == "CLIENT_LIST" and len(fields) > 1:
+                    names.add(fields[1])
+    return names
@@ -0,0 +1,38 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+# CloudWatch metrics of the instance scripts, published to the ${STACK_NAME}/VPN namespace in
+# the REGION of their environment.
+#
+# Installed next to the scripts in /usr/share, the first directory on their import path.
+
+import json
+import os
+import subprocess
+
+
+def publish(data):
+    # metrics are best effort
+    subprocess.run(
+        [
+            "aws",
+            "cloudwatch",
+            "put-metric-data",
+            "--region",
+            os.environ["REGION"],
+            "--namespace",
+            f"{os.environ['STACK_NAME']}/VPN",
+            "--metric-data",
+            json.dumps(data),
+        ]
+    )
@@ -15,6 +15,7 @@ import boto3
 import os
 import time
 import json
+import random
 import re
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import serialization
@@ -24,9 +25,12 @@ from cryptography.x509.oid import NameOID
 from cryptography.hazmat.primitives import hashes
 import logging as log
 from awsutil import get_client
+from timing import Timer
+import pkiagent
 
 REGION = os.environ["REGION"]
 AUTO_SCALING_GROUP_NAME = os.environ["AUTO_SCALING_GROUP_NAME"]
+METRICS_NAMESPACE = f"{os.environ['STACK_NAME']}/VPN"
 ec2as = get_client("autoscaling")
 ssm = get_client("ssm")
 
@@ -81,17 +85,19 @@ def get_instance_id():
     ]
     if len(healthy) == 0:
         raise Exception("No healthy instances.")
-    return healthy[0]["InstanceId"]
+    # spread signing over the instances, each can sign with a different CA shard
+    return random.choice(healthy)["InstanceId"]
 
 
-def get_command_result(command_id, instance_id):
+def get_command_result(command_id, instance_id, timer):
     retries = 0
     while retries < 300:
         retries += 1
         try:
-            output = ssm.get_command_invocation(
-                CommandId=command_id, InstanceId=instance_id
-            )
+            with timer.span("ssm_poll"):
+                output = ssm.get_command_invocation(
+                    CommandId=command_id, InstanceId=instance_id
+                )
             status = output["Status"]
             if status == "InProgress":
                 retries = 0
@@ -105,9 +111,7 @@ def get_command_result(command_id, instance_id):
                 raise Exception("Command execution failed")
             elif status == "Success":
                 log.info("Command execution success")
-                stdout = output["StandardOutputContent"]
-                stdout = stdout.replace("\r", "")
-                return stdout
+                return output
         except ssm.exceptions.InvocationDoesNotExist as e:
             if retries == 300:
                 log.error(f"SSM command execution failed after 5 minutes")
@@ -119,19 +123,51 @@ def get_command_result(command_id, instance_id):
                 time.sleep(1.0)
 
 
-def exec_gencert_cmd(instance_id, thing_name, csr_pem):
-    res = ssm.send_command(
-        InstanceIds=[instance_id],
-        DocumentName="AWS-RunShellScript",
-        Parameters={
-            "commands": [f"sudo /usr/share/gen-device-cert '{thing_name}' '{csr_pem}'"]
-        },
-    )
+def exec_gencert_cmd(instance_id, thing_name, csr_pem, timer):
+    dispatched_at = time.time()
+    with timer.span("ssm_dispatch"):
+        res = ssm.send_command(
+            InstanceIds=[instance_id],
+            DocumentName="AWS-RunShellScript",
+            Parameters={
+                "commands": [
+                    f"sudo /usr/share/gen-device-cert '{thing_name}' '{csr_pem}'"
+                ]
+            },
+        )
     command_id = res["Command"]["CommandId"]
-    return get_command_result(command_id, instance_id)
+    output = get_command_result(command_id, instance_id, timer)
+    timer.add_command_phases(output, dispatched_at)
+    return output["StandardOutputContent"].replace("\r", "")
+
+
+def exec_gencert_agent(instance_id, thing_name, csr_pem, timer):
+    """The profile signed by the instance's PKI agent, None when the agent did not answer"""
+    dispatched_at = time.time()
+    outputs = pkiagent.run("sign", [instance_id], timer, name=thing_name, csr=csr_pem)
+    if instance_id not in outputs:
+        return None
+    output = outputs[instance_id]
+    # a lost request may have been signed, signing again through SSM would be refused
+    if output["Status"] != "Success":
+        log.error(f"Command execution {output['Status'].lower()}")
+        raise Exception("Command execution failed")
+    timer.add_command_phases(output, dispatched_at, "agent_queue")
+    return output["StandardOutputContent"].replace("\r", "")
 
 
 def handler(event, context):
+    timer = Timer(METRICS_NAMESPACE, "CreateDeviceVpnCertificate")
+    try:
+        cfg = create_device_config(event, timer)
+    except Exception:
+        timer.flush("Failed")
+        raise
+    timer.flush()
+    return cfg
+
+
+def create_device_config(event, timer):
     if not "ClientName" in event:
         # don't disclose much information here in case this Lambda
         # gets hooked up to an API in some manner.
@@ -146,7 +182,8 @@ def handler(event, context):
     assert len(thing_name) >= 1 and len(thing_name) <= 128
 
     # find an instance
-    instance_id = get_instance_id()
+    with timer.span("describe_asg"):
+        instance_id = get_instance_id()
     log.info(f"Executing certificate creation command on instance {instance_id}")
 
     # Use the passed in CSR, or generate new key/CSR
@@ -161,10 +198,15 @@ def handler(event, context):
         # of note.. the lifespan of this private key is until this function completes executing
         # after which the private key will no longer be known except to the caller of the function
         # DO NOT print the key to any logging mechanism
-        key_pem, csr_pem = generate_key_and_csr(thing_name)
-
-    # and execute the command to create a device cert and configuration
-    cfg = exec_gencert_cmd(instance_id, thing_name, csr_pem)
-    cfg = cfg.replace("REPLACE_WITH_PRIVATE_KEY_PEM", key_pem)
+        with timer.span("keygen"):
+            key_pem, csr_pem = generate_key_and_csr(thing_name)
+
+    # and execute the command to create a device cert and configuration, through the
+    # instance's PKI agent when it answers and SSM otherwise
+    cfg = exec_gencert_agent(instance_id, thing_name, csr_pem, timer)
+    if cfg is None:
+        cfg = exec_gencert_cmd(instance_id, thing_name, csr_pem, timer)
+    with timer.span("render"):
+        cfg = cfg.replace("REPLACE_WITH_PRIVATE_KEY_PEM", key_pem)
 
     return cfg
@@ -18,8 +18,19 @@ from EIPReaper import handler as ipreaper_handler
 from UUIDGen import handler as uuidgen_hander
 from DeleteLogGroup import handler as deleteloggroup_hander
 from DeleteEFS import handler as deleteefs_hander
+from PkiBootstrap import handler as pkibootstrap_handler
+from IoTEndpointGetter import handler as iotendpoint_handler
+from Waiter import DeadlineExceeded
+from awsutil import get_client
+import json
 import logging as log
 
+awslambda = get_client("lambda")
+
+# each continuation gets a fresh Lambda timeout (10 minutes), stay within the
+# one hour CloudFormation waits for a custom resource response
+MAX_CONTINUATIONS = 5
+
 
 def handler(event, context):
     try:
@@ -39,12 +50,39 @@ def handler(event, context):
                 res = deleteloggroup_hander(event, context)
             elif action == "DeleteEFS":
                 res = deleteefs_hander(event, context)
+            elif action == "PkiBootstrap":
+                res = pkibootstrap_handler(event, context)
+            elif action == "IoTEndpoint":
+                res = iotendpoint_handler(event, context)
             else:
                 raise Exception("Unknown action")
 
-            send(event, context, SUCCESS, {}, res["PhysicalResourceId"])
+            send(
+                event, context, SUCCESS, res.get("Data", {}), res["PhysicalResourceId"]
+            )
         else:
             raise Exception("Action not specified")
+    except DeadlineExceeded as e:
+        try:
+            continue_later(event, context, e.state)
+        except Exception as err:
+            log.error(err)
+            send(event, context, FAILED, {}, reason=str(err))
     except Exception as e:
         log.error(e)
         send(event, context, FAILED, {}, reason=str(e))
+
+
+def continue_later(event, context, state):
+    continuations = event.get("Continuation", {}).get("Continuations", 0) + 1
+    if continuations > MAX_CONTINUATIONS:
+        raise Exception(f"Gave up after {MAX_CONTINUATIONS} continuations")
+
+    log.info(f"Continuing in a new invocation ({continuations}/{MAX_CONTINUATIONS})")
+    event["Continuation"] = {**state, "Continuations": continuations}
+    # asynchronous, this invocation returns without responding to CloudFormation
+    awslambda.invoke(
+        FunctionName=context.invoked_function_arn,
+        InvocationType="Event",
+        Payload=json.dumps(event),
+    )
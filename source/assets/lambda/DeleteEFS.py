@@ -12,9 +12,9 @@
 #
 
 import boto3
-import time
 import logging as log
 from awsutil import get_client
+from Waiter import wait_until, error_code
 
 efs = get_client("efs")
 
@@ -26,23 +26,28 @@ def handler(event, context):
     if request_type == "Update":
         return on_update(event)
     if request_type == "Delete":
-        return on_delete(event)
+        return on_delete(event, context)
     raise Exception("Invalid request type: %s" % request_type)
 
 
-def on_delete(event):
+def on_delete(event, context):
     props = event["ResourceProperties"]
     fileSystemId = props["FileSystemId"]
     log.info(
         f"Deleting EFS filesystem id {fileSystemId}. Errors may be logged while the process waits for the resource to be released."
     )
-    while True:
+
+    def delete():
         try:
             efs.delete_file_system(FileSystemId=fileSystemId)
-            return {"PhysicalResourceId": f"{fileSystemId}-delete"}
         except Exception as e:
-            log.error(e)
-            time.sleep(5)
+            if error_code(e) != "FileSystemNotFound":
+                raise
+            log.info(f"EFS filesystem id {fileSystemId} was already deleted.")
+
+    # the file system is in use until its mount targets are deleted
+    wait_until(event, context, delete, retryable_codes=["FileSystemInUse"])
+    return {"PhysicalResourceId": f"{fileSystemId}-delete"}
 
 
 def on_update(event):
@@ -12,8 +12,8 @@
 #
 
 import boto3
-import time
 from awsutil import get_client
+from Waiter import wait_until
 
 logs = get_client("logs")
 
@@ -25,18 +25,22 @@ def handler(event, context):
     if request_type == "Update":
         return on_update(event)
     if request_type == "Delete":
-        return on_delete(event)
+        return on_delete(event, context)
     raise Exception("Invalid request type: %s" % request_type)
 
 
-def on_delete(event):
+def on_delete(event, context):
     props = event["ResourceProperties"]
     logGroupName = props["LogGroupName"]
-    try:
-        logs.delete_log_group(logGroupName=logGroupName)
-    except logs.exceptions.ResourceNotFoundException:
-        # don't blow up if the log group has not yet been created
-        pass
+
+    def delete():
+        try:
+            logs.delete_log_group(logGroupName=logGroupName)
+        except logs.exceptions.ResourceNotFoundException:
+            # don't blow up if the log group has not yet been created
+            pass
+
+    wait_until(event, context, delete, retryable_codes=["OperationAbortedException"])
     return {"PhysicalResourceId": f"{logGroupName}-delete"}
 
 
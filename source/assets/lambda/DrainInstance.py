@@ -0,0 +1,71 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+import boto3
+import os
+import re
+import logging as log
+from botocore.exceptions import ClientError
+from awsutil import get_client
+
+DRAIN_TIMEOUT_SECONDS = 60 * int(os.environ.get("DRAIN_TIMEOUT_MINUTES", "15"))
+DRAIN_THRESHOLD = int(os.environ.get("DRAIN_THRESHOLD", "0"))
+DRAIN_RATE = int(os.environ.get("DRAIN_RATE", "120"))
+ec2as = get_client("autoscaling")
+ssm = get_client("ssm")
+
+
+def sanitize(value):
+    # these end up in a shell command on the instance
+    return re.sub("[^a-zA-Z0-9:_-]", "", value)
+
+
+def handler(event, context):
+    """
+    Handles 'EC2 Instance-terminate Lifecycle Action' events. The instance drains its
+    own sessions and completes the lifecycle action, see drain-instance. Termination is
+    only continued from here when the drain could not be started.
+    """
+    detail = event["detail"]
+    instance_id = sanitize(detail["EC2InstanceId"])
+    asg_name = sanitize(detail["AutoScalingGroupName"])
+    hook_name = sanitize(detail["LifecycleHookName"])
+    token = sanitize(detail["LifecycleActionToken"])
+
+    env = f"DRAIN_TIMEOUT={DRAIN_TIMEOUT_SECONDS} DRAIN_THRESHOLD={DRAIN_THRESHOLD} DRAIN_RATE={DRAIN_RATE}"
+    try:
+        res = ssm.send_command(
+            InstanceIds=[instance_id],
+            DocumentName="AWS-RunShellScript",
+            Parameters={
+                "commands": [
+                    f"sudo {env} /usr/share/drain-instance '{asg_name}' '{hook_name}' '{token}'"
+                ],
+                # leave time for the final heartbeat and completing the action
+                "executionTimeout": [str(DRAIN_TIMEOUT_SECONDS + 300)],
+            },
+        )
+        log.info(
+            f"Draining instance {instance_id}, command {res['Command']['CommandId']}"
+        )
+        return {"InstanceId": instance_id, "Draining": True}
+    except ClientError as e:
+        log.error(f"Unable to drain instance {instance_id}, terminating now: {e}")
+        ec2as.complete_lifecycle_action(
+            AutoScalingGroupName=asg_name,
+            LifecycleHookName=hook_name,
+            LifecycleActionToken=token,
+            InstanceId=instance_id,
+            LifecycleActionResult="CONTINUE",
+        )
+        return {"InstanceId": instance_id, "Draining": False}
@@ -12,9 +12,9 @@
 #
 
 import boto3
-import time
 import logging as log
 from awsutil import get_client
+from Waiter import wait_until, error_code
 
 ec2 = get_client("ec2")
 
@@ -26,27 +26,36 @@ def handler(event, context):
     if request_type == "Update":
         return on_update(event)
     if request_type == "Delete":
-        return on_delete(event)
+        return on_delete(event, context)
     raise Exception("Invalid request type: %s" % request_type)
 
 
-def on_delete(event):
+def on_delete(event, context):
     props = event["ResourceProperties"]
     allocationId = props["AllocationId"]
     log.info(
         f"Releasing EIP allocation id {allocationId}. 'Access Denied' errors may be logged while the process waits for the resource to be available for release."
     )
 
-    while True:
+    def release():
         try:
             ec2.release_address(AllocationId=allocationId)
-            print(
-                f"The EIP AllocationId {allocationId} has been successfully released. Ignore any (AuthFailure) messages above."
-            )
-            return {"PhysicalResourceId": f"{allocationId}-reaper"}
         except Exception as e:
-            log.error(e)
-            time.sleep(5)
+            if error_code(e) != "InvalidAllocationID.NotFound":
+                raise
+            log.info(f"The EIP AllocationId {allocationId} was already released.")
+
+    # the EIP stays associated until the load balancer is fully deleted
+    wait_until(
+        event,
+        context,
+        release,
+        retryable_codes=["AuthFailure", "InvalidIPAddress.InUse"],
+    )
+    print(
+        f"The EIP AllocationId {allocationId} has been successfully released. Ignore any (AuthFailure) messages above."
+    )
+    return {"PhysicalResourceId": f"{allocationId}-reaper"}
 
 
 def on_update(event):
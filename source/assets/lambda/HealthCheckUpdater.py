@@ -12,24 +12,29 @@
 #
 
 import boto3
-import time
 from awsutil import get_client
+from Waiter import wait_until
 
 ec2as = get_client("autoscaling")
 
 
-def assertHealthCheckGracePeriodIs2Mins(asgName):
-    ec2as.update_auto_scaling_group(
-        AutoScalingGroupName=asgName, HealthCheckGracePeriod=90
+def assertHealthCheckGracePeriodIs2Mins(event, context, asgName):
+    wait_until(
+        event,
+        context,
+        lambda: ec2as.update_auto_scaling_group(
+            AutoScalingGroupName=asgName, HealthCheckGracePeriod=90
+        ),
+        retryable_codes=["ScalingActivityInProgress", "ResourceContention"],
     )
 
 
 def handler(event, context):
     request_type = event["RequestType"]
     if request_type == "Create":
-        return on_create(event)
+        return on_create(event, context)
     if request_type == "Update":
-        return on_update(event)
+        return on_update(event, context)
     if request_type == "Delete":
         return on_delete(event)
     raise Exception("Invalid request type: %s" % request_type)
@@ -41,15 +46,15 @@ def on_delete(event):
     return {"PhysicalResourceId": f"{asgName}-healthcheck"}
 
 
-def on_update(event):
+def on_update(event, context):
     props = event["ResourceProperties"]
     asgName = props["AutoScalingGroupName"]
-    assertHealthCheckGracePeriodIs2Mins(asgName)
+    assertHealthCheckGracePeriodIs2Mins(event, context, asgName)
     return {"PhysicalResourceId": f"{asgName}-healthcheck"}
 
 
-def on_create(event):
+def on_create(event, context):
     props = event["ResourceProperties"]
     asgName = props["AutoScalingGroupName"]
-    assertHealthCheckGracePeriodIs2Mins(asgName)
+    assertHealthCheckGracePeriodIs2Mins(event, context, asgName)
     return {"PhysicalResourceId": f"{asgName}-healthcheck"}
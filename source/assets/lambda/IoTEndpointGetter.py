@@ -29,7 +29,8 @@ def handler(event, context):
 
 
 def on_delete(event):
-    return {"PhysicalResourceId": ""}
+    # nothing to delete, the id must stay the one CloudFormation knows
+    return {"PhysicalResourceId": event["PhysicalResourceId"]}
 
 
 def on_update(event):
@@ -12,21 +12,28 @@
 #
 
 import boto3
+import time
 import logging as log
 from awsutil import get_client
+from Waiter import wait_until
 import ipaddress
 
 ga = get_client("globalaccelerator")
 ec2 = get_client("ec2")
 r53r = get_client("route53resolver")
 
+# Describe results are kept across warm invocations, keyed by ARN or ID. A stack
+# creates several lookups against the same accelerator or endpoint.
+CACHE_TTL_SECONDS = 300
+cache = {}
+
 
 def handler(event, context):
     request_type = event["RequestType"]
     if request_type == "Create":
-        return on_create(event)
+        return on_create(event, context)
     if request_type == "Update":
-        return on_update(event)
+        return on_update(event, context)
     if request_type == "Delete":
         return on_delete(event)
     raise Exception("Invalid request type: %s" % request_type)
@@ -36,41 +43,72 @@ def on_delete(event):
     return {"PhysicalResourceId": ""}
 
 
-def on_update(event):
-    return on_create(event)
+def on_update(event, context):
+    return on_create(event, context)
 
 
-def on_create(event):
+def on_create(event, context):
     props = event["ResourceProperties"]
+    ips = wait_until(event, context, lambda: lookup(props))
+    data = {f"Ip{i}": ip for i, ip in enumerate(ips)}
+
+    # a single index was requested, otherwise every IP is returned as Ip0..IpN attributes
+    index = props.get("IpIndex", props.get("Index"))
+    if index is not None:
+        return {"PhysicalResourceId": ips[int(index)], "Data": data}
+    return {"PhysicalResourceId": ",".join(ips), "Data": data}
+
+
+def cached(key, fn):
+    now = time.time()
+    hit = cache.get(key)
+    if hit and hit[0] > now:
+        log.info(f"Using cached lookup for {key}")
+        return hit[1]
+    value = fn()
+    cache[key] = (now + CACHE_TTL_SECONDS, value)
+    return value
 
+
+def lookup(props):
     if "AcceleratorArn" in props:
         acceleratorArn = props["AcceleratorArn"]
-        ipIndex = int(props["IpIndex"])
-        acc = ga.describe_accelerator(AcceleratorArn=acceleratorArn)["Accelerator"]
-        ip = acc["IpSets"][0]["IpAddresses"][ipIndex]
+        acc = cached(
+            acceleratorArn,
+            lambda: ga.describe_accelerator(AcceleratorArn=acceleratorArn),
+        )["Accelerator"]
+        ips = acc["IpSets"][0]["IpAddresses"]
 
     elif "NetworkInterfaceId" in props:
         networkInterdaceId = props["NetworkInterfaceId"]
-        inf = ec2.describe_network_interfaces(NetworkInterfaceIds=[networkInterdaceId])
-        ip = inf["NetworkInterfaces"][0]["PrivateIpAddress"]
+        inf = cached(
+            networkInterdaceId,
+            lambda: ec2.describe_network_interfaces(
+                NetworkInterfaceIds=[networkInterdaceId]
+            ),
+        )
+        ips = [inf["NetworkInterfaces"][0]["PrivateIpAddress"]]
 
     elif "EndpointId" in props:
         endpointId = props["EndpointId"]
-        ipIndex = int(props["IpIndex"])
-        res = r53r.list_resolver_endpoint_ip_addresses(ResolverEndpointId=endpointId)
-        ip = res["IpAddresses"][ipIndex]["Ip"]
+        res = cached(
+            endpointId,
+            lambda: r53r.list_resolver_endpoint_ip_addresses(
+                ResolverEndpointId=endpointId
+            ),
+        )
+        ips = [a["Ip"] for a in res["IpAddresses"]]
 
-    elif "VpcCIDR" in props and "Index" in props:
+    elif "VpcCIDR" in props:
         vpcCidr = props["VpcCIDR"]
-        index = int(props["Index"])
         vpcMask = vpcCidr.split("/")[1]
         subnetMask = int(vpcMask) + 2  # i.e. /24 to 4x /26's
         subnets = list(ipaddress.ip_network(vpcCidr).subnets(new_prefix=subnetMask))
-        ip = str(subnets[index])
+        ips = [str(subnet) for subnet in subnets]
 
     else:
         raise Exception(
-            "Unknown IP to get, no AcceleratorArn, NetworkInterfaceId, EndpointId or VpcCIDR/Index arguments"
+            "Unknown IP to get, no AcceleratorArn, NetworkInterfaceId, EndpointId or VpcCIDR arguments"
         )
 
-    return {"PhysicalResourceId": ip}
\ No newline at end of file
+    return ips
@@ -0,0 +1,190 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import select
+import socket
+import ssl
+import threading
+import time
+import logging as log
+from concurrent.futures import ThreadPoolExecutor
+
+# the EFS share holding the agent key and the root CA, see init-instance
+PKI_MOUNT_PATH = os.environ.get("PKI_MOUNT_PATH", "/mnt/ovpn_data")
+PORT = int(os.environ.get("PKI_AGENT_PORT", "1196"))
+CONNECT_TIMEOUT = 2
+# the agent gives up on a script after 240 seconds, see pki-agent
+REQUEST_TIMEOUT = 250
+
+# connections stay open between invocations of a warm container, by instance address
+connections = {}
+connections_lock = threading.Lock()
+tls_context = None
+
+
+def canonical(request):
+    """Bytes the mac of a request is computed over, the same as pki-agent"""
+    body = {k: v for k, v in request.items() if k != "mac"}
+    return json.dumps(body, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def sign_request(key, request, now=None):
+    signed = dict(request, ts=now or time.time(), nonce=secrets.token_hex(16))
+    signed["mac"] = hmac.new(key, canonical(signed), hashlib.sha256).hexdigest()
+    return signed
+
+
+def client_context(ca_file):
+    ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH, cafile=ca_file)
+    ctx.minimum_version = ssl.TLSVersion.TLSv1_2
+    # instances are reached by private address, the server certificate names the public endpoint
+    ctx.check_hostname = False
+    return ctx
+
+
+class RequestLost(Exception):
+    """The request was sent but its response never came, the agent may have run it"""
+
+
+class Connection:
+    """A TLS connection to the agent of one instance, used by one request at a time"""
+
+    def __init__(self, address, ctx, port=PORT):
+        self.address = address
+        self.context = ctx
+        self.port = port
+        self.sock = None
+        self.reader = None
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    def open(self):
+        raw = socket.create_connection(
+            (self.address, self.port), timeout=CONNECT_TIMEOUT
+        )
+        try:
+            self.sock = self.context.wrap_socket(raw)
+        except (OSError, ssl.SSLError):
+            raw.close()
+            raise
+        self.reader = self.sock.makefile("rb")
+
+    def close(self):
+        if self.sock:
+            self.reader.close()
+            self.sock.close()
+        self.sock = None
+        self.reader = None
+
+    def closed_by_agent(self):
+        # the agent never writes unprompted, anything to read on an idle connection is its close
+        readable, _, _ = select.select([self.sock], [], [], 0)
+        return bool(readable)
+
+    def call(self, key, request, timeout=REQUEST_TIMEOUT):
+        """
+        Sends one request and returns the agent's response. Requests are never sent twice,
+        a request which got lost once sending began raises RequestLost, the agent may have
+        carried it out.
+        """
+        with self.lock:
+            if self.sock and self.closed_by_agent():
+                self.close()
+            if not self.sock:
+                self.open()
+            self.next_id += 1
+            message = sign_request(key, dict(request, id=self.next_id))
+            try:
+                self.sock.settimeout(timeout)
+                self.sock.sendall(json.dumps(message).encode("utf-8") + b"\n")
+                line = self.reader.readline()
+                if not line:
+                    raise ConnectionError("Connection closed by the agent")
+                response = json.loads(line)
+                if response.get("id") != self.next_id:
+                    raise ConnectionError("Response to another request")
+                return response
+            except (OSError, ValueError) as e:
+                self.close()
+                raise RequestLost(str(e)) from e
+
+
+def connection(address):
+    global tls_context
+    with connections_lock:
+        if tls_context is None:
+            tls_context = client_context(os.path.join(PKI_MOUNT_PATH, "pki", "ca.crt"))
+        if address not in connections:
+            connections[address] = Connection(address, tls_context, PORT)
+        return connections[address]
+
+
+def ssm_time(epoch):
+    """The time format of SSM command invocations, read by timing.py"""
+    millis = int(epoch * 1000) % 1000
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(epoch)) + f".{millis:03d}Z"
+
+
+def command_output(response):
+    """A response in the shape of an SSM command invocation"""
+    output = {
+        "Status": response["status"],
+        "StandardOutputContent": response.get("stdout", ""),
+        "StandardErrorContent": response.get("stderr", ""),
+    }
+    if "started" in response and "ended" in response:
+        output["ExecutionStartDateTime"] = ssm_time(response["started"])
+        output["ExecutionEndDateTime"] = ssm_time(response["ended"])
+    return output
+
+
+def call_instance(key, address, request, timeout):
+    try:
+        return command_output(connection(address).call(key, request, timeout))
+    except RequestLost as e:
+        log.warning(f"PKI agent at {address} lost the request: {e}")
+        return {"Status": "Lost", "StandardErrorContent": str(e)}
+    except (OSError, ValueError) as e:
+        log.warning(f"PKI agent at {address} unreachable: {e}")
+        return {"Status": "Unreachable", "StandardErrorContent": str(e)}
+
+
+def handler(event, context):
+    """
+    Runs an operation on the PKI agent of each target, see pki-agent. The event has the
+    Op, ClientName and CSR of the request, and Targets mapping instance ids to private
+    addresses. Returns the SSM-like output of each instance, Unreachable when the agent
+    could not be asked and Lost when it was asked but did not answer.
+    """
+    with open(os.path.join(PKI_MOUNT_PATH, "pki-agent.key"), "rb") as f:
+        key = f.read().strip()
+
+    request = {"op": event["Op"]}
+    if "ClientName" in event:
+        request["name"] = event["ClientName"]
+    if "CSR" in event:
+        request["csr"] = event["CSR"]
+    timeout = event.get("TimeoutSeconds", REQUEST_TIMEOUT)
+
+    targets = event["Targets"]
+    with ThreadPoolExecutor(max_workers=max(1, min(len(targets), 32))) as pool:
+        results = pool.map(
+            lambda address: call_instance(key, address, request, timeout),
+            targets.values(),
+        )
+        return dict(zip(targets.keys(), results))
@@ -0,0 +1,377 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+import boto3
+import os
+import json
+import shutil
+import datetime
+import logging as log
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography import x509
+from cryptography.x509.oid import NameOID, ExtendedKeyUsageOID
+from cryptography.hazmat.primitives import hashes
+from awsutil import get_client
+from Waiter import wait_until
+
+awslambda = get_client("lambda")
+
+# Mirrors the easyrsa settings written to ${OVPN_DATA}/vars by init-instance
+CURVE = ec.SECP521R1
+DIGEST = hashes.SHA512
+CA_COMMON_NAME = "MyCA"
+CERT_DAYS = 825  # EASYRSA_CERT_EXPIRE
+CRL_DAYS = 180  # EASYRSA_CRL_DAYS
+MAX_CA_SHARDS = 16
+
+# Layout created by 'easyrsa init-pki' and 'easyrsa build-ca'
+PKI_DIRS = [
+    "private",
+    "reqs",
+    "issued",
+    "certs_by_serial",
+    "revoked/certs_by_serial",
+    "revoked/private_by_serial",
+    "revoked/reqs_by_serial",
+    "renewed/certs_by_serial",
+    "renewed/private_by_serial",
+    "renewed/reqs_by_serial",
+]
+
+
+def handler(event, context):
+    request_type = event["RequestType"]
+    if request_type == "Create":
+        return on_create(event, context)
+    if request_type == "Update":
+        return on_update(event, context)
+    if request_type == "Delete":
+        return on_delete(event)
+    raise Exception("Invalid request type: %s" % request_type)
+
+
+def on_delete(event):
+    # the PKI lives and dies with the EFS share, see EFSRetentionPolicy
+    props = event["ResourceProperties"]
+    return {"PhysicalResourceId": f"{props['FileSystemId']}-pki"}
+
+
+def on_update(event, context):
+    # bootstrapping is a no-op once the PKI is initialized
+    return on_create(event, context)
+
+
+def on_create(event, context):
+    props = event["ResourceProperties"]
+
+    # if GA IP's were passed, they're the primary/secondary, same as init-instance
+    payload = {
+        "PrimaryIp": props.get("GaIp1") or props["NlbIp1"],
+        "SecondaryIp": props.get("GaIp2") or props["NlbIp2"],
+        "CaDays": int(props["CaDays"]),
+        "CaShards": int(props.get("CaShards", 0)),
+    }
+
+    # the writer function is attached to the VPC and has the EFS share mounted,
+    # its network interfaces and mount may still be settling right after creation
+    res = wait_until(
+        event,
+        context,
+        lambda: awslambda.invoke(
+            FunctionName=props["FunctionArn"], Payload=json.dumps(payload)
+        ),
+        retryable_codes=[
+            "ResourceConflictException",
+            "ResourceNotReadyException",
+            "EFSMountConnectivityException",
+            "EFSMountTimeoutException",
+        ],
+    )
+    result = json.loads(res["Payload"].read())
+    if "FunctionError" in res:
+        raise Exception(f"PKI bootstrap failed: {result.get('errorMessage')}")
+
+    log.info(f"PKI bootstrap result: {result}")
+    return {"PhysicalResourceId": f"{props['FileSystemId']}-pki"}
+
+
+def writer_handler(event, context):
+    root = os.environ["PKI_MOUNT_PATH"]
+    initialized = bootstrap_pki(
+        root,
+        event["PrimaryIp"],
+        event["SecondaryIp"],
+        event["CaDays"],
+    )
+    # shards can be added to an existing PKI on update
+    shards = ensure_shards(root, event.get("CaShards", 0))
+    return {"Initialized": initialized, "Shards": shards}
+
+
+def bootstrap_pki(root, primary_ip, secondary_ip, ca_days):
+    """
+    Builds an easyrsa compatible PKI (CA, tls-auth key, server certificate and
+    initial CRL) into root. Returns False when the PKI was already initialized.
+    """
+    if os.path.exists(os.path.join(root, ".initialized")):
+        log.info("PKI already initialized, skipping")
+        return False
+
+    pki = os.path.join(root, "pki")
+    make_pki_dirs(pki)
+
+    now = datetime.datetime.utcnow()
+
+    # Certificate authority
+    ca_key = ec.generate_private_key(CURVE(), default_backend())
+    ca_name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, CA_COMMON_NAME)])
+    ca_serial = x509.random_serial_number()
+    ca_ski = x509.SubjectKeyIdentifier.from_public_key(ca_key.public_key())
+    ca_cert = (
+        x509.CertificateBuilder()
+        .subject_name(ca_name)
+        .issuer_name(ca_name)
+        .public_key(ca_key.public_key())
+        .serial_number(ca_serial)
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=ca_days))
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), False)
+        .add_extension(ca_ski, False)
+        .add_extension(authority_key_identifier(ca_ski, ca_name, ca_serial), False)
+        .add_extension(key_usage(crl_sign=True, key_cert_sign=True), False)
+        .sign(ca_key, DIGEST(), default_backend())
+    )
+    log.info("Generated certificate authority")
+
+    # Server certificate, the SAN matches 'easyrsa --subject-alt-name=DNS:<secondary>'
+    server_key = ec.generate_private_key(CURVE(), default_backend())
+    server_name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, primary_ip)])
+    server_req = (
+        x509.CertificateSigningRequestBuilder()
+        .subject_name(server_name)
+        .sign(server_key, DIGEST(), default_backend())
+    )
+    server_serial = x509.random_serial_number()
+    server_not_after = now + datetime.timedelta(days=CERT_DAYS)
+    server_cert = (
+        x509.CertificateBuilder()
+        .subject_name(server_name)
+        .issuer_name(ca_name)
+        .public_key(server_key.public_key())
+        .serial_number(server_serial)
+        .not_valid_before(now)
+        .not_valid_after(server_not_after)
+        .add_extension(x509.BasicConstraints(ca=False, path_length=None), False)
+        .add_extension(
+            x509.SubjectKeyIdentifier.from_public_key(server_key.public_key()), False
+        )
+        .add_extension(authority_key_identifier(ca_ski, ca_name, ca_serial), False)
+        .add_extension(x509.ExtendedKeyUsage([ExtendedKeyUsageOID.SERVER_AUTH]), False)
+        .add_extension(key_usage(digital_signature=True, key_encipherment=True), False)
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName(secondary_ip)]), False)
+        .sign(ca_key, DIGEST(), default_backend())
+    )
+    log.info("Generated server certificate")
+
+    # Initial (empty) certificate revocation list
+    crl_pem = empty_crl_pem(ca_name, ca_key, now)
+    log.info("Generated certificate revocation list")
+
+    server_serial_hex = serial_hex(server_serial)
+    server_cert_pem = server_cert.public_bytes(serialization.Encoding.PEM)
+
+    write(pki, "ca.crt", ca_cert.public_bytes(serialization.Encoding.PEM))
+    write(pki, "private/ca.key", private_key_pem(ca_key), 0o600)
+    write(pki, "ta.key", tls_auth_key(), 0o600)
+    write(
+        pki,
+        f"reqs/{primary_ip}.req",
+        server_req.public_bytes(serialization.Encoding.PEM),
+    )
+    write(pki, f"private/{primary_ip}.key", private_key_pem(server_key), 0o600)
+    write(pki, f"issued/{primary_ip}.crt", server_cert_pem)
+    write(pki, f"certs_by_serial/{server_serial_hex}.pem", server_cert_pem)
+    write(pki, "crl.pem", crl_pem)
+    write(root, "crl.pem", crl_pem)
+    write(root, "ca-bundle.crt", ca_cert.public_bytes(serialization.Encoding.PEM))
+
+    # openssl ca database
+    index = f"V\t{server_not_after.strftime('%y%m%d%H%M%SZ')}\t\t{server_serial_hex}\tunknown\t/CN={primary_ip}\n"
+    write(pki, "index.txt", index.encode("utf-8"))
+    write(pki, "index.txt.attr", b"unique_subject = no\n")
+    write(pki, "serial", f"{serial_hex(server_serial + 1)}\n".encode("utf-8"))
+
+    # written last, instances wait for this marker before starting OpenVPN
+    write(root, ".initialized", b"")
+    log.info("PKI initialized")
+    return True
+
+
+def ensure_shards(root, count):
+    """
+    Creates intermediate CA shards 0..count-1 which are missing, each signed by the root CA
+    and with its own easyrsa PKI, index and serial under root/shards/<n>/pki. Rewrites the
+    CA bundle and combined CRL used by the servers. Shards are never removed, certificates
+    they issued must stay valid. Returns the number of shards.
+    """
+    count = min(int(count), MAX_CA_SHARDS)
+    pki = os.path.join(root, "pki")
+    with open(os.path.join(pki, "private", "ca.key"), "rb") as f:
+        ca_key = serialization.load_pem_private_key(f.read(), None, default_backend())
+    with open(os.path.join(pki, "ca.crt"), "rb") as f:
+        ca_cert = x509.load_pem_x509_certificate(f.read(), default_backend())
+
+    shards_dir = os.path.join(root, "shards")
+    for n in range(count):
+        shard = os.path.join(shards_dir, str(n))
+        if os.path.exists(shard):
+            continue
+        # built aside and renamed, so a shard is either complete or absent
+        tmp = os.path.join(shards_dir, f".{n}.tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        build_intermediate(os.path.join(tmp, "pki"), ca_cert, ca_key, n)
+        os.rename(tmp, shard)
+        log.info(f"Generated intermediate CA shard {n}")
+
+    shard_pkis = [os.path.join(shards_dir, str(n), "pki") for n in list_shards(root)]
+    ca_bundle = b"".join(read(p, "ca.crt") for p in [pki] + shard_pkis)
+    write(root, "ca-bundle.crt", ca_bundle)
+    crl = b"".join(read(p, "crl.pem") for p in [pki] + shard_pkis)
+    write(root, "crl.pem", crl)
+    return len(shard_pkis)
+
+
+def list_shards(root):
+    shards_dir = os.path.join(root, "shards")
+    if not os.path.isdir(shards_dir):
+        return []
+    return sorted(int(n) for n in os.listdir(shards_dir) if n.isdigit())
+
+
+def build_intermediate(pki, ca_cert, ca_key, n):
+    make_pki_dirs(pki)
+    now = datetime.datetime.utcnow()
+    key = ec.generate_private_key(CURVE(), default_backend())
+    name = x509.Name(
+        [x509.NameAttribute(NameOID.COMMON_NAME, f"{CA_COMMON_NAME} Shard {n}")]
+    )
+    ski = x509.SubjectKeyIdentifier.from_public_key(key.public_key())
+    ca_ski = ca_cert.extensions.get_extension_for_class(x509.SubjectKeyIdentifier)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(ca_cert.subject)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        # an intermediate must not outlive its issuer
+        .not_valid_after(ca_cert.not_valid_after)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=0), True)
+        .add_extension(ski, False)
+        .add_extension(
+            authority_key_identifier(
+                ca_ski.value, ca_cert.issuer, ca_cert.serial_number
+            ),
+            False,
+        )
+        .add_extension(key_usage(crl_sign=True, key_cert_sign=True), False)
+        .sign(ca_key, DIGEST(), default_backend())
+    )
+
+    write(pki, "ca.crt", cert.public_bytes(serialization.Encoding.PEM))
+    write(pki, "private/ca.key", private_key_pem(key), 0o600)
+    write(pki, "crl.pem", empty_crl_pem(name, key, now))
+    write(pki, "index.txt", b"")
+    write(pki, "index.txt.attr", b"unique_subject = no\n")
+    write(pki, "serial", b"01\n")
+
+
+def make_pki_dirs(pki):
+    for d in PKI_DIRS:
+        os.makedirs(os.path.join(pki, d), exist_ok=True)
+
+
+def empty_crl_pem(issuer_name, key, now):
+    crl = (
+        x509.CertificateRevocationListBuilder()
+        .issuer_name(issuer_name)
+        .last_update(now)
+        .next_update(now + datetime.timedelta(days=CRL_DAYS))
+        .sign(key, DIGEST(), default_backend())
+    )
+    return crl.public_bytes(serialization.Encoding.PEM)
+
+
+def authority_key_identifier(ca_ski, ca_name, ca_serial):
+    # keyid:always,issuer:always
+    return x509.AuthorityKeyIdentifier(
+        key_identifier=ca_ski.digest,
+        authority_cert_issuer=[x509.DirectoryName(ca_name)],
+        authority_cert_serial_number=ca_serial,
+    )
+
+
+def key_usage(
+    digital_signature=False, key_encipherment=False, key_cert_sign=False, crl_sign=False
+):
+    return x509.KeyUsage(
+        digital_signature=digital_signature,
+        content_commitment=False,
+        key_encipherment=key_encipherment,
+        data_encipherment=False,
+        key_agreement=False,
+        key_cert_sign=key_cert_sign,
+        crl_sign=crl_sign,
+        encipher_only=False,
+        decipher_only=False,
+    )
+
+
+def private_key_pem(key):
+    return key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+
+
+def serial_hex(serial):
+    # openssl writes serials as upper case hex with an even number of digits
+    h = f"{serial:X}"
+    return h if len(h) % 2 == 0 else f"0{h}"
+
+
+def tls_auth_key():
+    # same format as 'openvpn --genkey --secret'
+    key = os.urandom(256).hex()
+    lines = [key[i : i + 32] for i in range(0, len(key), 32)]
+    return (
+        "#\n# 2048 bit OpenVPN static key\n#\n"
+        + "-----BEGIN OpenVPN Static key V1-----\n"
+        + "\n".join(lines)
+        + "\n-----END OpenVPN Static key V1-----\n"
+    ).encode("utf-8")
+
+
+def read(base, name):
+    with open(os.path.join(base, name), "rb") as f:
+        return f.read()
+
+
+def write(base, name, data, mode=0o644):
+    path = os.path.join(base, name)
+    with open(path, "wb") as f:
+        f.write(data)
+    os.chmod(path, mode)
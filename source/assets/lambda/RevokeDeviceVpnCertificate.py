@@ -18,35 +18,49 @@ import json
 import re
 import logging as log
 from awsutil import get_client
+from timing import Timer
+import pkiagent
 
 REGION = os.environ["REGION"]
 AUTO_SCALING_GROUP_NAME = os.environ["AUTO_SCALING_GROUP_NAME"]
+METRICS_NAMESPACE = f"{os.environ['STACK_NAME']}/VPN"
+DISCONNECT_TIMEOUT_SECONDS = 60
 ec2as = get_client("autoscaling")
 ssm = get_client("ssm")
 
 
-def get_instance_id():
+def get_instance_ids():
     asg = ec2as.describe_auto_scaling_groups(
         AutoScalingGroupNames=[AUTO_SCALING_GROUP_NAME]
     )
     healthy = [
-        i
+        i["InstanceId"]
         for i in asg["AutoScalingGroups"][0]["Instances"]
         if i["HealthStatus"] == "Healthy"
     ]
     if len(healthy) == 0:
         raise Exception("No healthy instances.")
-    return healthy[0]["InstanceId"]
+    return healthy
 
 
-def get_command_result(command_id, instance_id, thing_name):
+def acknowledgement(output):
+    """Per-instance result of disconnecting the client, see revoke-device-cert"""
+    stdout = output.get("StandardOutputContent", "")
+    match = re.search(r"^DISCONNECTED=(\d+)$", stdout, re.MULTILINE)
+    if output["Status"] != "Success" or not match:
+        return {"Status": "Failed", "Disconnected": None}
+    return {"Status": "Success", "Disconnected": int(match.group(1))}
+
+
+def get_command_result(command_id, instance_id, thing_name, timer):
     retries = 0
     while retries < 300:
         retries += 1
         try:
-            output = ssm.get_command_invocation(
-                CommandId=command_id, InstanceId=instance_id
-            )
+            with timer.span("ssm_poll"):
+                output = ssm.get_command_invocation(
+                    CommandId=command_id, InstanceId=instance_id
+                )
             status = output["Status"]
             if status == "InProgress":
                 retries = 0
@@ -65,7 +79,7 @@ def get_command_result(command_id, instance_id, thing_name):
                 stdout = output["StandardOutputContent"]
                 stdout = stdout.replace("\r", "")
                 log.info(f"Output of command execution: {stdout}")
-                return f"Successfully revoked device configuration for {thing_name}, and updated certificate revocation list"
+                return output
         except ssm.exceptions.InvocationDoesNotExist as e:
             if retries == 300:
                 log.error(f"SSM command execution failed after 5 minutes")
@@ -78,20 +92,114 @@ def get_command_result(command_id, instance_id, thing_name):
                 time.sleep(1.0)
 
 
-def exec_revokecert_cmd(instance_id, thing_name):
-    res = ssm.send_command(
-        InstanceIds=[instance_id],
-        DocumentName="AWS-RunShellScript",
-        Parameters={"commands": [f"sudo /usr/share/revoke-device-cert '{thing_name}'"]},
-    )
+def exec_revokecert_cmd(instance_id, thing_name, timer):
+    dispatched_at = time.time()
+    with timer.span("ssm_dispatch"):
+        res = ssm.send_command(
+            InstanceIds=[instance_id],
+            DocumentName="AWS-RunShellScript",
+            Parameters={
+                "commands": [f"sudo /usr/share/revoke-device-cert '{thing_name}'"]
+            },
+        )
     command_id = res["Command"]["CommandId"]
     log.info(f"SSM Command ID: {command_id}")
-    return get_command_result(command_id, instance_id, thing_name)
+    output = get_command_result(command_id, instance_id, thing_name, timer)
+    timer.add_command_phases(output, dispatched_at)
+    return output
+
+
+def exec_revokecert_agent(instance_id, thing_name, timer):
+    """The output of revoking through the instance's PKI agent, None when it did not answer"""
+    dispatched_at = time.time()
+    outputs = pkiagent.run("revoke", [instance_id], timer, name=thing_name)
+    if instance_id not in outputs:
+        return None
+    output = outputs[instance_id]
+    # a lost request may have revoked the certificate, it is not revoked again through SSM
+    if output["Status"] != "Success":
+        log.error(f"Command execution {output['Status'].lower()}")
+        raise Exception(
+            "Command execution failed, review RevokeDeviceVpnCertificate log file for more details"
+        )
+    timer.add_command_phases(output, dispatched_at, "agent_queue")
+    return output
+
+
+def exec_disconnect_agent(instance_ids, thing_name, timer):
+    """Acknowledgements of the instances whose PKI agent disconnected the client"""
+    outputs = pkiagent.run(
+        "disconnect",
+        instance_ids,
+        timer,
+        name=thing_name,
+        timeout=DISCONNECT_TIMEOUT_SECONDS,
+    )
+    return {i: acknowledgement(output) for i, output in outputs.items()}
+
+
+def exec_disconnect_cmd(instance_ids, thing_name):
+    """
+    Disconnects the client from every instance in parallel, SSM runs the command on all
+    targets at once, after the certificate is revoked. Returns the acknowledgement of each instance, instances
+    which did not answer within DISCONNECT_TIMEOUT_SECONDS are reported as timed out.
+    """
+    # SendCommand targets at most 50 instances per call
+    pending = []
+    for start in range(0, len(instance_ids), 50):
+        targets = instance_ids[start : start + 50]
+        res = ssm.send_command(
+            InstanceIds=targets,
+            DocumentName="AWS-RunShellScript",
+            Parameters={
+                "commands": [
+                    f"sudo /usr/share/revoke-device-cert --disconnect '{thing_name}'"
+                ],
+                "executionTimeout": [str(DISCONNECT_TIMEOUT_SECONDS)],
+            },
+        )
+        command_id = res["Command"]["CommandId"]
+        log.info(f"SSM Command ID: {command_id}")
+        pending += [(command_id, instance_id) for instance_id in targets]
+
+    acks = {}
+    deadline = time.time() + DISCONNECT_TIMEOUT_SECONDS
+    while True:
+        for command_id, instance_id in list(pending):
+            try:
+                output = ssm.get_command_invocation(
+                    CommandId=command_id, InstanceId=instance_id
+                )
+            except ssm.exceptions.InvocationDoesNotExist:
+                continue
+            if output["Status"] in ["Pending", "InProgress", "Delayed"]:
+                continue
+            acks[instance_id] = acknowledgement(output)
+            pending.remove((command_id, instance_id))
+
+        if not pending:
+            return acks
+        if time.time() >= deadline:
+            for _, instance_id in pending:
+                log.error(f"Instance {instance_id} did not acknowledge the disconnect")
+                acks[instance_id] = {"Status": "TimedOut", "Disconnected": None}
+            return acks
+        time.sleep(1.0)
 
 
 def handler(event, context):
     log.info(f"Event: {event}")
+    timer = Timer(METRICS_NAMESPACE, "RevokeDeviceVpnCertificate")
+    try:
+        res = revoke_device(event, timer)
+    except Exception:
+        timer.flush("Failed")
+        raise
+    timer.flush()
+    return res
+
 
+def revoke_device(event, timer):
     if not "ClientName" in event:
         # don't disclose much information here in case this Lambda
         # gets hooked up to an API in some manner.
@@ -106,8 +214,29 @@ def handler(event, context):
     assert len(thing_name) >= 1 and len(thing_name) <= 128
 
     # find an instance
-    instance_id = get_instance_id()
+    with timer.span("describe_asg"):
+        instance_ids = get_instance_ids()
+    instance_id = instance_ids[0]
     log.info(f"Executing certificate revocation command on instance {instance_id}")
 
-    # and execute the command to revoke a device cert and configuration
-    return exec_revokecert_cmd(instance_id, thing_name)
+    # and execute the command to revoke a device cert and configuration, which also
+    # disconnects the device from that instance, through the instance's PKI agent when
+    # it answers and SSM otherwise
+    output = exec_revokecert_agent(instance_id, thing_name, timer)
+    if output is None:
+        output = exec_revokecert_cmd(instance_id, thing_name, timer)
+    acks = {instance_id: acknowledgement(output)}
+
+    # the device may be connected to any other instance, disconnect it everywhere
+    if len(instance_ids) > 1:
+        with timer.span("fleet_disconnect"):
+            acks.update(exec_disconnect_agent(instance_ids[1:], thing_name, timer))
+            missing = [i for i in instance_ids[1:] if i not in acks]
+            if missing:
+                acks.update(exec_disconnect_cmd(missing, thing_name))
+    log.info(f"Disconnect acknowledgements: {acks}")
+
+    return {
+        "Message": f"Successfully revoked device configuration for {thing_name}, and updated certificate revocation list",
+        "Instances": acks,
+    }
@@ -0,0 +1,103 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+import random
+import time
+import logging as log
+from botocore.exceptions import ClientError
+
+# time kept in reserve to hand over to a continuation, or respond to CloudFormation
+SAFETY_MARGIN_MS = 30 * 1000
+
+# always worth retrying, regardless of the operation
+THROTTLING_ERRORS = [
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestLimitExceeded",
+    "TooManyRequestsException",
+    "RequestThrottled",
+    "RequestThrottledException",
+    "ServiceUnavailable",
+    "InternalError",
+]
+
+
+class RetryableError(Exception):
+    """Raised by an attempt to signal that it should be retried."""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the Lambda is about to time out, carries the state to resume from."""
+
+    def __init__(self, state):
+        super().__init__(f"Lambda deadline reached, continue from {state}")
+        self.state = state
+
+
+def error_code(e):
+    if isinstance(e, ClientError):
+        return e.response.get("Error", {}).get("Code", "")
+    return ""
+
+
+def is_retryable(e, retryable_codes=()):
+    if isinstance(e, RetryableError):
+        return True
+    if isinstance(e, ClientError):
+        status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        code = error_code(e)
+        return code in retryable_codes or code in THROTTLING_ERRORS or status >= 500
+    return False
+
+
+def backoff(attempt, base_delay, max_delay):
+    # exponential backoff with full jitter
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def remaining_ms(context):
+    if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+        # not running in Lambda, i.e. unit tests
+        return float("inf")
+    return context.get_remaining_time_in_millis()
+
+
+def wait_until(
+    event,
+    context,
+    attempt_fn,
+    retryable_codes=(),
+    base_delay=1.0,
+    max_delay=30.0,
+):
+    """
+    Calls attempt_fn until it returns, backing off between retryable failures. Any
+    other exception is fatal and raised immediately. When the next attempt would
+    not finish before the Lambda deadline, DeadlineExceeded is raised so the caller
+    can continue in a new invocation, resuming from the saved attempt number.
+    """
+    attempt = event.get("Continuation", {}).get("Attempt", 0)
+    while True:
+        try:
+            return attempt_fn()
+        except Exception as e:
+            if not is_retryable(e, retryable_codes):
+                raise
+            log.info(f"Attempt {attempt} failed, retrying: {e}")
+
+        delay = backoff(attempt, base_delay, max_delay)
+        attempt += 1
+        if remaining_ms(context) - delay * 1000 < SAFETY_MARGIN_MS:
+            raise DeadlineExceeded({"Attempt": attempt})
+        time.sleep(delay)
@@ -0,0 +1,94 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+import os
+import json
+import boto3
+import logging as log
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError, ReadTimeoutError
+from awsutil import get_client
+
+AGENT_FUNCTION = os.environ.get("PKI_AGENT_FUNCTION", "")
+ec2 = get_client("ec2")
+# a sign request must never run twice, an invocation which failed midway falls back to SSM
+# instead of being retried. The client function times out after 5 minutes, its error must
+# reach us before our read times out.
+awslambda = boto3.client(
+    "lambda",
+    region_name=os.environ["REGION"],
+    config=Config(read_timeout=330, retries={"max_attempts": 0}),
+)
+
+# private addresses do not change for the life of an instance
+addresses = {}
+
+
+def private_addresses(instance_ids):
+    missing = [i for i in instance_ids if i not in addresses]
+    if missing:
+        res = ec2.describe_instances(InstanceIds=missing)
+        for reservation in res["Reservations"]:
+            for instance in reservation["Instances"]:
+                if "PrivateIpAddress" in instance:
+                    addresses[instance["InstanceId"]] = instance["PrivateIpAddress"]
+    return {i: addresses[i] for i in instance_ids if i in addresses}
+
+
+def run(op, instance_ids, timer, name=None, csr=None, timeout=None):
+    """
+    Runs an operation through the PKI agent of each instance, see pki-agent, invoking the
+    agent client function attached to the VPC. Returns the SSM-like output of each instance
+    whose agent was sent the operation, Lost when its answer never came, instances missing
+    from the result need the SSM path.
+    """
+    if not AGENT_FUNCTION:
+        return {}
+    payload = {"Op": op}
+    if name is not None:
+        payload["ClientName"] = name
+    if csr is not None:
+        payload["CSR"] = csr
+    if timeout is not None:
+        payload["TimeoutSeconds"] = timeout
+    try:
+        with timer.span("agent_lookup"):
+            payload["Targets"] = private_addresses(instance_ids)
+        with timer.span("agent_invoke"):
+            res = awslambda.invoke(
+                FunctionName=AGENT_FUNCTION, Payload=json.dumps(payload)
+            )
+            outputs = json.loads(res["Payload"].read())
+    except ReadTimeoutError as e:
+        # the client function may have sent the requests, none is sent again
+        log.warning(f"PKI agent client did not answer: {e}")
+        lost = {"Status": "Lost", "StandardErrorContent": str(e)}
+        return {instance_id: lost for instance_id in payload["Targets"]}
+    except (BotoCoreError, ClientError, ValueError) as e:
+        log.warning(f"PKI agent unavailable, using SSM: {e}")
+        return {}
+    if "FunctionError" in res:
+        log.warning(f"PKI agent client failed, using SSM: {outputs}")
+        return {}
+
+    # denied and unreachable requests never ran, failed ones did and lost ones may have,
+    # neither is run again
+    answered = {}
+    for instance_id, output in outputs.items():
+        if output["Status"] in ["Success", "Failed", "Lost"]:
+            answered[instance_id] = output
+        else:
+            log.warning(
+                f"PKI agent of {instance_id} {output['Status']}: {output.get('StandardErrorContent')}"
+            )
+    return answered
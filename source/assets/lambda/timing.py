@@ -0,0 +1,108 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+import datetime
+import json
+import re
+import time
+import logging as log
+from contextlib import contextmanager
+
+
+class Timer:
+    """
+    Records the duration and count of each phase of one request. flush() prints one
+    CloudWatch Embedded Metric Format record per phase, which Lambda turns into
+    PhaseDuration and PhaseCount metrics by Function and Phase, and a summary line.
+    """
+
+    def __init__(self, namespace, function):
+        self.namespace = namespace
+        self.function = function
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    @contextmanager
+    def span(self, phase):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, (time.perf_counter() - started) * 1000)
+
+    def add(self, phase, duration_ms, count=1):
+        duration, total = self.phases.get(phase, (0.0, 0))
+        self.phases[phase] = (duration + duration_ms, total + count)
+
+    def add_command_phases(self, output, dispatched_at, queue_phase="ssm_queue"):
+        """
+        Phases of an SSM command: queueing until the instance started it, running it,
+        and the 'PHASE <name> <ms>' lines the script wrote to standard error. Commands
+        run by the PKI agent have the same output, queued as agent_queue.
+        """
+        started = parse_ssm_time(output.get("ExecutionStartDateTime"))
+        ended = parse_ssm_time(output.get("ExecutionEndDateTime"))
+        if started and ended:
+            self.add(queue_phase, max(0.0, (started - dispatched_at) * 1000))
+            self.add("instance", (ended - started) * 1000)
+        for name, ms in re.findall(
+            r"^PHASE (\w+) (\d+)$", output.get("StandardErrorContent", ""), re.M
+        ):
+            self.add(name, float(ms))
+
+    def records(self, status):
+        timestamp = int(time.time() * 1000)
+        phases = dict(self.phases)
+        phases["total"] = ((time.perf_counter() - self.started) * 1000, 1)
+        for phase, (duration, count) in phases.items():
+            yield {
+                "_aws": {
+                    "Timestamp": timestamp,
+                    "CloudWatchMetrics": [
+                        {
+                            "Namespace": self.namespace,
+                            "Dimensions": [["Function", "Phase"]],
+                            "Metrics": [
+                                {"Name": "PhaseDuration", "Unit": "Milliseconds"},
+                                {"Name": "PhaseCount", "Unit": "Count"},
+                            ],
+                        }
+                    ],
+                },
+                "Function": self.function,
+                "Phase": phase,
+                "Status": status,
+                "PhaseDuration": round(duration, 1),
+                "PhaseCount": count,
+            }
+
+    def flush(self, status="Success"):
+        summary = []
+        for record in self.records(status):
+            # EMF records must be written to the log as bare JSON lines
+            print(json.dumps(record), flush=True)
+            summary.append(
+                f"{record['Phase']}={record['PhaseDuration']:.0f}ms/{record['PhaseCount']}"
+            )
+        log.info(f"Timing {self.function} {status}: {' '.join(summary)}")
+
+
+def parse_ssm_time(value):
+    """Epoch seconds from an SSM time such as 2021-04-01T10:11:12.345Z, or None"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%fZ")
+    except ValueError:
+        return None
+    return parsed.replace(tzinfo=datetime.timezone.utc).timestamp()
@@ -29,16 +29,34 @@ const CFN_NAG_SUPPRESSIONS: {
   ],
   "/CreateDeviceCertLambdaRole/DefaultPolicy": [
     // W12: IAM policy should not allow * resource
-    { id: "W12", reason: "* only on ssm:GetCommandInvocation, autoscaling:DescribeAutoScalingGroups (resources/conditions not supported)" }
+    {
+      id: "W12",
+      reason: "* only on ssm:GetCommandInvocation, autoscaling:DescribeAutoScalingGroups, ec2:DescribeInstances (resources/conditions not supported)"
+    }
   ],
   "RevokeDeviceCertLambdaRole/DefaultPolicy": [
     // W12: IAM policy should not allow * resource
-    { id: "W12", reason: "* only on ssm:GetCommandInvocation, autoscaling:DescribeAutoScalingGroups (resources/conditions not supported)" }
+    {
+      id: "W12",
+      reason: "* only on ssm:GetCommandInvocation, autoscaling:DescribeAutoScalingGroups, ec2:DescribeInstances (resources/conditions not supported)"
+    }
+  ],
+  "/VPN/Asg/InstanceRole/DefaultPolicy/Resource": [
+    // W12: IAM policy should not allow * resource
+    {
+      id: "W12",
+      reason:
+        "* only on cloudwatch:PutMetricData (resources not supported, restricted to our namespace by condition), ec2:DescribeInstanceTypes and autoscaling:DescribeAutoScalingInstances"
+    }
   ],
   "/AnonymousData/AnonymousCollectionLambdaRole/DefaultPolicy/Resource": [
     // W12: IAM policy should not allow * resource
     { id: "W12", reason: "* only on cloudwatch:GetMetricStatistics (resources/conditions not supported)" }
   ],
+  "/VPN/SessionExportBucket/Resource": [
+    // W35: S3 Bucket should have access logging configured
+    { id: "W35", reason: "Only written by the VPN instances, CloudTrail data events can be activated for visibility" }
+  ],
   "/NLBService/LoadBalancer": [
     // W52: Elastic Load Balancer V2 should have access logging activated
     { id: "W52", reason: "NLB in use, VPC FlowLogs can be activated for visibility" }
@@ -70,6 +88,9 @@ const CFN_NAG_SUPPRESSIONS: {
   // we use a tigher policy then what cfn nag checks for, this the false positives
   "/VPN/CreateDeviceVpnCertificateLambda/": [{ id: "W58", reason: "False positive - Logging permissions in role policy" }],
   "/VPN/RevokeDeviceVpnCertificateLambda/": [{ id: "W58", reason: "False positive - Logging permissions in role policy" }],
+  "/VPN/PkiBootstrapLambda/": [{ id: "W58", reason: "False positive - Logging permissions in role policy" }],
+  "/VPN/PkiAgentLambda/": [{ id: "W58", reason: "False positive - Logging permissions in role policy" }],
+  "/VPN/DrainInstanceLambda/": [{ id: "W58", reason: "False positive - Logging permissions in role policy" }],
   "/AnonymousData/AnonymousDataCollector/Resource": [{ id: "W58", reason: "False positive - Logging permissions in role policy" }],
   "/CustomResourcesProvider/Lambda/Resource": [{ id: "W58", reason: "False positive - Logging permissions in role policy" }],
 
@@ -22,6 +22,8 @@ import { Condition } from "./Utils"
 
 export class CustomResourcesProvider extends cdk.Construct {
   private readonly serviceToken: string
+  private readonly role: iam.Role
+  private readonly continuationPolicy: iam.Policy
   private counter = 0
 
   constructor(scope: cdk.Construct, id: string) {
@@ -47,7 +49,9 @@ export class CustomResourcesProvider extends cdk.Construct {
           // used to update the HealthCheckGracePeriod attribute after first launch
           "autoscaling:UpdateAutoScalingGroup",
           // used to cleanup the EFS filesystem if retain on delete is No
-          "elasticfilesystem:DeleteFileSystem"
+          "elasticfilesystem:DeleteFileSystem",
+          // used to find the IoT data endpoint devices can be routed to
+          "iot:DescribeEndpoint"
         ],
         resources: ["*"]
       })
@@ -113,6 +117,10 @@ export class CustomResourcesProvider extends cdk.Construct {
     })
 
     this.serviceToken = handler.functionArn
+    this.role = role
+    // the provider invokes itself to continue long running waits, the grant has a policy of its
+    // own as the function can't depend on a policy referencing its ARN
+    this.continuationPolicy = this.invokePolicy("ContinuationPolicy", handler)
 
     Logs.setcfnprovider(this)
     Logs.initLambdaLogGroup(this, handler, role)
@@ -127,9 +135,32 @@ export class CustomResourcesProvider extends cdk.Construct {
     for (const p in properties) {
       res.addPropertyOverride(p, properties[p])
     }
+    res.addDependsOn(this.continuationPolicy.node.defaultChild as cdk.CfnResource)
     return res
   }
 
+  /**
+   * Allows the provider to invoke func while it handles res, e.g. a writer attached to the VPC.
+   * The grant is not added to the provider's role policy, the provider would then depend on func.
+   */
+  grantInvoke(func: lambda.IFunction, res: cdk.CfnCustomResource): void {
+    const policy = this.invokePolicy(`InvokePolicy${this.counter++}`, func)
+    res.addDependsOn(policy.node.defaultChild as cdk.CfnResource)
+  }
+
+  private invokePolicy(id: string, func: lambda.IFunction): iam.Policy {
+    return new iam.Policy(this, id, {
+      roles: [this.role],
+      statements: [
+        new iam.PolicyStatement({
+          effect: iam.Effect.ALLOW,
+          actions: ["lambda:InvokeFunction"],
+          resources: [func.functionArn]
+        })
+      ]
+    })
+  }
+
   createConditionalReaper(scope: cdk.Construct, eip: ec2.CfnEIP, condition: Condition): cdk.CfnCustomResource {
     if (!condition.cfnCondition.expression) {
       throw new Error("missing condition expression")
@@ -13,21 +13,32 @@
 
 import * as path from "path"
 import { Construct, CfnParameter, RemovalPolicy, Fn, CfnResource, Duration, CfnOutput, Tags } from "@aws-cdk/core"
-import { SecurityGroup } from "@aws-cdk/aws-ec2"
+import { SecurityGroup, Port } from "@aws-cdk/aws-ec2"
 import { Role, PolicyStatement, Effect, ServicePrincipal } from "@aws-cdk/aws-iam"
 import { Code } from "@aws-cdk/aws-lambda"
 import * as lambda from "@aws-cdk/aws-lambda"
 import { Asset } from "@aws-cdk/aws-s3-assets"
-import { FileSystem, LifecyclePolicy, PerformanceMode, ThroughputMode } from "@aws-cdk/aws-efs"
+import { Bucket, BlockPublicAccess, BucketEncryption } from "@aws-cdk/aws-s3"
+import { AccessPoint, FileSystem, LifecyclePolicy, PerformanceMode, ThroughputMode } from "@aws-cdk/aws-efs"
+import { CfnAutoScalingGroup, CfnLifecycleHook } from "@aws-cdk/aws-autoscaling"
+import * as events from "@aws-cdk/aws-events"
+import * as targets from "@aws-cdk/aws-events-targets"
 import { PYTHON_LAMBDA_RUNTIME } from "./Constants"
 import { NLBEC2Service, NLBEC2ServiceProps } from "./NLBEC2Service"
 import { createCondition, createParameter } from "./Utils"
 import * as logs from "@aws-cdk/aws-logs"
 import { Logs } from "./Logs"
 
+/** The port of the PKI agent on the instances, see pki-agent */
+const PKI_AGENT_PORT = 1196
+
 export interface GreengrassVpnServiceConfig {
   readonly caValidDaysParam: CfnParameter
+  readonly caShardsParam: CfnParameter
   readonly retainEFSParam: CfnParameter
+  readonly drainTimeoutParam: CfnParameter
+  readonly drainThresholdParam: CfnParameter
+  readonly drainRateParam: CfnParameter
 }
 
 export interface GreengrassVpnServiceProps extends NLBEC2ServiceProps {
@@ -48,6 +59,12 @@ export class GreengrassVpnService extends NLBEC2Service {
 
   readonly revokeCertificateFunction: lambda.Function
 
+  /** The Lambda function which reaches the PKI agent of the instances from within the VPC */
+  readonly pkiAgentFunction: lambda.Function
+
+  /** Bucket receiving the per-session usage exported by the instances */
+  readonly sessionExportBucket: Bucket
+
   readonly vpnConfig: GreengrassVpnServiceConfig
 
   constructor(scope: Construct, id: string, props: GreengrassVpnServiceProps) {
@@ -60,11 +77,37 @@ export class GreengrassVpnService extends NLBEC2Service {
         default: "3653",
         description: "The OpenVPN Certificate Authority valid days. Default: 10 years"
       }),
+      caShardsParam: createParameter(this, "CaShards", {
+        type: "Number",
+        minValue: 0,
+        maxValue: 16,
+        default: 0,
+        description: "Intermediate CAs signing device certificates in parallel. Shards can be added but not removed. 0 signs with the root CA."
+      }),
       retainEFSParam: createParameter(this, "EFSRetentionPolicy", {
         type: "String",
         allowedValues: ["Retain", "Delete"],
         default: "Retain",
         description: "Controls if the EFS share with the OpenVPN configuration is retained or deleted when the stack is deleted."
+      }),
+      drainTimeoutParam: createParameter(this, "DrainTimeoutMinutes", {
+        type: "Number",
+        minValue: 0,
+        maxValue: 120,
+        default: 15,
+        description: "The longest an instance drains its VPN sessions before it is terminated. 0 terminates right away."
+      }),
+      drainThresholdParam: createParameter(this, "DrainClientThreshold", {
+        type: "Number",
+        minValue: 0,
+        default: 0,
+        description: "A draining instance is terminated once no more than this many clients are connected."
+      }),
+      drainRateParam: createParameter(this, "DrainClientsPerMinute", {
+        type: "Number",
+        minValue: 0,
+        default: 120,
+        description: "Clients asked to reconnect elsewhere per minute while draining. 0 waits for clients to disconnect."
       })
     }
 
@@ -74,13 +117,23 @@ export class GreengrassVpnService extends NLBEC2Service {
     // EFS Share
     this.fileSystem = this.setupFileSystem(props)
 
+    // OpenVPN PKI, initialized before any instance starts
+    const pkiAccessPoint = this.setupPkiBootstrap(props)
+
+    // Per-session usage export
+    this.sessionExportBucket = this.setupSessionExport()
+
     // Configure ASG
     this.configureInstanceStartup(props)
 
-    // Cert management Lambdas
+    // Cert management Lambdas, which reach the instances through the PKI agent or SSM
+    this.pkiAgentFunction = this.setupPkiAgent(props, pkiAccessPoint)
     this.createCertificateFunction = this.setupCertificateCreationLambda()
     this.revokeCertificateFunction = this.setupCertificateRevocationLambda()
 
+    // Drain VPN sessions before instances are terminated
+    this.setupConnectionDraining()
+
     this.setupOpenVPNLogMetricFilters()
   }
 
@@ -117,6 +170,111 @@ export class GreengrassVpnService extends NLBEC2Service {
     return efsShare
   }
 
+  /**
+   * Build the OpenVPN PKI (CA, tls-auth key, server certificate and CRL) onto the EFS share
+   * before the auto scaling group launches, so instances can all start in parallel.
+   */
+  private setupPkiBootstrap(props: GreengrassVpnServiceProps): AccessPoint {
+    const accessPoint = this.fileSystem.addAccessPoint("PkiAccessPoint", {
+      path: "/ovpn_data",
+      createAcl: { ownerUid: "0", ownerGid: "0", permissions: "755" },
+      posixUser: { uid: "0", gid: "0" }
+    })
+
+    // the writer is attached to the VPC to reach the EFS share, it is invoked by the
+    // custom resource provider which has the internet access needed to respond to CloudFormation
+    const func = new lambda.Function(this, "PkiBootstrapLambda", {
+      runtime: PYTHON_LAMBDA_RUNTIME,
+      code: Code.asset(path.join("assets", "lambda")),
+      handler: "PkiBootstrap.writer_handler",
+      timeout: Duration.minutes(5),
+      description: `${Fn.ref("AWS::StackName")} OpenVPN PKI bootstrap`,
+      vpc: props.vpc,
+      vpcSubnets: { subnets: props.vpc.privateSubnets },
+      filesystem: lambda.FileSystem.fromEfsAccessPoint(accessPoint, "/mnt/ovpn_data"),
+      environment: {
+        REGION: Fn.ref("AWS::Region"),
+        PKI_MOUNT_PATH: "/mnt/ovpn_data"
+      }
+    })
+
+    if (func.role) {
+      Logs.initLambdaLogGroup(this, func, func.role)
+    }
+
+    const pki = props.cfnprovider.create(this, "PkiBootstrap", "PkiBootstrap", {
+      FunctionArn: func.functionArn,
+      FileSystemId: this.fileSystem.fileSystemId,
+      GaIp1: props.acceleratorIp1,
+      GaIp2: props.acceleratorIp2,
+      NlbIp1: props.nlbService.ip1,
+      NlbIp2: props.nlbService.ip2,
+      CaDays: this.vpnConfig.caValidDaysParam.valueAsString,
+      CaShards: this.vpnConfig.caShardsParam.valueAsString
+    })
+    props.cfnprovider.grantInvoke(func, pki)
+    const aAsg = this.autoScalingGroup.node.defaultChild as CfnAutoScalingGroup
+    aAsg.addDependsOn(pki)
+
+    return accessPoint
+  }
+
+  /**
+   * Setup the Lambda which runs certificate operations through the PKI agent of each instance,
+   * see pki-agent. It is attached to the VPC to reach the instances and the agent key on the EFS
+   * share, and is invoked by the certificate Lambdas, which use SSM when it fails.
+   */
+  private setupPkiAgent(props: GreengrassVpnServiceProps, accessPoint: AccessPoint): lambda.Function {
+    const sg = new SecurityGroup(this, "PkiAgentSecurityGroup", {
+      vpc: props.vpc,
+      description: `${Fn.ref("AWS::StackName")} PKI agent client`,
+      allowAllOutbound: false
+    })
+    Tags.of(sg).add("Name", `${Fn.ref("AWS::StackName")}-pki-agent`)
+    // the only client of the agents
+    sg.connections.allowTo(this.securityGroup, Port.tcp(PKI_AGENT_PORT), "PKI agent")
+
+    const func = new lambda.Function(this, "PkiAgentLambda", {
+      runtime: PYTHON_LAMBDA_RUNTIME,
+      code: Code.asset(path.join("assets", "lambda")),
+      handler: "PkiAgentClient.handler",
+      timeout: Duration.minutes(5),
+      description: `${Fn.ref("AWS::StackName")} PKI agent client`,
+      vpc: props.vpc,
+      vpcSubnets: { subnets: props.vpc.privateSubnets },
+      securityGroups: [sg],
+      filesystem: lambda.FileSystem.fromEfsAccessPoint(accessPoint, "/mnt/ovpn_data"),
+      environment: {
+        REGION: Fn.ref("AWS::Region"),
+        PKI_MOUNT_PATH: "/mnt/ovpn_data",
+        PKI_AGENT_PORT: `${PKI_AGENT_PORT}`
+      }
+    })
+
+    if (func.role) {
+      Logs.initLambdaLogGroup(this, func, func.role)
+    }
+
+    return func
+  }
+
+  /** Setup the bucket the instances export per-session usage to, see session-export */
+  private setupSessionExport(): Bucket {
+    const bucket = new Bucket(this, "SessionExportBucket", {
+      encryption: BucketEncryption.S3_MANAGED,
+      blockPublicAccess: BlockPublicAccess.BLOCK_ALL,
+      enforceSSL: true,
+      removalPolicy: RemovalPolicy.RETAIN
+    })
+    bucket.grantPut(this.autoScalingGroup.role, "sessions/*")
+
+    new CfnOutput(this, "SessionExportBucketName", {
+      value: bucket.bucketName
+    }).overrideLogicalId("SessionExportBucketName")
+
+    return bucket
+  }
+
   /** Setup assets which get downloaded by our EC2 instances on boot */
   private setupAssets() {
     // CDK asset bucket for use by user-data
@@ -155,6 +313,110 @@ export class GreengrassVpnService extends NLBEC2Service {
     })
     keepalive.overrideLogicalId("OpenVpnKeepAliveSeconds")
 
+    // reconnect storm controls, see gen-device-cert and init-instance
+    const connectRetry = createParameter(this, "ClientConnectRetrySeconds", {
+      type: "Number",
+      minValue: 1,
+      maxValue: 300,
+      default: 5,
+      description: "Seconds new client profiles wait between connection attempts, randomized per device up to double"
+    })
+    const connectRetryMax = createParameter(this, "ClientConnectRetryMaxSeconds", {
+      type: "Number",
+      minValue: 1,
+      maxValue: 3600,
+      default: 300,
+      description: "Longest wait between connection attempts once new client profiles back off, randomized per device up to double"
+    })
+    const maxHandshakes = createParameter(this, "MaxHandshakesPerSecond", {
+      type: "Number",
+      minValue: 1,
+      default: 50,
+      description: "New VPN sessions each instance admits per second, excess attempts are dropped and retried by the clients"
+    })
+    const performanceProfile = createParameter(this, "PerformanceProfile", {
+      type: "String",
+      allowedValues: ["none", "balanced", "high-throughput", "high-connection-count"],
+      default: "none",
+      description: "OpenVPN and kernel network tuning, sized from the vCPU count and network bandwidth of the instance type"
+    })
+    const capacityClientPercent = createParameter(this, "CapacityClientPercent", {
+      type: "Number",
+      minValue: 1,
+      maxValue: 100,
+      default: 90,
+      description: "With CapacityHealthCheck, percent of the client slots in use at which an instance stops taking new sessions"
+    })
+    const capacityCpuPercent = createParameter(this, "CapacityCpuPercent", {
+      type: "Number",
+      minValue: 1,
+      maxValue: 100,
+      default: 85,
+      description: "With CapacityHealthCheck, CPU utilization at which an instance stops taking new sessions"
+    })
+
+    // per-device bandwidth limits, see device-shaper
+    const deviceDownloadMbps = createParameter(this, "DeviceDownloadMbps", {
+      type: "Number",
+      minValue: 0,
+      default: 0,
+      description: "Bandwidth limit from the VPN to each device in Mbit/s, unless the device has its own. 0 is unlimited"
+    })
+    const deviceUploadMbps = createParameter(this, "DeviceUploadMbps", {
+      type: "Number",
+      minValue: 0,
+      default: 0,
+      description: "Bandwidth limit from each device to the VPN in Mbit/s, unless the device has its own. 0 is unlimited"
+    })
+
+    // split tunnel routes, see route-policy
+    const deviceRoutes = createParameter(this, "DeviceRoutes", {
+      type: "String",
+      allowedPattern: "^[a-zA-Z0-9@:./_, -]+$",
+      default: "all",
+      description: "Destinations routed through the VPN for devices without their own policy: all, iot, networks or host names, comma separated"
+    })
+    const iotEndpoint = props.cfnprovider.create(this, "IoTEndpoint", "IoTEndpoint")
+
+    // the performance profile is sized from the instance type's network performance
+    this.autoScalingGroup.role.addToPolicy(
+      new PolicyStatement({
+        effect: Effect.ALLOW,
+        actions: ["ec2:DescribeInstanceTypes"],
+        // DescribeInstanceTypes does not support IAM resources
+        resources: ["*"]
+      })
+    )
+
+    // capacity-check reports the instance unhealthy when OpenVPN stops, the group uses EC2 health checks then
+    this.autoScalingGroup.role.addToPolicy(
+      new PolicyStatement({
+        effect: Effect.ALLOW,
+        actions: ["autoscaling:SetInstanceHealth"],
+        resources: [`arn:${Fn.ref("AWS::Partition")}:autoscaling:${Fn.ref("AWS::Region")}:${Fn.ref("AWS::AccountId")}:autoScalingGroup:*`],
+        conditions: {
+          StringEquals: {
+            "aws:ResourceTag/aws:cloudformation:stack-name": Fn.ref("AWS::StackName")
+          }
+        }
+      })
+    )
+
+    // boot phase timings published by init-instance, conntrack-stats, device-shaper and device-authz
+    this.autoScalingGroup.role.addToPolicy(
+      new PolicyStatement({
+        effect: Effect.ALLOW,
+        actions: ["cloudwatch:PutMetricData"],
+        resources: ["*"],
+        // PutMetricData does not support IAM resources, restrict it to our namespace instead
+        conditions: {
+          StringEquals: {
+            "cloudwatch:namespace": `${Fn.ref("AWS::StackName")}/VPN`
+          }
+        }
+      })
+    )
+
     this.autoScalingGroup.userData.addCommands(
       "set -xe",
       `export FILE_SYSTEM_ID="${this.fileSystem.fileSystemId}"`,
@@ -172,18 +434,62 @@ export class GreengrassVpnService extends NLBEC2Service {
       `export AUTO_SCALING_GROUP="${(this.autoScalingGroup.node.defaultChild as CfnResource).logicalId}"`,
       `export TUNNEL_PROTOCOL=${props.nlbService.config.protocol.valueAsString}`,
       `export TUNNEL_PORT="${Fn.ref("Port")}"`,
+      `export TCP_FALLBACK_PORT="${props.nlbService.config.tcpFallbackPortParam.valueAsString}"`,
       `export KEEPALIVE="${keepalive.valueAsString}"`,
-      `export CA_DAYS=${this.vpnConfig.caValidDaysParam.valueAsString}`,
+      `export CLIENT_CONNECT_RETRY="${connectRetry.valueAsString}"`,
+      `export CLIENT_CONNECT_RETRY_MAX="${connectRetryMax.valueAsString}"`,
+      `export MAX_HANDSHAKES_PER_SECOND="${maxHandshakes.valueAsString}"`,
+      // changing the shard count replaces the instances, OpenVPN only loads the CA bundle at start up
+      `export CA_SHARDS="${this.vpnConfig.caShardsParam.valueAsString}"`,
+      `export PERFORMANCE_PROFILE="${performanceProfile.valueAsString}"`,
+      `export CAPACITY_HEALTH_CHECK="${props.nlbService.config.capacityHealthCheckParam.valueAsString}"`,
+      `export CAPACITY_CLIENT_PERCENT="${capacityClientPercent.valueAsString}"`,
+      `export CAPACITY_CPU_PERCENT="${capacityCpuPercent.valueAsString}"`,
+      `export SHAPING_DOWN_MBPS="${deviceDownloadMbps.valueAsString}"`,
+      `export SHAPING_UP_MBPS="${deviceUploadMbps.valueAsString}"`,
+      `export DEVICE_ROUTES="${deviceRoutes.valueAsString}"`,
+      `export IOT_ENDPOINT="${iotEndpoint.ref}"`,
+      `export SESSION_EXPORT_DEST="s3://${this.sessionExportBucket.bucketName}/sessions"`,
+      `export PKI_AGENT_PORT="${PKI_AGENT_PORT}"`,
       "cd /tmp",
       "unzip assets.zip",
       "cp gen-device-cert /usr/share/gen-device-cert",
       "cp revoke-device-cert /usr/share/revoke-device-cert",
       "cp tcp-health-check /usr/share/tcp-health-check",
       "cp init-instance /usr/share/init-instance",
+      "cp pki-cache /usr/share/pki-cache",
+      "cp drain-instance /usr/share/drain-instance",
+      "cp session-export /usr/share/session-export",
+      "cp perf-profile /usr/share/perf-profile",
+      "cp capacity-check /usr/share/capacity-check",
+      "cp pki-store /usr/share/pki-store",
+      "cp conntrack-stats /usr/share/conntrack-stats",
+      "cp devicename.py /usr/share/devicename.py",
+      "cp ovpnserver.py /usr/share/ovpnserver.py",
+      "cp vpnmetrics.py /usr/share/vpnmetrics.py",
+      "cp device-shaper /usr/share/device-shaper",
+      "cp shaper-learn-address /usr/share/shaper-learn-address",
+      "cp route-policy /usr/share/route-policy",
+      "cp pki-agent /usr/share/pki-agent",
+      "cp device-authz /usr/share/device-authz",
+      "cp authz-client-connect /usr/share/authz-client-connect",
       "chmod +x /usr/share/gen-device-cert",
       "chmod +x /usr/share/revoke-device-cert",
       "chmod +x /usr/share/tcp-health-check",
       "chmod +x /usr/share/init-instance",
+      "chmod +x /usr/share/pki-cache",
+      "chmod +x /usr/share/drain-instance",
+      "chmod +x /usr/share/session-export",
+      "chmod +x /usr/share/perf-profile",
+      "chmod +x /usr/share/capacity-check",
+      "chmod +x /usr/share/pki-store",
+      "chmod +x /usr/share/conntrack-stats",
+      "chmod +x /usr/share/device-shaper",
+      "chmod +x /usr/share/shaper-learn-address",
+      "chmod +x /usr/share/route-policy",
+      "chmod +x /usr/share/pki-agent",
+      "chmod +x /usr/share/device-authz",
+      "chmod +x /usr/share/authz-client-connect",
       "/usr/share/init-instance"
     )
   }
@@ -197,7 +503,7 @@ export class GreengrassVpnService extends NLBEC2Service {
     role.addToPolicy(
       new PolicyStatement({
         effect: Effect.ALLOW,
-        actions: ["ssm:GetCommandInvocation", "autoscaling:DescribeAutoScalingGroups"],
+        actions: ["ssm:GetCommandInvocation", "autoscaling:DescribeAutoScalingGroups", "ec2:DescribeInstances"],
         resources: ["*"]
         // These actions don't support IAM resources or conditions so we * them
       })
@@ -233,9 +539,12 @@ export class GreengrassVpnService extends NLBEC2Service {
       role: role,
       environment: {
         REGION: Fn.ref("AWS::Region"),
-        AUTO_SCALING_GROUP_NAME: this.autoScalingGroup.autoScalingGroupName
+        AUTO_SCALING_GROUP_NAME: this.autoScalingGroup.autoScalingGroupName,
+        STACK_NAME: Fn.ref("AWS::StackName"),
+        PKI_AGENT_FUNCTION: this.pkiAgentFunction.functionName
       }
     })
+    this.pkiAgentFunction.grantInvoke(role)
 
     Logs.initLambdaLogGroup(this, func, role)
 
@@ -255,7 +564,7 @@ export class GreengrassVpnService extends NLBEC2Service {
     role.addToPolicy(
       new PolicyStatement({
         effect: Effect.ALLOW,
-        actions: ["ssm:GetCommandInvocation", "autoscaling:DescribeAutoScalingGroups"],
+        actions: ["ssm:GetCommandInvocation", "autoscaling:DescribeAutoScalingGroups", "ec2:DescribeInstances"],
         resources: ["*"]
         // These actions don't support IAM resources or conditions so we * them
       })
@@ -291,9 +600,12 @@ export class GreengrassVpnService extends NLBEC2Service {
       role: role,
       environment: {
         REGION: Fn.ref("AWS::Region"),
-        AUTO_SCALING_GROUP_NAME: this.autoScalingGroup.autoScalingGroupName
+        AUTO_SCALING_GROUP_NAME: this.autoScalingGroup.autoScalingGroupName,
+        STACK_NAME: Fn.ref("AWS::StackName"),
+        PKI_AGENT_FUNCTION: this.pkiAgentFunction.functionName
       }
     })
+    this.pkiAgentFunction.grantInvoke(role)
 
     Logs.initLambdaLogGroup(this, func, role)
 
@@ -305,6 +617,94 @@ export class GreengrassVpnService extends NLBEC2Service {
     return func
   }
 
+  /**
+   * Hold terminating instances in Terminating:Wait while drain-instance moves their clients
+   * over to the remaining instances, so scale-in does not drop every tunnel at once.
+   */
+  private setupConnectionDraining(): void {
+    const hook = new CfnLifecycleHook(this, "DrainLifecycleHook", {
+      autoScalingGroupName: this.autoScalingGroup.autoScalingGroupName,
+      lifecycleHookName: "DrainVpnSessions",
+      lifecycleTransition: "autoscaling:EC2_INSTANCE_TERMINATING",
+      // drain-instance sends a heartbeat every minute, if it stops the instance is terminated anyway
+      heartbeatTimeout: 300,
+      defaultResult: "CONTINUE"
+    })
+
+    // drain-instance completes the lifecycle action itself, and init-instance the launch one of the warm pool
+    this.autoScalingGroup.role.addToPolicy(
+      new PolicyStatement({
+        effect: Effect.ALLOW,
+        actions: ["autoscaling:CompleteLifecycleAction", "autoscaling:RecordLifecycleActionHeartbeat"],
+        resources: [`arn:${Fn.ref("AWS::Partition")}:autoscaling:${Fn.ref("AWS::Region")}:${Fn.ref("AWS::AccountId")}:autoScalingGroup:*`],
+        conditions: {
+          StringEquals: {
+            "aws:ResourceTag/aws:cloudformation:stack-name": Fn.ref("AWS::StackName")
+          }
+        }
+      })
+    )
+
+    const role = new Role(this, "DrainInstanceLambdaRole", {
+      assumedBy: new ServicePrincipal("lambda.amazonaws.com")
+    })
+
+    role.addToPolicy(
+      new PolicyStatement({
+        effect: Effect.ALLOW,
+        actions: ["ssm:SendCommand", "autoscaling:CompleteLifecycleAction"],
+        resources: [
+          `arn:${Fn.ref("AWS::Partition")}:ec2:*:*:instance/*`,
+          `arn:${Fn.ref("AWS::Partition")}:autoscaling:${Fn.ref("AWS::Region")}:${Fn.ref("AWS::AccountId")}:autoScalingGroup:*`
+        ],
+        conditions: {
+          StringEquals: {
+            "aws:ResourceTag/aws:cloudformation:stack-name": Fn.ref("AWS::StackName")
+          }
+        }
+      })
+    )
+
+    role.addToPolicy(
+      new PolicyStatement({
+        effect: Effect.ALLOW,
+        actions: ["ssm:SendCommand"],
+        resources: [`arn:${Fn.ref("AWS::Partition")}:ssm:${Fn.ref("AWS::Region")}::document/AWS-RunShellScript`]
+      })
+    )
+
+    const func = new lambda.Function(this, "DrainInstanceLambda", {
+      runtime: PYTHON_LAMBDA_RUNTIME,
+      code: Code.asset(path.join("assets", "lambda")),
+      handler: "DrainInstance.handler",
+      timeout: Duration.minutes(1),
+      description: `${Fn.ref("AWS::StackName")} VPN connection draining`,
+      role: role,
+      environment: {
+        REGION: Fn.ref("AWS::Region"),
+        DRAIN_TIMEOUT_MINUTES: this.vpnConfig.drainTimeoutParam.valueAsString,
+        DRAIN_THRESHOLD: this.vpnConfig.drainThresholdParam.valueAsString,
+        DRAIN_RATE: this.vpnConfig.drainRateParam.valueAsString
+      }
+    })
+
+    Logs.initLambdaLogGroup(this, func, role)
+
+    const rule = new events.Rule(this, "DrainInstanceRule", {
+      eventPattern: {
+        source: ["aws.autoscaling"],
+        detailType: ["EC2 Instance-terminate Lifecycle Action"],
+        detail: {
+          AutoScalingGroupName: [this.autoScalingGroup.autoScalingGroupName],
+          LifecycleHookName: [hook.lifecycleHookName as string]
+        }
+      },
+      targets: [new targets.LambdaFunction(func)]
+    })
+    // the hook must not fire before anything is listening for it
+    hook.addDependsOn(rule.node.defaultChild as CfnResource)
+  }
+
   private setupOpenVPNLogMetricFilters(): void {
     const mf1 = new logs.CfnMetricFilter(this, "ClientConnectMetricFilter", {
       filterPattern: "Peer Connection Initiated",
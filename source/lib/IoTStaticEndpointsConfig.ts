@@ -72,19 +72,35 @@ export class IoTStaticEndpointsConfig extends Construct {
           BYOIPGA1: { default: "Global Accelerator IP 1 - Bring Your Own IP Address" },
           BYOIPGA2: { default: "Global Accelerator IP 2 - Bring Your Own IP Address" },
           VPNProtocol: { default: "VPN Tunnel Protocol" },
+          TcpFallbackPort: { default: "TCP Fallback Port" },
           AutoScalingMinCapacity: { default: "Auto Scaling Group - Min Capacity" },
           AutoScalingMaxCapacity: { default: "Auto Scaling Group - Max Capacity" },
+          WarmPoolSize: { default: "Auto Scaling Group - Warm Pool Size" },
           InstanceAMI: { default: "Instance AMI" },
           InstanceType: { default: "Instance Type" },
           PeerCidr: { default: "Peer CIDR" },
           ActivateFlowLogsToCloudWatch: { default: "Activate VPC FlowLogs Delivery to CloudWatch" },
           LogRetentionDays: { default: "Log Retention Days" },
           CAValidDays: { default: "CA Valid Days" },
+          CaShards: { default: "CA Shards" },
           NotificationsEmail: { default: "Notifications Email" },
           EFSRetentionPolicy: { default: "EFS Retention Policy" },
           CWLRetentionPolicy: { default: "CloudWatch Logs Retention Policy" },
           VpcCIDR: { default: "VPC CIDR" },
-          OpenVpnKeepAliveSeconds: { default: "OpenVPN Keepalive Seconds" }
+          OpenVpnKeepAliveSeconds: { default: "OpenVPN Keepalive Seconds" },
+          ClientConnectRetrySeconds: { default: "Client Connect Retry Seconds" },
+          ClientConnectRetryMaxSeconds: { default: "Client Connect Retry Max Seconds" },
+          MaxHandshakesPerSecond: { default: "Max Handshakes Per Second" },
+          PerformanceProfile: { default: "Performance Profile" },
+          CapacityHealthCheck: { default: "Capacity Health Check" },
+          CapacityClientPercent: { default: "Capacity Health Check - Client Percent" },
+          CapacityCpuPercent: { default: "Capacity Health Check - CPU Percent" },
+          DeviceDownloadMbps: { default: "Device Bandwidth - Download Mbps" },
+          DeviceUploadMbps: { default: "Device Bandwidth - Upload Mbps" },
+          DeviceRoutes: { default: "Device Routes" },
+          DrainTimeoutMinutes: { default: "Connection Draining - Timeout Minutes" },
+          DrainClientThreshold: { default: "Connection Draining - Client Threshold" },
+          DrainClientsPerMinute: { default: "Connection Draining - Clients Moved Per Minute" }
         },
         ParameterGroups: [
           {
@@ -93,7 +109,7 @@ export class IoTStaticEndpointsConfig extends Construct {
           },
           {
             Label: { default: "Load balancer configuration" },
-            Parameters: ["Port", "EIPNLB1", "EIPNLB2"]
+            Parameters: ["Port", "TcpFallbackPort", "EIPNLB1", "EIPNLB2"]
           },
           {
             Label: { default: "AWS Global Accelerator configuration" },
@@ -105,10 +121,25 @@ export class IoTStaticEndpointsConfig extends Construct {
               "VPNProtocol",
               "AutoScalingMinCapacity",
               "AutoScalingMaxCapacity",
+              "WarmPoolSize",
               "InstanceAMI",
               "InstanceType",
               "CAValidDays",
-              "OpenVpnKeepAliveSeconds"
+              "CaShards",
+              "OpenVpnKeepAliveSeconds",
+              "ClientConnectRetrySeconds",
+              "ClientConnectRetryMaxSeconds",
+              "MaxHandshakesPerSecond",
+              "PerformanceProfile",
+              "CapacityHealthCheck",
+              "CapacityClientPercent",
+              "CapacityCpuPercent",
+              "DeviceDownloadMbps",
+              "DeviceUploadMbps",
+              "DeviceRoutes",
+              "DrainTimeoutMinutes",
+              "DrainClientThreshold",
+              "DrainClientsPerMinute"
             ]
           },
           {
@@ -20,6 +20,7 @@ import { IoTStaticEndpointsConfig } from "./IoTStaticEndpointsConfig"
 import { StackProps, Construct, Stack, Duration, Fn } from "@aws-cdk/core"
 import { createBasicGraphWidget, createCondition } from "./Utils"
 import * as cloudwatch from "@aws-cdk/aws-cloudwatch"
+import { SnsAction } from "@aws-cdk/aws-cloudwatch-actions"
 import { Topic, Subscription, SubscriptionProtocol } from "@aws-cdk/aws-sns"
 import { AnonymousData } from "./AnonymousData"
 import { CustomResourcesProvider } from "./CustomResourcesProvider"
@@ -88,7 +89,9 @@ export class IoTStaticEndpointsStack extends Stack {
       cfnprovider: this.cfnprovider,
       nlbArn: this.nlbService.nlb.ref,
       port: this.config.portParam.valueAsNumber,
-      protocol: this.nlbService.config.protocol.valueAsString
+      protocol: this.nlbService.config.protocol.valueAsString,
+      tcpFallbackPort: this.nlbService.config.tcpFallbackPortParam.valueAsNumber,
+      tcpFallbackCondition: this.nlbService.config.isDualProtocol
     })
 
     // VPN
@@ -129,6 +132,132 @@ export class IoTStaticEndpointsStack extends Stack {
 
     dashboard.addWidgets(this.createActiveFlowsWidget(), this.createNewFlowsWidget(), this.createHostsWidget())
     dashboard.addWidgets(this.createCpuWidget(), this.createClusterNetworkWidget(), this.createConnectDisconnectsWidget())
+    dashboard.addWidgets(this.createBootDurationWidget(), this.createTimeToInServiceWidget(), ...this.createConntrackWidgets())
+    dashboard.addWidgets(
+      this.createCertificatePhasesWidget("CreateDeviceVpnCertificate", [
+        "keygen",
+        "describe_asg",
+        "agent_invoke",
+        "agent_queue",
+        "ssm_dispatch",
+        "ssm_queue",
+        "lock_wait",
+        "easyrsa_sign",
+        "profile",
+        "render",
+        "total"
+      ]),
+      this.createCertificatePhasesWidget("RevokeDeviceVpnCertificate", [
+        "describe_asg",
+        "agent_invoke",
+        "agent_queue",
+        "ssm_dispatch",
+        "ssm_queue",
+        "lock_wait",
+        "easyrsa_revoke",
+        "combine_crl",
+        "disconnect",
+        "fleet_disconnect",
+        "total"
+      ]),
+      this.createClientConnectWidget()
+    )
+  }
+
+  /** Latency of the client-connect decisions of device-authz, and the devices it refused */
+  private createClientConnectWidget(): cloudwatch.IWidget {
+    const namespace = `${Fn.ref("AWS::StackName")}/VPN`
+    const latency = (statistic: string) =>
+      new cloudwatch.Metric({ namespace, metricName: "AuthzDecisionLatency", statistic, period: Duration.minutes(1), label: statistic })
+    return new cloudwatch.GraphWidget({
+      title: "Client Connect Authorization (ms)",
+      left: [latency("p50"), latency("p99"), latency("Maximum")],
+      right: [
+        new cloudwatch.Metric({ namespace, metricName: "AuthzRejected", statistic: "Sum", period: Duration.minutes(1), label: "Rejected" }),
+        new cloudwatch.Metric({ namespace, metricName: "AuthzOverBudget", statistic: "Sum", period: Duration.minutes(1), label: "Over budget" })
+      ],
+      leftYAxis: { min: 0 },
+      rightYAxis: { min: 0 }
+    })
+  }
+
+  /** p95 duration of each phase of a certificate Lambda, published as EMF records by timing.py */
+  private createCertificatePhasesWidget(functionName: string, phases: string[]): cloudwatch.IWidget {
+    return createBasicGraphWidget({
+      title: `${functionName} p95 (ms)`,
+      stacked: false,
+      namespace: phases.map(() => `${Fn.ref("AWS::StackName")}/VPN`),
+      metricName: phases.map(() => "PhaseDuration"),
+      dimensions: phases.map((phase) => ({ Function: functionName, Phase: phase })),
+      stat: phases.map(() => "p95")
+    })
+  }
+
+  /**
+   * Conntrack table usage and drops, published by conntrack-stats, with an alarm sent to the
+   * notifications topic once the fullest instance's table is 80% in use, or flows are dropped
+   */
+  private createConntrackWidgets(): cloudwatch.IWidget[] {
+    const namespace = `${Fn.ref("AWS::StackName")}/VPN`
+    const usage = new cloudwatch.Metric({ namespace, metricName: "ConntrackUsage", statistic: "Maximum", period: Duration.minutes(1) })
+    const drops = new cloudwatch.MathExpression({
+      expression: "drops + failed",
+      usingMetrics: {
+        drops: new cloudwatch.Metric({ namespace, metricName: "ConntrackDrops", statistic: "Sum", period: Duration.minutes(1) }),
+        failed: new cloudwatch.Metric({ namespace, metricName: "ConntrackInsertFailed", statistic: "Sum", period: Duration.minutes(1) })
+      },
+      label: "Dropped"
+    })
+
+    const alarms = [
+      new cloudwatch.Alarm(this, "ConntrackUsageAlarm", {
+        alarmDescription: "The conntrack table of a VPN instance is almost full, see conntrack-stats",
+        metric: usage,
+        threshold: 80,
+        comparisonOperator: cloudwatch.ComparisonOperator.GREATER_THAN_OR_EQUAL_TO_THRESHOLD,
+        evaluationPeriods: 5,
+        datapointsToAlarm: 3,
+        treatMissingData: cloudwatch.TreatMissingData.NOT_BREACHING
+      }),
+      new cloudwatch.Alarm(this, "ConntrackDropsAlarm", {
+        alarmDescription: "VPN instances drop flows as their conntrack table is full, see conntrack-stats",
+        metric: drops,
+        threshold: 1,
+        comparisonOperator: cloudwatch.ComparisonOperator.GREATER_THAN_OR_EQUAL_TO_THRESHOLD,
+        evaluationPeriods: 1,
+        treatMissingData: cloudwatch.TreatMissingData.NOT_BREACHING
+      })
+    ]
+    alarms.forEach((alarm) => alarm.addAlarmAction(new SnsAction(this.notificationsTopic)))
+
+    return [
+      new cloudwatch.AlarmWidget({ title: "Conntrack Usage, fullest instance (%)", alarm: alarms[0], leftYAxis: { min: 0, max: 100 } }),
+      new cloudwatch.AlarmWidget({ title: "Conntrack Drops", alarm: alarms[1], leftYAxis: { min: 0 } })
+    ]
+  }
+
+  /** Instance boot time widget, published by init-instance */
+  private createBootDurationWidget(): cloudwatch.IWidget {
+    return createBasicGraphWidget({
+      title: "Instance Boot Time (ms)",
+      stacked: false,
+      namespace: [`${Fn.ref("AWS::StackName")}/VPN`],
+      metricName: ["BootDuration"],
+      dimensions: [{ Phase: "Total" }],
+      stat: ["max"]
+    })
+  }
+
+  /** Time from the start of an instance to in service, cold boots and warm pool starts, published by init-instance */
+  private createTimeToInServiceWidget(): cloudwatch.IWidget {
+    return createBasicGraphWidget({
+      title: "Time to InService (ms)",
+      stacked: false,
+      namespace: [`${Fn.ref("AWS::StackName")}/VPN`, `${Fn.ref("AWS::StackName")}/VPN`],
+      metricName: ["TimeToInService", "TimeToInService"],
+      dimensions: [{ Start: "Cold" }, { Start: "Warm" }],
+      stat: ["max", "max"]
+    })
   }
 
   private createConnectDisconnectsWidget(): cloudwatch.IWidget {
@@ -17,8 +17,17 @@ import { ManagedPolicy, PolicyStatement, Effect } from "@aws-cdk/aws-iam"
 import { IMetric, Unit, Metric } from "@aws-cdk/aws-cloudwatch"
 import { NLBService } from "./NLBService"
 import { SolutionVpc } from "./SolutionVpc"
-import { createParameter } from "./Utils"
-import { AutoScalingGroup, CfnAutoScalingGroup, AdjustmentType, BlockDeviceVolume, Monitoring, ScalingEvents } from "@aws-cdk/aws-autoscaling"
+import { createCondition, createParameter } from "./Utils"
+import {
+  AutoScalingGroup,
+  CfnAutoScalingGroup,
+  CfnLifecycleHook,
+  CfnWarmPool,
+  AdjustmentType,
+  BlockDeviceVolume,
+  Monitoring,
+  ScalingEvents
+} from "@aws-cdk/aws-autoscaling"
 import { Logs } from "./Logs"
 import { Topic } from "@aws-cdk/aws-sns"
 import { CustomResourcesProvider } from "./CustomResourcesProvider"
@@ -41,6 +50,7 @@ export interface NLBEC2ServiceConfig {
   readonly instanceAmiParam: CfnParameter
   readonly asgMinCapacityParam: CfnParameter
   readonly asgMaxCapacityParam: CfnParameter
+  readonly warmPoolSizeParam: CfnParameter
 }
 
 export interface NLBEC2ServiceProps {
@@ -95,10 +105,8 @@ export class NLBEC2Service extends Construct {
       instanceAmiParam: createParameter(this, "InstanceAMI", {
         type: "AWS::SSM::Parameter::Value<AWS::EC2::Image::Id>",
         default: "/aws/service/ami-amazon-linux-latest/amzn2-ami-hvm-x86_64-gp2",
-        allowedValues: [
-          "/aws/service/ami-amazon-linux-latest/amzn2-ami-hvm-arm64-gp2",
-          "/aws/service/ami-amazon-linux-latest/amzn2-ami-hvm-x86_64-gp2"
-        ]
+        description:
+          "SSM parameter of an Amazon Linux 2 image, i.e. /aws/service/ami-amazon-linux-latest/amzn2-ami-hvm-arm64-gp2. Images baked from an initialized instance start faster."
       }),
       asgMinCapacityParam: createParameter(this, "AutoScalingMinCapacity", {
         type: "Number",
@@ -111,6 +119,12 @@ export class NLBEC2Service extends Construct {
         minValue: 1,
         default: 10,
         description: "Maximum cluster size."
+      }),
+      warmPoolSizeParam: createParameter(this, "WarmPoolSize", {
+        type: "Number",
+        minValue: 0,
+        default: 0,
+        description: "Stopped, initialized instances kept for fast scale-out, the pool fills up to the maximum cluster size. 0 disables it."
       })
     }
 
@@ -149,6 +163,31 @@ export class NLBEC2Service extends Construct {
       })
     })
 
+    // the TCP servers of dual protocol mode, health checks included
+    const tcpIngress = [
+      new CfnSecurityGroupIngress(this, "TcpHealthCheckIngress", {
+        groupId: sg.securityGroupId,
+        ipProtocol: "TCP",
+        cidrIp: props.vpc.vpcCidrBlock,
+        toPort: props.backendPort,
+        fromPort: props.backendPort,
+        description: "TCP Health Checks"
+      })
+    ]
+    props.peers.forEach((peer) => {
+      tcpIngress.push(
+        new CfnSecurityGroupIngress(this, "VPNTcpIngress", {
+          groupId: sg.securityGroupId,
+          ipProtocol: "TCP",
+          cidrIp: peer,
+          toPort: props.backendPort,
+          fromPort: props.backendPort,
+          description: "VPN TCP fallback"
+        })
+      )
+    })
+    tcpIngress.forEach((ingress) => props.nlbService.config.isDualProtocol.applyTo(ingress))
+
     return sg
   }
 
@@ -185,20 +224,23 @@ export class NLBEC2Service extends Construct {
 
     const aAsg = asg.node.defaultChild as CfnAutoScalingGroup
     // on create, wait for all instances to report healthy
-    // timeout after 30 minutes. We do this to all the public
-    // key infrastructure for OpenVPN to initialize. This can
-    // take an unknown amount of time and we want to ensure the
+    // timeout after 15 minutes. The PKI is initialized before
+    // the group is created, so this only covers package installs
+    // and OpenVPN start up on each instance. We want to ensure the
     // ELB does not consider the instance unhealthy during this
     // initial process. So on creation we raise the health check
-    // grace period to 30 minutes to align with this timeout.
-    aAsg.healthCheckGracePeriod = 30 * 60
+    // grace period to 15 minutes to align with this timeout.
+    aAsg.healthCheckGracePeriod = 15 * 60
+    // a full instance fails the load balancer health check on purpose, so auto scaling
+    // must not replace it. capacity-check reports an instance unhealthy itself instead
+    aAsg.healthCheckType = (Fn.conditionIf(props.nlbService.config.isCapacityHealthCheck.logicalId, "EC2", "ELB") as unknown) as string
     aAsg.cfnOptions.creationPolicy = {
       autoScalingCreationPolicy: {
         minSuccessfulInstancesPercent: 100
       },
       resourceSignal: {
         count: this.config.asgMinCapacityParam.valueAsNumber,
-        timeout: "PT25M" // PKI initialization can take a while (prime generation)
+        timeout: "PT15M"
       }
     }
     aAsg.cfnOptions.updatePolicy = {
@@ -224,6 +266,9 @@ export class NLBEC2Service extends Construct {
     // Register the target group with the ASG
     props.nlbService.addAsgTarget(asg)
 
+    // pre-initialized instances
+    this.setupWarmPool(asg)
+
     // auto scaling options
     if (props.cpuScalingOptions) {
       this.setupCpuScaling(asg, props.cpuScalingOptions)
@@ -238,6 +283,48 @@ export class NLBEC2Service extends Construct {
     return asg
   }
 
+  /**
+   * Keep stopped instances which already ran init-instance up to the start of OpenVPN, so a
+   * scale-out only starts them, refreshes the configuration and PKI and starts OpenVPN.
+   */
+  private setupWarmPool(asg: AutoScalingGroup): void {
+    const isWarmPool = createCondition(this, "IsWarmPool", {
+      expression: Fn.conditionNot(Fn.conditionEquals(this.config.warmPoolSizeParam.valueAsString, "0"))
+    })
+
+    // holds instances in Warmed:Pending:Wait and Pending:Wait until init-instance completes the action,
+    // instances are only stopped once initialized and only put in service once OpenVPN runs
+    const hook = new CfnLifecycleHook(this, "LaunchLifecycleHook", {
+      autoScalingGroupName: asg.autoScalingGroupName,
+      lifecycleHookName: "InitializeVpnInstance",
+      lifecycleTransition: "autoscaling:EC2_INSTANCE_LAUNCHING",
+      // the longest boot, the same as the creation policy
+      heartbeatTimeout: 15 * 60,
+      defaultResult: "ABANDON"
+    })
+    isWarmPool.applyTo(hook)
+
+    // hibernation needs a launch template, the group uses a launch configuration
+    const pool = new CfnWarmPool(this, "WarmPool", {
+      autoScalingGroupName: asg.autoScalingGroupName,
+      minSize: this.config.warmPoolSizeParam.valueAsNumber,
+      poolState: "Stopped"
+    })
+    isWarmPool.applyTo(pool)
+    // instances must not enter the pool before the hook holds them
+    pool.addDependsOn(hook)
+
+    // init-instance finds its group and lifecycle state
+    asg.role.addToPolicy(
+      new PolicyStatement({
+        effect: Effect.ALLOW,
+        actions: ["autoscaling:DescribeAutoScalingInstances"],
+        // DescribeAutoScalingInstances does not support IAM resources
+        resources: ["*"]
+      })
+    )
+  }
+
   /** Configure CPU based auto scaling */
   private setupCpuScaling(asg: AutoScalingGroup, opts: CpuScalingOptions): void {
     const avgCpuUtilizationMetric = this.getClusterAvgCpuUtilizationMetric(asg, opts.dashboardMeticPeriod)
@@ -32,6 +32,9 @@ export interface NLBGlobalAcceleratorProps {
   readonly nlbArn: string
   readonly cfnprovider: CustomResourcesProvider
   readonly protocol: string
+  /** Port and condition of the TCP fallback listener, see TcpFallbackPort */
+  readonly tcpFallbackPort: number
+  readonly tcpFallbackCondition: Condition
 }
 
 /**
@@ -43,8 +46,7 @@ export class NLBGlobalAccelerator extends Construct {
   readonly accelerator?: Accelerator
   readonly listener?: Listener
   readonly endpointGroup?: EndpointGroup
-  readonly acceleratorIp1?: CfnCustomResource
-  readonly acceleratorIp2?: CfnCustomResource
+  readonly acceleratorIps?: CfnCustomResource
   readonly config: NLBGlobalAcceleratorConfig
   readonly props: NLBGlobalAcceleratorProps
 
@@ -88,9 +90,27 @@ export class NLBGlobalAccelerator extends Construct {
       endpointGroup: eg
     })
 
-    // GA IP outputs
-    this.acceleratorIp1 = this.createAcceleratorIpGetter(this.accelerator.acceleratorArn, 0, props)
-    this.acceleratorIp2 = this.createAcceleratorIpGetter(this.accelerator.acceleratorArn, 1, props)
+    // the TCP fallback of dual protocol mode, both listeners share the accelerator's addresses
+    const tcpCondition = createCondition(this, "GlobalAcceleratorTcpFallback", {
+      expression: Fn.conditionAnd(this.config.useGlobalAcceleratorCondition.cfnCondition, props.tcpFallbackCondition.cfnCondition)
+    })
+    const tcpListener = new Listener(this, "GATcpListener", {
+      accelerator: this.accelerator,
+      portRanges: [{ fromPort: props.tcpFallbackPort, toPort: props.tcpFallbackPort }],
+      protocol: ConnectionProtocol.TCP
+    })
+    const tcpEg = new EndpointGroup(this, "GATcpGroup", {
+      listener: tcpListener
+    })
+    new EndpointConfiguration(this, "TcpEndpointEIP1", {
+      endpointId: props.nlbArn,
+      endpointGroup: tcpEg
+    })
+    tcpCondition.applyTo(tcpListener)
+    tcpCondition.applyTo(tcpEg)
+
+    // GA IP outputs, both addresses are resolved by a single lookup
+    this.acceleratorIps = this.createAcceleratorIpGetter(this.accelerator.acceleratorArn, props)
     const gaIp1Out = new CfnOutput(this, `${id}GaIp1`, { value: this.ip1 })
     gaIp1Out.overrideLogicalId(`${id}GaIp1`)
     const gaIp2Out = new CfnOutput(this, `${id}GaIp2`, { value: this.ip2 })
@@ -136,10 +156,9 @@ export class NLBGlobalAccelerator extends Construct {
     }
   }
 
-  private createAcceleratorIpGetter(acceleratorArn: string, index: number, props: NLBGlobalAcceleratorProps): CfnCustomResource {
-    return props.cfnprovider.create(this, `GA${index}IPLookup`, "IpLookup", {
-      AcceleratorArn: acceleratorArn,
-      IpIndex: index
+  private createAcceleratorIpGetter(acceleratorArn: string, props: NLBGlobalAcceleratorProps): CfnCustomResource {
+    return props.cfnprovider.create(this, "GAIPLookup", "IpLookup", {
+      AcceleratorArn: acceleratorArn
     })
   }
 
@@ -147,7 +166,7 @@ export class NLBGlobalAccelerator extends Construct {
   get ip1(): string {
     return (Fn.conditionIf(
       this.config.allocateGaIp1Condition.logicalId,
-      this.acceleratorIp1?.ref,
+      this.acceleratorIps?.getAtt("Ip0"),
       this.config.ipAddress1Param.valueAsString
     ) as unknown) as string
   }
@@ -156,7 +175,7 @@ export class NLBGlobalAccelerator extends Construct {
   get ip2(): string {
     return (Fn.conditionIf(
       this.config.allocateGaIp2Condition.logicalId,
-      this.acceleratorIp2?.ref,
+      this.acceleratorIps?.getAtt("Ip1"),
       this.config.ipAddress2Param.valueAsString
     ) as unknown) as string
   }
@@ -23,11 +23,16 @@ export interface NLBServiceConfig {
   readonly nlb1EipAllocationIdParam: CfnParameter
   readonly nlb2EipAllocationIdParam: CfnParameter
   readonly protocol: CfnParameter
+  readonly capacityHealthCheckParam: CfnParameter
+  readonly tcpFallbackPortParam: CfnParameter
 
   // CFN Conditions
   readonly allocateEipForNlb1Condition: Condition
   readonly allocateEipForNlb2Condition: Condition
   readonly isUdp: Condition
+  readonly isCapacityHealthCheck: Condition
+  readonly usesHealthPort: Condition
+  readonly isDualProtocol: Condition
 }
 
 export interface NLBServiceProps {
@@ -75,6 +80,12 @@ export class NLBService extends Construct {
   /** The NLB listener */
   readonly listener: CfnListener
 
+  /** The target group of the TCP servers in dual protocol mode */
+  readonly tcpTargetGroup: CfnTargetGroup
+
+  /** The TCP fallback listener in dual protocol mode */
+  readonly tcpListener: CfnListener
+
   /** The NLB target type */
   readonly targetType: string
 
@@ -94,6 +105,8 @@ export class NLBService extends Construct {
     this.nlbEips = nlbResult.nlbEips
     this.targetGroup = this.setupTargetGroup(props)
     this.listener = this.setupListener(props)
+    this.tcpTargetGroup = this.setupTcpTargetGroup(props)
+    this.tcpListener = this.setupTcpListener()
 
     // NLB EIP Outputs
     new CfnOutput(this, `${id}NlbEip1`, { value: this.ip1 }).overrideLogicalId(`${id}NlbEip1`)
@@ -122,18 +135,49 @@ export class NLBService extends Construct {
       default: "UDP"
     })
 
+    const capacityHealthCheck = createParameter(this, "CapacityHealthCheck", {
+      type: "String",
+      description: "Instances near their client or CPU limit fail the load balancer health check, so new sessions land on instances with headroom",
+      allowedValues: ["Yes", "No"],
+      default: "No"
+    })
+
+    const tcpFallbackPort = createParameter(this, "TcpFallbackPort", {
+      type: "Number",
+      description:
+        "[Optional] With UDP, also run a TCP server on each instance, reachable on this port, for devices on networks which only pass TCP. Must differ from Port, 0 disables it",
+      minValue: 0,
+      maxValue: 65535,
+      default: 0
+    })
+
+    const isUdp = createCondition(this, "IsUdp", {
+      expression: Fn.conditionEquals(protocol.valueAsString, "UDP")
+    })
+    const isCapacityHealthCheck = createCondition(this, "IsCapacityHealthCheck", {
+      expression: Fn.conditionEquals(capacityHealthCheck.valueAsString, "Yes")
+    })
+
     return {
       nlb1EipAllocationIdParam: nlb1Eip,
       nlb2EipAllocationIdParam: nlb2Eip,
       protocol: protocol,
+      capacityHealthCheckParam: capacityHealthCheck,
+      tcpFallbackPortParam: tcpFallbackPort,
       allocateEipForNlb1Condition: createCondition(this, "AllocateNlb1Eip", {
         expression: Fn.conditionEquals(nlb1Eip.valueAsString, "")
       }),
       allocateEipForNlb2Condition: createCondition(this, "AllocateNlb2Eip", {
         expression: Fn.conditionEquals(nlb2Eip.valueAsString, "")
       }),
-      isUdp: createCondition(this, "IsUdp", {
-        expression: Fn.conditionEquals(protocol.valueAsString, "UDP")
+      isUdp: isUdp,
+      isCapacityHealthCheck: isCapacityHealthCheck,
+      // health checks go to the responder on 1195 instead of OpenVPN itself
+      usesHealthPort: createCondition(this, "UsesHealthPort", {
+        expression: Fn.conditionOr(isUdp.cfnCondition, isCapacityHealthCheck.cfnCondition)
+      }),
+      isDualProtocol: createCondition(this, "IsDualProtocol", {
+        expression: Fn.conditionAnd(isUdp.cfnCondition, Fn.conditionNot(Fn.conditionEquals(tcpFallbackPort.valueAsString, "0")))
       })
     }
   }
@@ -174,6 +218,7 @@ export class NLBService extends Construct {
     // eslint-disable-next-line @typescript-eslint/no-explicit-any
     const aAsg = asg as any
     aAsg.targetGroupArns.push(this.targetGroup.ref)
+    aAsg.targetGroupArns.push(Fn.conditionIf(this.config.isDualProtocol.logicalId, this.tcpTargetGroup.ref, Fn.ref("AWS::NoValue")))
   }
 
   /** Setup the NLB */
@@ -238,12 +283,56 @@ export class NLBService extends Construct {
       healthCheckTimeoutSeconds: 10,
       healthCheckProtocol: "TCP",
       healthCheckPort: this.healthCheckPort,
-      targetGroupAttributes: [{ key: "deregistration_delay.timeout_seconds", value: "5" }]
+      targetGroupAttributes: [
+        { key: "deregistration_delay.timeout_seconds", value: "5" },
+        (Fn.conditionIf(
+          this.config.isUdp.logicalId,
+          Fn.ref("AWS::NoValue"),
+          this.tcpConnectionTerminationAttribute
+        ) as unknown) as CfnTargetGroup.TargetGroupAttributeProperty
+      ]
     })
   }
 
+  /** Setup the target group of the TCP servers in dual protocol mode */
+  private setupTcpTargetGroup(props: NLBServiceProps): CfnTargetGroup {
+    const tg = new CfnTargetGroup(this, "TcpTargetGroup", {
+      port: props.backendPort,
+      protocol: Protocol.TCP,
+      targetType: props.targetType as TargetType,
+      vpcId: props.vpcId,
+      healthCheckEnabled: true,
+      healthyThresholdCount: 2,
+      unhealthyThresholdCount: 2,
+      healthCheckIntervalSeconds: 10,
+      healthCheckTimeoutSeconds: 10,
+      healthCheckProtocol: "TCP",
+      healthCheckPort: this.tcpHealthCheckPort,
+      targetGroupAttributes: [
+        { key: "deregistration_delay.timeout_seconds", value: "5" },
+        this.tcpConnectionTerminationAttribute as CfnTargetGroup.TargetGroupAttributeProperty
+      ]
+    })
+    this.config.isDualProtocol.applyTo(tg)
+    return tg
+  }
+
+  /** A full instance keeps its established TCP sessions, see capacity-check */
+  private get tcpConnectionTerminationAttribute(): unknown {
+    return Fn.conditionIf(
+      this.config.isCapacityHealthCheck.logicalId,
+      { key: "target_health_state.unhealthy.connection_termination.enabled", value: "false" },
+      Fn.ref("AWS::NoValue")
+    )
+  }
+
   get healthCheckPort(): string {
-    return (Fn.conditionIf(this.config.isUdp.logicalId, 1195, 1194) as unknown) as string
+    return (Fn.conditionIf(this.config.usesHealthPort.logicalId, 1195, 1194) as unknown) as string
+  }
+
+  /** Health checks of the TCP servers in dual protocol mode, the TCP server itself or capacity-check */
+  get tcpHealthCheckPort(): string {
+    return (Fn.conditionIf(this.config.isCapacityHealthCheck.logicalId, 1195, 1194) as unknown) as string
   }
 
   /** Setup the listener */
@@ -255,4 +344,16 @@ export class NLBService extends Construct {
       defaultActions: [{ type: "forward", targetGroupArn: this.targetGroup.ref }]
     })
   }
+
+  /** Setup the TCP fallback listener of dual protocol mode */
+  private setupTcpListener(): CfnListener {
+    const listener = new CfnListener(this, "TcpListener", {
+      loadBalancerArn: this.nlb.ref,
+      port: this.config.tcpFallbackPortParam.valueAsNumber,
+      protocol: Protocol.TCP,
+      defaultActions: [{ type: "forward", targetGroupArn: this.tcpTargetGroup.ref }]
+    })
+    this.config.isDualProtocol.applyTo(listener)
+    return listener
+  }
 }
@@ -0,0 +1,105 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+from mock import patch
+import os
+import sys
+import unittest
+
+# the scripts import their shared modules from their own directory, as on the instances
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../assets/ec2/ovpn"))
+
+# the responder runs on the instances and has no .py extension
+loader = SourceFileLoader(
+    "capacity_check",
+    os.path.join(os.path.dirname(__file__), "../assets/ec2/ovpn/capacity-check"),
+)
+capacity_check = module_from_spec(spec_from_loader(loader.name, loader))
+loader.exec_module(capacity_check)
+
+STATUS = """TITLE,OpenVPN 2.4.11 x86_64-redhat-linux-gnu
+HEADER,CLIENT_LIST,Common Name,Real Address,Virtual Address,Virtual IPv6 Address,Bytes Received,Bytes Sent,Connected Since,Connected Since (time_t),Username,Client ID,Peer ID
+CLIENT_LIST,thing1,203.0.113.10:51234,198.18.0.6,,1000,2000,Mon Oct 19 04:00:00 2026,1792382400,UNDEF,7,0
+CLIENT_LIST,thing2,203.0.113.11:40000,198.18.0.10,,30,40,Mon Oct 19 04:30:00 2026,1792384200,UNDEF,9,1
+HEADER,ROUTING_TABLE,Virtual Address,Common Name,Real Address,Last Ref,Last Ref (time_t)
+END
+"""
+
+
+class TestSuite(unittest.TestCase):
+    def test_it_counts_connected_clients_against_the_client_slots(self):
+        self.assertEqual(capacity_check.count_clients(STATUS), 2)
+        self.assertEqual(capacity_check.client_slots("port 1194\n"), 1024)
+        self.assertEqual(capacity_check.client_slots("max-clients 8192\n"), 8192)
+        # the tunnel address pool runs out first
+        self.assertEqual(capacity_check.client_slots("max-clients 64000\n"), 16382)
+        # each server of dual protocol mode hands out addresses from half the network
+        dual = "server 198.18.128.0 255.255.128.0\nmax-clients 16000\n"
+        self.assertEqual(capacity_check.client_slots(dual), 8190)
+
+    def test_it_measures_cpu_between_samples(self):
+        self.assertEqual(capacity_check.cpu_percent((100, 400), (175, 500)), 75)
+        self.assertEqual(capacity_check.cpu_percent((100, 400), (100, 400)), 0)
+
+    def test_it_only_becomes_full_after_consecutive_samples(self):
+        capacity = capacity_check.Capacity(90, 85, 10, 3)
+        self.assertFalse(capacity.update(95, 10))
+        self.assertFalse(capacity.update(10, 10))
+        self.assertFalse(capacity.update(95, 10))
+        self.assertFalse(capacity.update(10, 90))
+        self.assertFalse(capacity.full)
+        self.assertTrue(capacity.update(90, 10))
+        self.assertTrue(capacity.full)
+
+    def test_it_keeps_full_until_below_the_hysteresis_band(self):
+        capacity = capacity_check.Capacity(90, 85, 10, 2)
+        capacity.update(95, 10)
+        capacity.update(95, 10)
+        self.assertTrue(capacity.full)
+
+        # below the threshold, but inside the band
+        for _ in range(5):
+            self.assertFalse(capacity.update(85, 10))
+        # clients have headroom, CPU does not
+        for _ in range(5):
+            self.assertFalse(capacity.update(50, 80))
+        self.assertTrue(capacity.full)
+
+        self.assertFalse(capacity.update(79, 74))
+        self.assertTrue(capacity.update(79, 74))
+        self.assertFalse(capacity.full)
+
+    def test_a_low_threshold_still_recovers(self):
+        capacity = capacity_check.Capacity(5, 85, 10, 1)
+        self.assertTrue(capacity.update(5, 10))
+        self.assertFalse(capacity.update(3, 10))
+        self.assertTrue(capacity.update(2, 10))
+        self.assertFalse(capacity.full)
+
+    def test_a_failed_health_report_is_logged_and_retried(self):
+        with patch.object(
+            capacity_check.urllib.request, "urlopen", side_effect=OSError("no IMDS")
+        ):
+            self.assertFalse(capacity_check.report_unhealthy())
+        with patch.object(capacity_check.urllib.request, "urlopen"), patch.object(
+            capacity_check.subprocess,
+            "run",
+            side_effect=capacity_check.subprocess.CalledProcessError(255, "aws"),
+        ), patch.dict(os.environ, {"REGION": "us-east-1"}):
+            self.assertFalse(capacity_check.report_unhealthy())
+
+
+if __name__ == "__main__":
+    unittest.main()
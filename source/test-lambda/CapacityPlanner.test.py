@@ -0,0 +1,134 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+from datetime import datetime, timedelta, timezone
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+from mock import MagicMock
+import os
+import unittest
+
+# the planner runs on operator machines, next to ovpn-capacity-plan
+loader = SourceFileLoader(
+    "CapacityPlanner",
+    os.path.join(os.path.dirname(__file__), "../tools/CapacityPlanner.py"),
+)
+CapacityPlanner = module_from_spec(spec_from_loader(loader.name, loader))
+loader.exec_module(CapacityPlanner)
+
+PARAMS = {
+    "InstanceType": "t3.small",
+    "AutoScalingMinCapacity": "2",
+    "AutoScalingMaxCapacity": "10",
+    "VPNProtocol": "UDP",
+    "TcpFallbackPort": "0",
+    "PerformanceProfile": "balanced",
+    "CapacityClientPercent": "90",
+}
+OPTS = {
+    "Days": 7,
+    "Headroom": 20,
+    "TargetCpu": 70,
+    "InstanceTypes": ["t3.small", "c5.xlarge"],
+}
+
+
+def week(busy_mbps=50):
+    """A week of samples, busy from 08:00 to 18:00 UTC"""
+    start = datetime(2026, 10, 5, tzinfo=timezone.utc)
+    samples = []
+    for i in range(7 * 24):
+        time = start + timedelta(hours=i)
+        busy = 8 <= time.hour < 18
+        samples.append(
+            {
+                "Time": time,
+                "Instances": 4,
+                "Cpu": 30 if busy else 10,
+                "Mbps": busy_mbps if busy else 10,
+                "Flows": 3000 if busy else 500,
+                "Connects": 100,
+            }
+        )
+    return samples
+
+
+class TestSuite(unittest.TestCase):
+    def test_it_reads_long_series_in_chunks(self):
+        cloudwatch = MagicMock()
+        cloudwatch.get_metric_statistics.return_value = {"Datapoints": []}
+        CapacityPlanner.get_metric_series(
+            cloudwatch, "AWS/EC2", "CPUUtilization", [], 90
+        )
+        # 2160 hourly points, at most 1440 per request
+        self.assertEqual(cloudwatch.get_metric_statistics.call_count, 2)
+
+    def test_it_sizes_each_hour_for_the_busiest_resource(self):
+        plan = CapacityPlanner.plan_instance_type(week(), 2, "t3.small", PARAMS, OPTS)
+        # 3000 clients in slots of 1024, at most 90% full, plus 20%
+        self.assertEqual(plan["Hours"][12]["Instances"], 4)
+        self.assertEqual(plan["Hours"][3]["Instances"], 2)
+        self.assertEqual(plan["PeakLimit"], "sessions")
+        self.assertEqual((plan["MinCapacity"], plan["MaxCapacity"]), (2, 5))
+        self.assertAlmostEqual(plan["Hours"][12]["Headroom"], 18.6, places=1)
+
+    def test_it_sizes_the_client_slots_as_the_instances_do(self):
+        self.assertEqual(CapacityPlanner.client_slots(2, PARAMS, 1), 1024 * 0.9)
+        params = dict(PARAMS, PerformanceProfile="high-connection-count")
+        self.assertEqual(CapacityPlanner.client_slots(2, params, 1), 8192 * 0.9)
+        # max-clients is 16000, in dual protocol mode each half of the pool runs out first
+        self.assertEqual(CapacityPlanner.client_slots(8, params, 1), 16000 * 0.9)
+        self.assertEqual(CapacityPlanner.client_slots(8, params, 2), 8190 * 2 * 0.9)
+
+    def test_it_recommends_the_cheapest_instance_type(self):
+        plans = CapacityPlanner.plan(week(), PARAMS, OPTS)
+        self.assertEqual(plans[0]["InstanceType"], "t3.small")
+        # beyond the baseline network bandwidth of t3
+        opts = dict(OPTS, InstanceTypes=["t3.small", "c5.large", "c5.xlarge"])
+        plans = CapacityPlanner.plan(week(busy_mbps=5000), PARAMS, opts)
+        self.assertEqual(
+            [p["InstanceType"] for p in plans], ["c5.large", "t3.small", "c5.xlarge"]
+        )
+        report = CapacityPlanner.report("MyStack", week(), PARAMS, plans, opts)
+        self.assertIn("Recommended: c5.large", report)
+
+        # more vCPUs than OpenVPN uses
+        opts = dict(OPTS, InstanceTypes=["c5.xlarge"])
+        plans = CapacityPlanner.plan(week(), PARAMS, opts)
+        report = CapacityPlanner.report("MyStack", week(), PARAMS, plans, opts)
+        self.assertIn("OpenVPN uses 2 of the 4 vCPUs", report)
+
+        with self.assertRaises(Exception):
+            CapacityPlanner.plan(week()[:12], PARAMS, OPTS)
+
+    def test_it_writes_the_schedule_and_parameters(self):
+        plan = CapacityPlanner.plan_instance_type(week(), 2, "t3.small", PARAMS, OPTS)
+        actions = CapacityPlanner.scheduled_actions(plan)
+        self.assertEqual(
+            [(a["Recurrence"], a["MinSize"]) for a in actions],
+            [("50 7 * * *", 4), ("0 18 * * *", 2)],
+        )
+
+        parameters = CapacityPlanner.parameter_file(PARAMS, plan)
+        self.assertIn(
+            {"ParameterKey": "AutoScalingMaxCapacity", "ParameterValue": "5"},
+            parameters,
+        )
+        self.assertIn(
+            {"ParameterKey": "VPNProtocol", "UsePreviousValue": True}, parameters
+        )
+        self.assertEqual(len(parameters), len(PARAMS))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+import os
+import sys
+import unittest
+
+# the scripts import their shared modules from their own directory, as on the instances
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../assets/ec2/ovpn"))
+
+# the collector runs on the instances and has no .py extension
+loader = SourceFileLoader(
+    "conntrack_stats",
+    os.path.join(os.path.dirname(__file__), "../assets/ec2/ovpn/conntrack-stats"),
+)
+conntrack_stats = module_from_spec(spec_from_loader(loader.name, loader))
+loader.exec_module(conntrack_stats)
+
+STAT = """entries  clashres found new invalid ignore delete chainlength insert insert_failed drop early_drop icmp_error  expect_new expect_create expect_delete search_restart
+000003e8  00000000 00000000 00000000 00000010 00000000 00000000 00000000 00000000 00000001 00000002 00000000 00000000  00000000 00000000 00000000 00000000
+000003e8  00000000 00000000 00000000 00000005 00000000 00000000 00000000 00000000 00000000 0000000a 00000001 00000000  00000000 00000000 00000000 00000000
+"""
+
+
+class TestSuite(unittest.TestCase):
+    def test_it_sizes_the_table_for_the_client_slots(self):
+        # 2 GiB, 1024 clients: the minimum
+        self.assertEqual(
+            conntrack_stats.table_size(2 * 1024 * 1024, 1024), (65536, 16384)
+        )
+        # 16 GiB, 8192 clients: 32 flows each, twice over
+        maximum, buckets = conntrack_stats.table_size(16 * 1024 * 1024, 8192)
+        self.assertEqual(maximum, 8192 * 32 * 2)
+        self.assertEqual(buckets, maximum // 4)
+
+    def test_it_never_takes_more_than_an_eighth_of_the_memory(self):
+        maximum, buckets = conntrack_stats.table_size(1024 * 1024, 16000)
+        self.assertEqual(maximum, 1024 * 1024 * 1024 // 8 // 320)
+        self.assertGreaterEqual(buckets * 4, maximum)
+        self.assertLess(buckets * 2, maximum)
+
+    def test_it_sums_the_statistics_of_every_cpu(self):
+        totals = conntrack_stats.parse_stat(STAT)
+        self.assertEqual(totals["entries"], 1000)
+        self.assertEqual(totals["insert_failed"], 1)
+        self.assertEqual(totals["drop"], 12)
+        self.assertEqual(totals["early_drop"], 1)
+
+    def test_it_publishes_usage_and_drops_since_the_previous_sample(self):
+        previous = {"drop": 10, "early_drop": 0, "insert_failed": 1}
+        current = conntrack_stats.parse_stat(STAT)
+        data = {
+            m["MetricName"]: m["Value"]
+            for m in conntrack_stats.metrics(1000, 4000, previous, current)
+        }
+        self.assertEqual(data["ConntrackUsage"], 25)
+        self.assertEqual(data["ConntrackEntries"], 1000)
+        self.assertEqual(data["ConntrackDrops"], 3)
+        self.assertEqual(data["ConntrackInsertFailed"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -14,6 +14,8 @@
 
 import boto3
 from botocore.stub import Stubber
+from mock import patch
+import CreateDeviceVpnCertificate
 from CreateDeviceVpnCertificate import handler
 from botomock import new_mock_context
 import unittest
@@ -30,6 +32,40 @@ class TestSuite(unittest.TestCase):
             res = handler({"ClientName": "MyThing", "CSR": "mock"}, None)
             self.assertEqual(res, "REPLACE_WITH_PRIVATE_KEY_PEM")
 
+    def test_it_signs_through_the_pki_agent_when_it_answers(self):
+        output = {
+            "Status": "Success",
+            "StandardOutputContent": "AGENT_PROFILE\r\n",
+            "StandardErrorContent": "PHASE easyrsa_sign 12\n",
+        }
+        with new_mock_context(), patch.object(
+            CreateDeviceVpnCertificate.pkiagent, "run", return_value={"i-123": output}
+        ), patch.object(CreateDeviceVpnCertificate, "exec_gencert_cmd") as ssm_path:
+            res = handler({"ClientName": "MyThing", "CSR": "mock"}, None)
+        self.assertEqual(res, "AGENT_PROFILE\n")
+        ssm_path.assert_not_called()
+
+    def test_it_falls_back_to_ssm_when_the_pki_agent_does_not_answer(self):
+        with new_mock_context(), patch.object(
+            CreateDeviceVpnCertificate.pkiagent, "run", return_value={}
+        ):
+            res = handler({"ClientName": "MyThing", "CSR": "mock"}, None)
+        self.assertEqual(res, "REPLACE_WITH_PRIVATE_KEY_PEM")
+
+    def test_it_does_not_sign_again_when_the_pki_agent_failed(self):
+        for output in [
+            {"Status": "Failed", "StandardOutputContent": "Device already has"},
+            {"Status": "Lost", "StandardErrorContent": "timed out"},
+        ]:
+            with new_mock_context(), patch.object(
+                CreateDeviceVpnCertificate.pkiagent,
+                "run",
+                return_value={"i-123": output},
+            ), patch.object(CreateDeviceVpnCertificate, "exec_gencert_cmd") as ssm_path:
+                with self.assertRaises(Exception):
+                    handler({"ClientName": "MyThing", "CSR": "mock"}, None)
+            ssm_path.assert_not_called()
+
     def test_it_fails_with_missing_thing_name(self):
         with new_mock_context():
             try:
@@ -60,4 +96,4 @@ class TestSuite(unittest.TestCase):
 
 
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,184 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+from mock import patch
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+# the scripts import their shared modules from their own directory, as on the instances
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../assets/ec2/ovpn"))
+
+# the daemon runs on the instances and has no .py extension
+loader = SourceFileLoader(
+    "device_authz",
+    os.path.join(os.path.dirname(__file__), "../assets/ec2/ovpn/device-authz"),
+)
+device_authz = module_from_spec(spec_from_loader(loader.name, loader))
+loader.exec_module(device_authz)
+
+HOOK = os.path.join(
+    os.path.dirname(__file__), "../assets/ec2/ovpn/authz-client-connect"
+)
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+class TestSuite(unittest.TestCase):
+    def test_devices_are_admitted_by_their_policy_or_the_default(self):
+        with tempfile.TemporaryDirectory() as authz_dir:
+            write(os.path.join(authz_dir, "default"), "single-session\n")
+            write(os.path.join(authz_dir, "groups", "line1"), "pin us-east-1a # hall\n")
+            write(os.path.join(authz_dir, "devices", "thing1"), "suspend\n")
+            write(os.path.join(authz_dir, "devices", "thing2"), "@line1\n")
+            write(os.path.join(authz_dir, "devices", "thing3"), "pin i-2 pin i-1")
+            write(os.path.join(authz_dir, "devices", "thing4"), "")
+            default, devices = device_authz.load(device_authz.PolicyFiles(), authz_dir)
+
+            peers = {"thing4": "i-2", "thing5": "i-2"}
+            for name, instance_id, zone, expected in [
+                ("thing1", "i-1", "us-east-1a", "suspended"),
+                ("thing2", "i-1", "us-east-1a", None),
+                ("thing2", "i-2", "us-east-1b", "pinned"),
+                ("thing3", "i-1", "us-east-1b", None),
+                ("thing3", "i-3", "us-east-1a", "pinned"),
+                # an empty policy overrides the default
+                ("thing4", "i-1", "us-east-1a", None),
+                ("thing5", "i-1", "us-east-1a", "connected"),
+                ("thing6", "i-1", "us-east-1a", None),
+                ("../thing1", "i-1", "us-east-1a", "invalid"),
+            ]:
+                self.assertEqual(
+                    device_authz.decide(
+                        name, default, devices, peers, instance_id, zone
+                    ),
+                    expected,
+                    name,
+                )
+
+    def test_policy_files_are_read_again_only_once_changed(self):
+        with tempfile.TemporaryDirectory() as authz_dir:
+            path = os.path.join(authz_dir, "devices", "thing1")
+            write(path, "suspend\n")
+            files = device_authz.PolicyFiles()
+            self.assertEqual(files.read(path), ["suspend"])
+            with patch("builtins.open") as opened:
+                self.assertEqual(files.read(path), ["suspend"])
+                opened.assert_not_called()
+
+            write(path, "pin us-east-1a\n")
+            os.utime(path, (time.time() + 5, time.time() + 5))
+            self.assertEqual(files.read(path), ["pin", "us-east-1a"])
+            os.remove(path)
+            self.assertIsNone(files.read(path))
+            self.assertEqual(files.files, {})
+
+            with open(path, "wb") as f:
+                f.write(b"\xff\xfe suspend")
+            self.assertIsNone(files.read(path))
+
+    def test_the_index_survives_a_failed_pass(self):
+        authorizer = device_authz.Authorizer("/nonexistent", "i-1", "us-east-1a")
+        with patch.object(
+            authorizer, "reload", side_effect=[RuntimeError("bad"), None, KeyError()]
+        ) as reload, patch.object(
+            device_authz, "publish", side_effect=FileNotFoundError("aws")
+        ), patch.object(
+            device_authz, "METRICS_INTERVAL", 0
+        ), patch.object(
+            device_authz.time, "sleep", side_effect=[None, None, StopIteration]
+        ):
+            with self.assertRaises(StopIteration):
+                device_authz.refresh(authorizer)
+        self.assertEqual(reload.call_count, 3)
+
+    def test_only_fresh_sessions_of_other_instances_count(self):
+        with tempfile.TemporaryDirectory() as sessions_dir:
+            write(os.path.join(sessions_dir, "i-1"), "thing1\n")
+            write(os.path.join(sessions_dir, "i-2"), "thing2\nthing3\n")
+            write(os.path.join(sessions_dir, "i-3"), "thing4\n")
+            write(os.path.join(sessions_dir, "i-4"), "thing5\n")
+            now = time.time()
+            os.utime(os.path.join(sessions_dir, "i-3"), (now - 60, now - 60))
+            os.utime(os.path.join(sessions_dir, "i-4"), (now - 90000, now - 90000))
+
+            peers = device_authz.sessions(sessions_dir, "i-1", now)
+            self.assertEqual(peers, {"thing2": "i-2", "thing3": "i-2"})
+            # the file of a terminated instance is removed
+            self.assertEqual(sorted(os.listdir(sessions_dir)), ["i-1", "i-2", "i-3"])
+
+    def test_the_hook_follows_the_answer_of_the_daemon(self):
+        with tempfile.TemporaryDirectory() as authz_dir:
+            write(os.path.join(authz_dir, "devices", "thing1"), "suspend\n")
+            write(os.path.join(authz_dir, "sessions", "i-2"), "thing2\n")
+            write(os.path.join(authz_dir, "default"), "single-session\n")
+            authorizer = device_authz.Authorizer(authz_dir, "i-1", "us-east-1a")
+            with patch.object(device_authz, "connected", return_value={"thing3"}):
+                authorizer.reload(publish_sessions=True)
+            with open(os.path.join(authz_dir, "sessions", "i-1")) as f:
+                self.assertEqual(f.read(), "thing3\n")
+
+            server = device_authz.Server(("127.0.0.1", 0), authorizer)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            with open(HOOK) as f:
+                hook = f.read().replace("11195", str(server.server_address[1]))
+
+            def connect(name):
+                return subprocess.run(
+                    ["bash", "-c", hook, "authz-client-connect", "/tmp/dynamic.conf"],
+                    env={"common_name": name},
+                    capture_output=True,
+                    text=True,
+                )
+
+            res = connect("thing1")
+            self.assertEqual(res.returncode, 1)
+            self.assertIn("rejected thing1: suspended", res.stderr)
+            self.assertEqual(connect("thing2").returncode, 1)
+            self.assertEqual(connect("thing4").returncode, 0)
+            server.shutdown()
+            server.server_close()
+            # devices are admitted while the daemon is down
+            self.assertEqual(connect("thing1").returncode, 0)
+
+            data = {m["MetricName"]: m for m in authorizer.metrics()}
+            self.assertEqual(data["AuthzAccepted"]["Value"], 1)
+            self.assertEqual(data["AuthzRejected"]["Value"], 2)
+            self.assertEqual(data["AuthzOverBudget"]["Value"], 0)
+            self.assertEqual(sum(data["AuthzDecisionLatency"]["Counts"]), 3)
+            self.assertEqual(authorizer.admitted, {"thing4"})
+
+    def test_latencies_are_published_as_values_and_counts(self):
+        data = device_authz.latency_data([0.12, 0.14, 0.31, 12.4, 12.2])
+        self.assertEqual(data[0]["Values"], [0.1, 0.3, 12.0])
+        self.assertEqual(data[0]["Counts"], [2, 1, 2])
+
+        data = device_authz.latency_data(
+            [n / 10 for n in range(100)] + list(range(10, 110))
+        )
+        self.assertEqual([len(d["Values"]) for d in data], [150, 50])
+        self.assertEqual(device_authz.latency_data([]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+from mock import patch
+import os
+import sys
+import tempfile
+import unittest
+
+# the scripts import their shared modules from their own directory, as on the instances
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../assets/ec2/ovpn"))
+
+# the shaper runs on the instances and has no .py extension
+loader = SourceFileLoader(
+    "device_shaper",
+    os.path.join(os.path.dirname(__file__), "../assets/ec2/ovpn/device-shaper"),
+)
+device_shaper = module_from_spec(spec_from_loader(loader.name, loader))
+loader.exec_module(device_shaper)
+
+CLASSES = """class htb 1:7 root prio 0 rate 2Mbit ceil 2Mbit burst 1600b cburst 1600b 
+ Sent 1048576 bytes 800 pkt (dropped 3, overlimits 120 requeues 0) 
+ backlog 0b 0p requeues 0
+ lended: 800 borrowed: 0 giants: 0
+ tokens: 95000 ctokens: 95000
+
+class htb 1:b root prio 0 rate 2Mbit ceil 2Mbit burst 1600b cburst 1600b 
+ Sent 2048 bytes 20 pkt (dropped 0, overlimits 0 requeues 0) 
+ backlog 0b 0p requeues 0
+"""
+
+
+class TestSuite(unittest.TestCase):
+    def test_it_keys_classes_by_tunnel_address(self):
+        self.assertEqual(device_shaper.class_minor("198.18.0.6"), 0x7)
+        self.assertEqual(device_shaper.class_minor("198.18.128.10"), 0x800B)
+        # the highest net30 client of the tunnel network
+        self.assertEqual(device_shaper.class_minor("198.18.255.254"), 0xFFFF)
+        self.assertIsNone(device_shaper.class_minor("10.0.0.0/24"))
+        self.assertIsNone(device_shaper.class_minor("not-an-address"))
+
+    def test_devices_get_their_own_limits_or_the_default(self):
+        with tempfile.TemporaryDirectory() as policy_dir:
+            with open(os.path.join(policy_dir, "thing1"), "w") as f:
+                f.write("2 0.5\n")
+            with open(os.path.join(policy_dir, "broken"), "w") as f:
+                f.write("fast\n")
+            for name, expected in [
+                ("thing1", (2, 0.5)),
+                ("thing2", (10, 0)),
+                ("broken", (10, 0)),
+                ("../thing1", (10, 0)),
+            ]:
+                self.assertEqual(
+                    device_shaper.limits(name, policy_dir, (10, 0)), expected
+                )
+
+    def test_it_applies_limits_on_connect_and_removes_them_on_disconnect(self):
+        shaper = device_shaper.Shaper()
+        with patch.object(device_shaper, "ifindex", return_value="7"):
+            with patch.object(device_shaper, "limits", return_value=(2, 0)):
+                with patch.object(device_shaper, "run") as run:
+                    shaper.learn("tun0 add 198.18.0.6 thing1")
+                    shaper.learn("tun0 delete 198.18.0.6")
+                    shaper.learn("tun0 add 10.0.0.0/24 thing1")
+
+        setup, connect, disconnect = [c[0][0] for c in run.call_args_list]
+        self.assertIn(["ip", "link", "add", "ifb0", "type", "ifb"], setup)
+        self.assertEqual(
+            connect,
+            [
+                ["tc", "class", "replace", "dev", "tun0", "parent", "1:"]
+                + ["classid", "1:7", "htb", "rate", "2000kbit", "ceil", "2000kbit"],
+                ["tc", "class", "del", "dev", "ifb0", "classid", "1:7"],
+            ],
+        )
+        self.assertEqual(disconnect[0][:4], ["tc", "class", "del", "dev"])
+
+    def test_it_publishes_throttling_since_the_previous_sample(self):
+        classes = device_shaper.parse_classes(CLASSES)
+        self.assertEqual(classes, {"1:7": (3, 120), "1:b": (0, 0)})
+
+        current = {f"tun0 {k}": v for k, v in classes.items()}
+        current["ifb0 1:7"] = (0, 10)
+        previous = {"tun0 1:7": (1, 20)}
+        data = {
+            m["MetricName"]: m["Value"]
+            for m in device_shaper.metrics(previous, current)
+        }
+        self.assertEqual(data["ShapedClients"], 2)
+        self.assertEqual(data["ThrottledClients"], 1)
+        self.assertEqual(data["ShapingOverlimits"], 110)
+        self.assertEqual(data["ShapingDrops"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
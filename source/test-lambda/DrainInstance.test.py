@@ -0,0 +1,59 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+from botocore.exceptions import ClientError
+from botomock import new_mock_context
+from mock import patch
+import DrainInstance
+import unittest
+
+EVENT = {
+    "detail-type": "EC2 Instance-terminate Lifecycle Action",
+    "source": "aws.autoscaling",
+    "detail": {
+        "LifecycleActionToken": "87654321-4321-4321-4321-210987654321",
+        "AutoScalingGroupName": "my_asg",
+        "LifecycleHookName": "my-hook; rm -rf /",
+        "EC2InstanceId": "i-123",
+        "LifecycleTransition": "autoscaling:EC2_INSTANCE_TERMINATING",
+    },
+}
+
+
+class TestSuite(unittest.TestCase):
+    def test_it_starts_draining(self):
+        with new_mock_context():
+            with patch.object(
+                DrainInstance.ssm, "send_command", wraps=DrainInstance.ssm.send_command
+            ) as send_command:
+                res = DrainInstance.handler(EVENT, None)
+        self.assertTrue(res["Draining"])
+        command = send_command.call_args[1]["Parameters"]["commands"][0]
+        self.assertIn("/usr/share/drain-instance 'my_asg' 'my-hookrm-rf'", command)
+
+    def test_it_continues_termination_when_the_drain_cannot_start(self):
+        error = ClientError({"Error": {"Code": "InvalidInstanceId"}}, "SendCommand")
+        with new_mock_context():
+            with patch.object(DrainInstance.ssm, "send_command", side_effect=error):
+                with patch.object(
+                    DrainInstance.ec2as,
+                    "complete_lifecycle_action",
+                    wraps=DrainInstance.ec2as.complete_lifecycle_action,
+                ) as complete:
+                    res = DrainInstance.handler(EVENT, None)
+        self.assertFalse(res["Draining"])
+        self.assertEqual(complete.call_args[1]["LifecycleActionResult"], "CONTINUE")
+
+
+if __name__ == "__main__":
+    unittest.main()
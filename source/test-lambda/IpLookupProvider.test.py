@@ -0,0 +1,66 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+from botomock import new_mock_context
+from mock import patch
+import IpLookupProvider
+import unittest
+
+ACCELERATOR_ARN = "arn:aws:globalaccelerator::123456789012:accelerator/abc"
+
+
+def create_event(props):
+    return {"RequestType": "Create", "ResourceProperties": props}
+
+
+class TestSuite(unittest.TestCase):
+    def setUp(self):
+        IpLookupProvider.cache.clear()
+
+    def test_it_resolves_every_index_at_once(self):
+        with new_mock_context():
+            res = IpLookupProvider.handler(
+                create_event({"AcceleratorArn": ACCELERATOR_ARN}), None
+            )
+        self.assertEqual(res["PhysicalResourceId"], "192.0.2.1,192.0.2.2")
+        self.assertEqual(res["Data"], {"Ip0": "192.0.2.1", "Ip1": "192.0.2.2"})
+
+    def test_it_resolves_a_single_index(self):
+        with new_mock_context():
+            res = IpLookupProvider.handler(
+                create_event({"AcceleratorArn": ACCELERATOR_ARN, "IpIndex": "1"}),
+                None,
+            )
+        self.assertEqual(res["PhysicalResourceId"], "192.0.2.2")
+
+    def test_it_caches_describe_calls(self):
+        event = create_event({"AcceleratorArn": ACCELERATOR_ARN, "IpIndex": "0"})
+        with new_mock_context():
+            with patch.object(
+                IpLookupProvider.ga,
+                "describe_accelerator",
+                wraps=IpLookupProvider.ga.describe_accelerator,
+            ) as describe:
+                IpLookupProvider.handler(event, None)
+                IpLookupProvider.handler(event, None)
+                self.assertEqual(describe.call_count, 1)
+
+    def test_it_splits_the_vpc_cidr(self):
+        res = IpLookupProvider.handler(
+            create_event({"VpcCIDR": "10.0.0.0/24", "Index": "2"}), None
+        )
+        self.assertEqual(res["PhysicalResourceId"], "10.0.0.128/26")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock
+from botocore.exceptions import ClientError
+
+# the tool runs on operator machines and has no .py extension
+loader = SourceFileLoader(
+    "ovpn_onboard",
+    os.path.join(os.path.dirname(__file__), "../tools/ovpn-onboard"),
+)
+ovpn_onboard = module_from_spec(spec_from_loader(loader.name, loader))
+loader.exec_module(ovpn_onboard)
+
+CSV = """ClientName,CSR
+thing1,
+thing/2,"-----BEGIN CERTIFICATE REQUEST-----
+MIIB
+-----END CERTIFICATE REQUEST-----"
+"""
+
+
+def response(payload, function_error=None):
+    res = {"StatusCode": 200, "Payload": io.BytesIO(json.dumps(payload).encode())}
+    if function_error:
+        res["FunctionError"] = function_error
+    return res
+
+
+class FakeLambda:
+    """Throttles the first call of every device, fails the devices named 'bad'"""
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def invoke(self, FunctionName, Payload):
+        name = json.loads(Payload)["ClientName"]
+        with self.lock:
+            first = name not in self.calls
+            self.calls.append(name)
+        if first:
+            raise ClientError(
+                {"Error": {"Code": "TooManyRequestsException", "Message": "Rate"}},
+                "Invoke",
+            )
+        if name.startswith("bad"):
+            return response(
+                {"errorType": "Exception", "errorMessage": "No healthy instances."},
+                "Unhandled",
+            )
+        return response(f"client\n<cert>\n{name}\n</cert>\n")
+
+
+class TestSuite(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.checkpoint_path = os.path.join(self.tmp.name, "checkpoint")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def onboard(self, fake, names, action="create"):
+        args = MagicMock(
+            concurrency=4, max_retries=3, backoff_seconds=0, max_backoff_seconds=0
+        )
+        checkpoint = ovpn_onboard.Checkpoint(self.checkpoint_path, action)
+        onboarding = ovpn_onboard.Onboarding(
+            fake, "CreateCert", action, self.tmp.name, checkpoint, args
+        )
+        events = ({"ClientName": name} for name in names)
+        ok = onboarding.run(events, 60)
+        checkpoint.close()
+        return ok, onboarding
+
+    def test_it_streams_csv_and_jsonl_events(self):
+        events = list(ovpn_onboard.read_clients(io.StringIO(CSV), "csv"))
+        self.assertEqual(events[0], {"ClientName": "thing1"})
+        self.assertEqual(events[1]["ClientName"], "thing2")
+        self.assertIn("MIIB\n", events[1]["CSR"])
+
+        jsonl = '{"ClientName": "thing1"}\n\n{"ClientName": "thing2", "CSR": "x"}\n'
+        events = list(ovpn_onboard.read_clients(io.StringIO(jsonl), "jsonl"))
+        self.assertEqual(
+            events, [{"ClientName": "thing1"}, {"ClientName": "thing2", "CSR": "x"}]
+        )
+
+    def test_the_limit_halves_on_throttling_and_grows_back(self):
+        limit = ovpn_onboard.AdaptiveLimit(8)
+        limit.acquire()
+        limit.throttled()
+        limit.throttled()
+        self.assertEqual(limit.limit, 2)
+        limit.release()
+        self.assertEqual(limit.limit, 2)
+        for _ in range(2):
+            limit.acquire()
+            limit.release()
+        self.assertEqual(limit.limit, 3)
+        # failures neither grow nor shrink it
+        limit.acquire()
+        limit.release(success=False)
+        self.assertEqual(limit.limit, 3)
+
+    def test_it_retries_throttled_devices_and_writes_their_profiles(self):
+        fake = FakeLambda()
+        ok, onboarding = self.onboard(fake, ["thing1", "thing2", "bad1"])
+
+        self.assertFalse(ok)
+        self.assertEqual(onboarding.progress.done, 2)
+        self.assertEqual(onboarding.progress.failed, 1)
+        self.assertEqual(onboarding.limit.throttles, 3)
+        path = os.path.join(self.tmp.name, "thing1.ovpn")
+        with open(path) as f:
+            self.assertEqual(f.read(), "client\n<cert>\nthing1\n</cert>\n")
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "bad1.ovpn")))
+
+    def test_it_resumes_from_the_checkpoint(self):
+        self.onboard(FakeLambda(), ["thing1", "bad1"])
+
+        fake = FakeLambda()
+        ok, onboarding = self.onboard(fake, ["thing1", "bad1", "thing3"])
+        self.assertEqual(sorted(set(fake.calls)), ["bad1", "thing3"])
+        self.assertEqual(onboarding.progress.skipped, 1)
+
+        # revoking the same devices starts over
+        fake = FakeLambda()
+        ok, onboarding = self.onboard(fake, ["thing1"], action="revoke")
+        self.assertTrue(ok)
+        self.assertEqual(fake.calls, ["thing1", "thing1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+import os
+import subprocess
+import unittest
+
+SCRIPT = os.path.join(os.path.dirname(__file__), "../assets/ec2/ovpn/perf-profile")
+
+
+def profile(mode, name, vcpus, mbps, protocol="udp"):
+    """Directives or kernel parameters of a profile, as {name: value}"""
+    out = subprocess.run(
+        ["bash", SCRIPT, mode, name, str(vcpus), str(mbps), protocol],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    settings = {}
+    for line in out.splitlines():
+        if line.startswith("#"):
+            continue
+        key, _, value = line.partition(" = " if mode == "sysctl" else " ")
+        settings[key] = value
+    return settings
+
+
+class TestSuite(unittest.TestCase):
+    def test_high_throughput_scales_buffers_with_bandwidth(self):
+        small = profile("openvpn", "high-throughput", 2, 1000)
+        large = profile("openvpn", "high-throughput", 8, 12500)
+        self.assertLess(int(small["sndbuf"]), int(large["sndbuf"]))
+        self.assertEqual(int(large["sndbuf"]), 12500 * 1024)
+        # clamped to 16 MiB
+        huge = profile("openvpn", "high-throughput", 96, 100000)
+        self.assertEqual(int(huge["rcvbuf"]), 16 * 1024 * 1024)
+
+    def test_kernel_buffers_allow_the_openvpn_buffers(self):
+        for name in ["balanced", "high-throughput", "high-connection-count"]:
+            directives = profile("openvpn", name, 4, 10000)
+            kernel = profile("sysctl", name, 4, 10000)
+            self.assertGreaterEqual(
+                int(kernel["net.core.rmem_max"]), int(directives["rcvbuf"])
+            )
+            self.assertGreaterEqual(
+                int(kernel["net.core.wmem_max"]), int(directives["sndbuf"])
+            )
+
+    def test_fast_io_is_only_used_for_udp(self):
+        self.assertIn("fast-io", profile("openvpn", "balanced", 2, 5000, "udp"))
+        self.assertNotIn("fast-io", profile("openvpn", "balanced", 2, 5000, "tcp"))
+        self.assertIn(
+            "net.ipv4.tcp_rmem", profile("sysctl", "balanced", 2, 5000, "tcp")
+        )
+
+    def test_high_connection_count_scales_clients_with_vcpus(self):
+        self.assertEqual(
+            profile("openvpn", "high-connection-count", 2, 5000)["max-clients"], "8192"
+        )
+        # capped by the net30 tunnel network
+        self.assertEqual(
+            profile("openvpn", "high-connection-count", 64, 5000)["max-clients"],
+            "16000",
+        )
+        self.assertNotIn("max-clients", profile("openvpn", "balanced", 64, 5000))
+
+    def test_none_leaves_the_defaults(self):
+        for mode in ["openvpn", "sysctl"]:
+            for protocol in ["udp", "tcp"]:
+                self.assertEqual(profile(mode, "none", 64, 5000, protocol), {})
+
+    def test_it_rejects_unknown_profiles(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            profile("openvpn", "turbo", 2, 5000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,238 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+from botocore.exceptions import ReadTimeoutError
+from mock import patch, MagicMock
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import PkiAgentClient
+import pkiagent
+from timing import Timer
+
+# the scripts import their shared modules from their own directory, as on the instances
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../assets/ec2/ovpn"))
+
+
+def load(name, path):
+    loader = SourceFileLoader(name, os.path.join(os.path.dirname(__file__), path))
+    module = module_from_spec(spec_from_loader(loader.name, loader))
+    loader.exec_module(module)
+    return module
+
+
+# the agent runs on the instances and the benchmark on a workstation, neither has a .py extension
+pki_agent = load("pki_agent", "../assets/ec2/ovpn/pki-agent")
+bench = load("pki_agent_bench", "../loadtest/pki-agent-bench")
+
+KEY = b"0123456789abcdef"
+
+STAND_IN = """#!/bin/bash
+echo "PHASE easyrsa_sign 7" >&2
+echo "ARGS $*"
+[ "$1" != "slow" ] || sleep 2
+[ "$1" != "fail" ]
+"""
+
+
+def write_key(path, key=KEY):
+    with open(path, "wb") as f:
+        f.write(key + b"\n")
+
+
+class TestSuite(unittest.TestCase):
+    def test_it_only_accepts_fresh_requests_signed_with_the_key(self):
+        with tempfile.TemporaryDirectory() as work:
+            write_key(os.path.join(work, "pki-agent.key"))
+            auth = pki_agent.Authenticator(os.path.join(work, "pki-agent.key"))
+
+            request = PkiAgentClient.sign_request(
+                KEY, {"op": "revoke", "name": "thing1"}, now=1000
+            )
+            self.assertIsNone(auth.verify(request, now=1010))
+            self.assertEqual(auth.verify(request, now=1020), "replayed")
+
+            tampered = dict(request, name="thing2", nonce="other")
+            self.assertEqual(auth.verify(tampered, now=1010), "bad mac")
+
+            other_key = PkiAgentClient.sign_request(b"other", {"op": "list"}, now=1000)
+            self.assertEqual(auth.verify(other_key, now=1010), "bad mac")
+
+            late = PkiAgentClient.sign_request(KEY, {"op": "list"}, now=1000)
+            self.assertEqual(auth.verify(late, now=1061), "expired")
+            self.assertEqual(auth.verify({"op": "list"}, now=1000), "unsigned")
+
+    def test_it_maps_requests_to_the_certificate_scripts(self):
+        self.assertEqual(
+            pki_agent.command({"op": "sign", "name": "thing1", "csr": "CSR"}, "/bin"),
+            ["/bin/gen-device-cert", "thing1", "CSR"],
+        )
+        self.assertEqual(
+            pki_agent.command({"op": "disconnect", "name": "thing1"}, "/bin"),
+            ["/bin/revoke-device-cert", "--disconnect", "thing1"],
+        )
+        for invalid in [
+            {"op": "sign", "name": "thing1"},
+            {"op": "revoke", "name": "thing1; reboot"},
+            {"op": "revoke", "name": "../thing1"},
+            {"op": "shell", "name": "thing1"},
+        ]:
+            self.assertIsNone(pki_agent.command(invalid, "/bin"))
+
+    def test_the_client_function_runs_operations_over_one_connection(self):
+        with tempfile.TemporaryDirectory() as work:
+            bench.make_certs(work)
+            write_key(os.path.join(work, "pki-agent.key"))
+            for script in ["gen-device-cert", "revoke-device-cert"]:
+                with open(os.path.join(work, script), "w") as f:
+                    f.write(STAND_IN)
+                os.chmod(os.path.join(work, script), 0o755)
+
+            agent = pki_agent.Agent(
+                pki_agent.Authenticator(os.path.join(work, "pki-agent.key")), work
+            )
+            server = pki_agent.Server(
+                ("127.0.0.1", 0), pki_agent.server_context(work), agent
+            )
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            port = server.server_address[1]
+
+            with patch.object(PkiAgentClient, "PKI_MOUNT_PATH", work), patch.object(
+                PkiAgentClient, "PORT", port
+            ), patch.object(PkiAgentClient, "tls_context", None), patch.object(
+                PkiAgentClient, "connections", {}
+            ):
+                res = PkiAgentClient.handler(
+                    {
+                        "Op": "sign",
+                        "ClientName": "thing1",
+                        "CSR": "CSR",
+                        "Targets": {"i-1": "127.0.0.1"},
+                    },
+                    None,
+                )
+                self.assertEqual(res["i-1"]["Status"], "Success")
+                self.assertEqual(
+                    res["i-1"]["StandardOutputContent"], "ARGS thing1 CSR\n"
+                )
+                timer = Timer("test", "test")
+                timer.add_command_phases(res["i-1"], time.time() - 1, "agent_queue")
+                self.assertEqual(timer.phases["easyrsa_sign"], (7.0, 1))
+                self.assertIn("agent_queue", timer.phases)
+
+                res = PkiAgentClient.handler(
+                    {
+                        "Op": "revoke",
+                        "ClientName": "fail",
+                        "Targets": {"i-1": "127.0.0.1"},
+                    },
+                    None,
+                )
+                self.assertEqual(res["i-1"]["Status"], "Failed")
+                # both requests were answered on the connection kept by the container
+                self.assertEqual(PkiAgentClient.connections["127.0.0.1"].next_id, 2)
+
+                # a key the agent does not know is denied, an agent which is down unreachable
+                other = os.path.join(work, "other")
+                os.makedirs(other)
+                write_key(os.path.join(other, "pki-agent.key"), b"other")
+                with patch.object(PkiAgentClient, "PKI_MOUNT_PATH", other):
+                    res = PkiAgentClient.handler(
+                        {"Op": "list", "Targets": {"i-1": "127.0.0.1"}}, None
+                    )
+                self.assertEqual(res["i-1"]["Status"], "Denied")
+
+                # an answer which times out after the request was sent is lost, not unreachable
+                res = PkiAgentClient.handler(
+                    {
+                        "Op": "sign",
+                        "ClientName": "slow",
+                        "CSR": "CSR",
+                        "TimeoutSeconds": 0.5,
+                        "Targets": {"i-1": "127.0.0.1"},
+                    },
+                    None,
+                )
+                self.assertEqual(res["i-1"]["Status"], "Lost")
+                self.assertIsNone(PkiAgentClient.connections["127.0.0.1"].sock)
+                server.shutdown()
+                server.server_close()
+                res = PkiAgentClient.handler(
+                    {"Op": "list", "Targets": {"i-2": "127.0.0.2"}}, None
+                )
+                self.assertEqual(res["i-2"]["Status"], "Unreachable")
+
+    def test_operations_the_agent_did_not_run_need_ssm(self):
+        outputs = {
+            "i-1": {"Status": "Success", "StandardOutputContent": "DISCONNECTED=1"},
+            "i-2": {"Status": "Failed", "StandardOutputContent": ""},
+            "i-3": {"Status": "Denied", "StandardErrorContent": "bad mac"},
+            "i-4": {"Status": "Unreachable", "StandardErrorContent": "timed out"},
+            "i-5": {"Status": "Lost", "StandardErrorContent": "timed out"},
+        }
+        ec2 = MagicMock()
+        ec2.describe_instances.return_value = {
+            "Reservations": [
+                {
+                    "Instances": [
+                        {"InstanceId": i, "PrivateIpAddress": f"10.0.0.{n}"}
+                        for n, i in enumerate(outputs)
+                    ]
+                }
+            ]
+        }
+        awslambda = MagicMock()
+        awslambda.invoke.return_value = {
+            "StatusCode": 200,
+            "Payload": io.BytesIO(json.dumps(outputs).encode("utf-8")),
+        }
+        with patch.object(pkiagent, "AGENT_FUNCTION", "agent"), patch.object(
+            pkiagent, "ec2", ec2
+        ), patch.object(pkiagent, "awslambda", awslambda), patch.object(
+            pkiagent, "addresses", {}
+        ):
+            res = pkiagent.run(
+                "disconnect", list(outputs), Timer("test", "test"), name="thing1"
+            )
+            self.assertEqual(sorted(res), ["i-1", "i-2", "i-5"])
+            payload = json.loads(awslambda.invoke.call_args[1]["Payload"])
+            self.assertEqual(payload["Targets"]["i-4"], "10.0.0.3")
+
+            # the addresses are cached, a failing client function leaves everything to SSM
+            awslambda.invoke.return_value = {
+                "StatusCode": 200,
+                "FunctionError": "Unhandled",
+                "Payload": io.BytesIO(b'{"errorMessage": "EFS unavailable"}'),
+            }
+            res = pkiagent.run("revoke", ["i-1"], Timer("test", "test"), name="x")
+            self.assertEqual(res, {})
+            ec2.describe_instances.assert_called_once()
+
+            # the requests of a client function which timed out may have been sent
+            awslambda.invoke.side_effect = ReadTimeoutError(endpoint_url="lambda")
+            res = pkiagent.run("revoke", ["i-1"], Timer("test", "test"), name="x")
+            self.assertEqual(res["i-1"]["Status"], "Lost")
+
+        # without the agent function nothing is invoked
+        self.assertEqual(pkiagent.run("list", ["i-1"], Timer("test", "test")), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+import os
+import tempfile
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import ec
+from PkiBootstrap import handler, bootstrap_pki, ensure_shards
+from botomock import new_mock_context
+import unittest
+
+
+def load_cert(path):
+    with open(path, "rb") as f:
+        return x509.load_pem_x509_certificate(f.read(), default_backend())
+
+
+class TestSuite(unittest.TestCase):
+    def test_it_builds_an_easyrsa_pki(self):
+        with tempfile.TemporaryDirectory() as root:
+            self.assertTrue(bootstrap_pki(root, "1.2.3.4", "5.6.7.8", 3653))
+            pki = os.path.join(root, "pki")
+            for f in [
+                "ca.crt",
+                "private/ca.key",
+                "ta.key",
+                "crl.pem",
+                "index.txt",
+                "index.txt.attr",
+                "serial",
+                "reqs/1.2.3.4.req",
+                "private/1.2.3.4.key",
+                "issued/1.2.3.4.crt",
+            ]:
+                self.assertTrue(os.path.exists(os.path.join(pki, f)), f)
+            self.assertTrue(os.path.exists(os.path.join(root, ".initialized")))
+
+            ca = load_cert(os.path.join(pki, "ca.crt"))
+            server = load_cert(os.path.join(pki, "issued/1.2.3.4.crt"))
+            self.assertEqual(server.issuer, ca.subject)
+            ca.public_key().verify(
+                server.signature,
+                server.tbs_certificate_bytes,
+                ec.ECDSA(server.signature_hash_algorithm),
+            )
+
+            with open(os.path.join(pki, "index.txt")) as f:
+                fields = f.read().strip("\n").split("\t")
+            self.assertEqual(fields[0], "V")
+            self.assertEqual(
+                fields[3], f"{server.serial_number:X}".zfill(len(fields[3]))
+            )
+            self.assertEqual(fields[5], "/CN=1.2.3.4")
+
+    def test_it_does_not_overwrite_an_initialized_pki(self):
+        with tempfile.TemporaryDirectory() as root:
+            bootstrap_pki(root, "1.2.3.4", "5.6.7.8", 3653)
+            with open(os.path.join(root, "pki", "ca.crt")) as f:
+                ca = f.read()
+            self.assertFalse(bootstrap_pki(root, "1.2.3.4", "5.6.7.8", 3653))
+            with open(os.path.join(root, "pki", "ca.crt")) as f:
+                self.assertEqual(f.read(), ca)
+
+    def test_it_builds_intermediate_ca_shards(self):
+        with tempfile.TemporaryDirectory() as root:
+            bootstrap_pki(root, "1.2.3.4", "5.6.7.8", 3653)
+            self.assertEqual(ensure_shards(root, 2), 2)
+
+            ca = load_cert(os.path.join(root, "pki", "ca.crt"))
+            for n in range(2):
+                pki = os.path.join(root, "shards", str(n), "pki")
+                for f in ["ca.crt", "private/ca.key", "crl.pem", "index.txt", "serial"]:
+                    self.assertTrue(os.path.exists(os.path.join(pki, f)), f)
+
+                shard = load_cert(os.path.join(pki, "ca.crt"))
+                self.assertEqual(shard.issuer, ca.subject)
+                self.assertLessEqual(shard.not_valid_after, ca.not_valid_after)
+                constraints = shard.extensions.get_extension_for_class(
+                    x509.BasicConstraints
+                ).value
+                self.assertTrue(constraints.ca)
+                self.assertEqual(constraints.path_length, 0)
+                ca.public_key().verify(
+                    shard.signature,
+                    shard.tbs_certificate_bytes,
+                    ec.ECDSA(shard.signature_hash_algorithm),
+                )
+
+            # the servers trust every CA and check every CRL
+            with open(os.path.join(root, "ca-bundle.crt")) as f:
+                self.assertEqual(f.read().count("BEGIN CERTIFICATE"), 3)
+            with open(os.path.join(root, "crl.pem")) as f:
+                self.assertEqual(f.read().count("BEGIN X509 CRL"), 3)
+
+    def test_it_adds_shards_without_replacing_existing_ones(self):
+        with tempfile.TemporaryDirectory() as root:
+            bootstrap_pki(root, "1.2.3.4", "5.6.7.8", 3653)
+            ensure_shards(root, 1)
+            with open(os.path.join(root, "shards", "0", "pki", "ca.crt")) as f:
+                shard = f.read()
+
+            self.assertEqual(ensure_shards(root, 3), 3)
+            # shards are never removed, they may have issued certificates
+            self.assertEqual(ensure_shards(root, 0), 3)
+            with open(os.path.join(root, "shards", "0", "pki", "ca.crt")) as f:
+                self.assertEqual(f.read(), shard)
+            with open(os.path.join(root, "ca-bundle.crt")) as f:
+                self.assertEqual(f.read().count("BEGIN CERTIFICATE"), 4)
+
+    def test_it_invokes_the_writer_on_create(self):
+        with new_mock_context():
+            res = handler(
+                {
+                    "RequestType": "Create",
+                    "ResourceProperties": {
+                        "FunctionArn": "arn:aws:lambda:us-east-1:123456789012:function:writer",
+                        "FileSystemId": "fs-123",
+                        "GaIp1": "",
+                        "GaIp2": "",
+                        "NlbIp1": "1.2.3.4",
+                        "NlbIp2": "5.6.7.8",
+                        "CaDays": "3653",
+                    },
+                },
+                None,
+            )
+            self.assertEqual(res["PhysicalResourceId"], "fs-123-pki")
+
+
+if __name__ == "__main__":
+    unittest.main()
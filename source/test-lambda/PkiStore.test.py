@@ -0,0 +1,101 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+import hashlib
+import os
+import subprocess
+import tempfile
+import unittest
+
+SCRIPT = os.path.join(os.path.dirname(__file__), "../assets/ec2/ovpn/pki-store")
+
+
+class TestSuite(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data = self.tmp.name
+        self.root = os.path.join(self.data, "pki")
+        self.shard = os.path.join(self.data, "shards", "0", "pki")
+        for pki in [self.root, self.shard]:
+            for sub in ["reqs", "issued", "private"]:
+                os.makedirs(os.path.join(pki, sub))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def store(self, *args, check=True):
+        return subprocess.run(
+            ["bash", SCRIPT] + list(args),
+            env=dict(os.environ, OVPN_DATA=self.data),
+            check=check,
+            capture_output=True,
+            text=True,
+        )
+
+    def touch(self, pki, path):
+        with open(os.path.join(pki, path), "w") as f:
+            f.write(path)
+
+    def test_it_hashes_device_names_into_two_levels(self):
+        digest = hashlib.sha256(b"thing1").hexdigest()
+        self.assertEqual(
+            self.store("dir", "thing1").stdout.strip(),
+            f"devices/{digest[0:2]}/{digest[2:4]}",
+        )
+
+    def test_it_finds_devices_in_the_flat_and_hashed_layouts(self):
+        self.touch(self.root, "reqs/legacy.req")
+        self.touch(self.shard, "issued/thing1.crt")
+        self.store("store", self.shard, "thing1")
+
+        self.assertEqual(self.store("find", "legacy").stdout.strip(), self.root)
+        self.assertEqual(self.store("find", "thing1").stdout.strip(), self.shard)
+        self.assertEqual(self.store("find", "thing2", check=False).returncode, 1)
+        path = self.store("file", self.shard, "thing1", "crt").stdout.strip()
+        self.assertIn("/devices/", path)
+        self.assertFalse(os.path.exists(os.path.join(self.shard, "issued/thing1.crt")))
+
+    def test_it_stages_devices_back_for_easyrsa(self):
+        self.touch(self.root, "reqs/thing1.req")
+        self.touch(self.root, "issued/thing1.crt")
+        self.store("store", self.root, "thing1")
+        self.store("stage", self.root, "thing1")
+
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(self.root, "issued"))), ["thing1.crt"]
+        )
+        self.assertEqual(self.store("find", "thing1").stdout.strip(), self.root)
+
+    def test_it_migrates_every_pki_but_keeps_the_server_certificate_flat(self):
+        for name in ["a", "b", "c"]:
+            self.touch(self.root, f"reqs/{name}.req")
+            self.touch(self.root, f"issued/{name}.crt")
+        self.touch(self.shard, "issued/d.crt")
+        self.touch(self.root, "issued/10.0.0.1.crt")
+        self.touch(self.root, "private/10.0.0.1.key")
+
+        out = self.store("migrate", "2").stdout
+        self.assertIn(f"{self.root}: moved 3 devices", out)
+        self.assertIn(f"{self.shard}: moved 1 devices", out)
+        self.assertEqual(os.listdir(os.path.join(self.root, "reqs")), [])
+        self.assertEqual(
+            os.listdir(os.path.join(self.root, "issued")), ["10.0.0.1.crt"]
+        )
+        for name in ["a", "b", "c"]:
+            self.assertIn(
+                "/devices/", self.store("file", self.root, name, "req").stdout
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,255 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+# The reconnect storm controls: the retry schedule gen-device-cert renders into every client
+# profile, and the admission limits init-instance configures. The devices of a failed instance
+# reconnecting to a surviving instance are simulated with the rendered values.
+
+import heapq
+import os
+import random
+import re
+import subprocess
+import tempfile
+import unittest
+
+SCRIPTS = os.path.join(os.path.dirname(__file__), "../assets/ec2/ovpn")
+
+DEVICES = 5000
+HANDSHAKE_CAPACITY = 100  # handshakes per second the surviving instance can complete
+KEEPALIVE = 10  # OpenVpnKeepAliveSeconds, clients ping-restart after 60s without a ping
+HORIZON = 4 * 3600
+
+# signs by copying a ready certificate, gen-device-cert only reads it back
+EASYRSA_STAND_IN = """#!/bin/bash
+cp "$TEST_CERT" "$EASYRSA_PKI/issued/$3.crt"
+"""
+
+
+def render_profiles(count, dual_protocol=False):
+    """Client profiles of count devices, rendered by gen-device-cert against a scratch PKI"""
+    with tempfile.TemporaryDirectory() as data:
+        pki = os.path.join(data, "pki")
+        for sub in ["reqs", "issued"]:
+            os.makedirs(os.path.join(pki, sub))
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "ec"]
+            + ["-pkeyopt", "ec_paramgen_curve:prime256v1", "-nodes", "-days", "1"]
+            + ["-subj", "/CN=test", "-keyout", os.path.join(pki, "ca.key")]
+            + ["-out", os.path.join(pki, "ca.crt")],
+            check=True,
+            capture_output=True,
+        )
+        with open(os.path.join(pki, "ta.key"), "w") as f:
+            f.write("TA\n")
+        with open(os.path.join(data, "easyrsa"), "w") as f:
+            f.write(EASYRSA_STAND_IN)
+        os.chmod(os.path.join(data, "easyrsa"), 0o755)
+        # the variables init-instance stores for the certificate scripts, with its defaults
+        with open(os.path.join(data, "vars"), "w") as f:
+            f.write(
+                "export PRIMARY_IP=203.0.113.1\n"
+                "export SECONDARY_IP=203.0.113.2\n"
+                "export TUNNEL_PROTOCOL=udp\n"
+                "export TUNNEL_PORT=1194\n"
+                f"export DUAL_PROTOCOL={'Yes' if dual_protocol else 'No'}\n"
+                "export TCP_FALLBACK_PORT=443\n"
+                "export CLIENT_CONNECT_RETRY=5\n"
+                "export CLIENT_CONNECT_RETRY_MAX=300\n"
+                "export CLIENT_SERVER_POLL_TIMEOUT=20\n"
+            )
+        env = dict(
+            os.environ,
+            OVPN_DATA=data,
+            EASYRSA=os.path.join(data, "easyrsa"),
+            PKI_CACHE_DIR=os.path.join(data, "cache"),
+            TEST_CERT=os.path.join(pki, "ca.crt"),
+        )
+        return [
+            subprocess.run(
+                ["bash", os.path.join(SCRIPTS, "gen-device-cert"), f"thing{n}", "CSR"],
+                env=env,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            for n in range(count)
+        ]
+
+
+def directive(profile, name):
+    return re.search(rf"^{name} (.*)$", profile, re.M).group(1).split()
+
+
+def init_instance(first, last):
+    """The lines of init-instance from the one starting with first to the next with last"""
+    with open(os.path.join(SCRIPTS, "init-instance")) as f:
+        lines = f.read().splitlines()
+    start = next(i for i, line in enumerate(lines) if line.startswith(first))
+    end = next(i for i in range(start + 1, len(lines)) if lines[i].startswith(last))
+    return "\n".join(lines[start : end + 1]) + "\n"
+
+
+def run(script, env):
+    return subprocess.run(
+        ["bash", "-c", script],
+        env=dict(os.environ, **env),
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+
+# the storm control defaults of init-instance
+DEFAULTS = init_instance("# Reconnect storm controls", "MAX_HANDSHAKES_PER_SECOND=")
+
+
+def server_conf(env=None):
+    """The OpenVPN server configuration init-instance writes"""
+    with tempfile.TemporaryDirectory() as data:
+        script = DEFAULTS + init_instance("F=${OVPN_DATA}/openvpn.conf", '" > $F')
+        return run(script + "cat $F", dict(env or {}, OVPN_DATA=data))
+
+
+def tcp_rules(env):
+    """The iptables rules init-instance adds, recorded instead of applied"""
+    script = 'function iptables { echo "$@"; [[ "$1" != -C ]]; }\n' + DEFAULTS
+    script += init_instance("# OpenVPN only enforces connect-freq on UDP", "fi")
+    return run(script, dict(env, CIDR="10.0.0.0/16"))
+
+
+def simulate(schedules, poll_timeout, admission_limit=None, seed=1):
+    """
+    Returns the connection attempts and the handshakes started at the server per second,
+    and the second by which every device was connected (None if some never did). Each device
+    takes its connect-retry interval and cap from one of the schedules. Attempts over the
+    admission limit are dropped before any handshake work is done. Admitted handshakes
+    beyond the capacity fail. A client notices a failed attempt after poll_timeout seconds,
+    then waits connect-retry.
+    """
+    rnd = random.Random(seed)
+    pending = []
+    for device in range(DEVICES):
+        # the failure is noticed at the first missed ping after ping-restart expires
+        detected = 60 + rnd.randrange(KEEPALIVE)
+        r, r_max = rnd.choice(schedules)
+        heapq.heappush(pending, (detected, device, 0, r, r_max))
+
+    attempts_per_second = [0] * HORIZON
+    handshakes = [0] * HORIZON
+    connected_at = None
+    connected = 0
+    second = 0
+    while pending and second < HORIZON:
+        second = pending[0][0]
+        if second >= HORIZON:
+            break
+        attempts = []
+        while pending and pending[0][0] == second:
+            attempts.append(heapq.heappop(pending))
+        rnd.shuffle(attempts)
+        attempts_per_second[second] = len(attempts)
+
+        admitted = attempts if admission_limit is None else attempts[:admission_limit]
+        handshakes[second] = len(admitted)
+        succeeded = admitted[:HANDSHAKE_CAPACITY]
+        connected += len(succeeded)
+        if connected == DEVICES:
+            connected_at = second
+
+        for _, device, tries, r, r_max in attempts[len(succeeded) :]:
+            # connect-retry doubles the wait after 5 attempts, up to the cap
+            delay = min(r * 2 ** max(0, tries - 5), r_max)
+            heapq.heappush(
+                pending, (second + poll_timeout + delay, device, tries + 1, r, r_max)
+            )
+
+    return attempts_per_second, handshakes, connected_at
+
+
+class TestSuite(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.profiles = render_profiles(40)
+        cls.schedules = [
+            tuple(int(v) for v in directive(p, "connect-retry")) for p in cls.profiles
+        ]
+
+    def test_each_profile_gets_its_own_retry_schedule(self):
+        for retry, retry_max in self.schedules:
+            self.assertTrue(5 <= retry <= 10, retry)
+            self.assertTrue(300 <= retry_max <= 600, retry_max)
+        self.assertGreater(len(set(self.schedules)), 1)
+        for profile in self.profiles:
+            self.assertEqual(directive(profile, "server-poll-timeout"), ["20"])
+            self.assertIn("\nremote-random\n", profile)
+
+    def test_dual_protocol_profiles_try_udp_before_tcp(self):
+        for profile in render_profiles(5, dual_protocol=True):
+            remotes = re.findall(r"^remote (\S+) (\d+) (udp|tcp)$", profile, re.M)
+            self.assertEqual([r[2] for r in remotes], ["udp", "udp", "tcp", "tcp"])
+            self.assertEqual({r[1] for r in remotes[2:]}, {"443"})
+            # remote-random would mix both protocols
+            self.assertNotIn("remote-random", profile)
+
+    def test_instances_admit_at_most_the_handshake_limit(self):
+        self.assertIn("\nconnect-freq 50 1\n", server_conf())
+        conf = server_conf({"MAX_HANDSHAKES_PER_SECOND": "20"})
+        self.assertIn("\nconnect-freq 20 1\n", conf)
+
+        # OpenVPN only enforces connect-freq on UDP, new TCP sessions are limited by iptables
+        self.assertEqual(
+            tcp_rules({"TUNNEL_PROTOCOL": "udp", "DUAL_PROTOCOL": "No"}), ""
+        )
+        for env in [
+            {"TUNNEL_PROTOCOL": "tcp"},
+            {"TUNNEL_PROTOCOL": "udp", "DUAL_PROTOCOL": "Yes"},
+        ]:
+            rules = tcp_rules(env).splitlines()
+            self.assertIn(
+                "-A INPUT -p tcp --dport 1194 --syn ! -s 10.0.0.0/16 -m limit --limit "
+                "50/second --limit-burst 50 -j ACCEPT",
+                rules,
+            )
+            self.assertEqual(
+                rules[-1], "-A INPUT -p tcp --dport 1194 --syn ! -s 10.0.0.0/16 -j DROP"
+            )
+
+    def test_controls_reduce_the_peak_handshake_rate(self):
+        # OpenVPN defaults: connect-retry 5 300, server-poll-timeout 120, no admission control
+        _, before, _ = simulate([(5, 300)], poll_timeout=120)
+        # the rendered profiles and the handshake limit of the instances
+        poll_timeout = int(directive(self.profiles[0], "server-poll-timeout")[0])
+        limit = int(directive(server_conf(), "connect-freq")[0])
+        _, after, connected_at = simulate(self.schedules, poll_timeout, limit)
+
+        self.assertGreater(max(before), 5 * max(after))
+        self.assertIsNotNone(connected_at)
+
+    def test_jitter_breaks_up_retry_waves(self):
+        # without per-profile jitter the devices rejected together retry together
+        lockstep, _, lockstep_connected_at = simulate(
+            [(5, 300)], poll_timeout=20, admission_limit=50
+        )
+        spread, _, spread_connected_at = simulate(
+            self.schedules, poll_timeout=20, admission_limit=50
+        )
+        # the first waves are only spread by the keepalive interval in both cases
+        later_waves = slice(200, HORIZON)
+
+        self.assertLess(2 * max(spread[later_waves]), max(lockstep[later_waves]))
+        self.assertLess(spread_connected_at, lockstep_connected_at)
+
+
+if __name__ == "__main__":
+    unittest.main()
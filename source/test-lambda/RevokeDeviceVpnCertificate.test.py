@@ -13,16 +13,120 @@
 
 import boto3
 from botocore.stub import Stubber
+from mock import patch
+import RevokeDeviceVpnCertificate
 from RevokeDeviceVpnCertificate import handler
 from botomock import new_mock_context
 import unittest
 
 
+def asg_with(*instance_ids):
+    return {
+        "AutoScalingGroups": [
+            {
+                "Instances": [
+                    {"HealthStatus": "Healthy", "InstanceId": i} for i in instance_ids
+                ]
+            }
+        ]
+    }
+
+
+def invocation(status, stdout):
+    return {"Status": status, "StandardOutputContent": stdout}
+
+
 class TestSuite(unittest.TestCase):
     def test_it_works_with_thing_name(self):
         with new_mock_context():
             res = handler({"ClientName": "MyThing"}, None)
-            self.assertEqual(len(res), 28)  # expected mock stub length
+            self.assertIn("MyThing", res["Message"])
+            self.assertEqual(list(res["Instances"]), ["i-123"])
+
+    def test_it_disconnects_the_device_from_every_instance(self):
+        ssm = RevokeDeviceVpnCertificate.ssm
+        outputs = {
+            "i-1": invocation("Success", "Revoking\nDISCONNECTED=0\n"),
+            "i-2": invocation("Success", "DISCONNECTED=1\n"),
+            "i-3": invocation(
+                "Failed", "Unable to reach the OpenVPN management interface"
+            ),
+        }
+        with new_mock_context(), patch.object(
+            RevokeDeviceVpnCertificate.ec2as,
+            "describe_auto_scaling_groups",
+            return_value=asg_with("i-1", "i-2", "i-3"),
+        ), patch.object(
+            ssm, "send_command", return_value={"Command": {"CommandId": "cmd-123"}}
+        ) as send_command, patch.object(
+            ssm,
+            "get_command_invocation",
+            side_effect=lambda CommandId, InstanceId: outputs[InstanceId],
+        ):
+            res = handler({"ClientName": "MyThing"}, None)
+
+        # revoked on the first instance, the others are disconnected in one command
+        self.assertEqual(send_command.call_count, 2)
+        self.assertEqual(send_command.call_args[1]["InstanceIds"], ["i-2", "i-3"])
+        self.assertEqual(
+            res["Instances"],
+            {
+                "i-1": {"Status": "Success", "Disconnected": 0},
+                "i-2": {"Status": "Success", "Disconnected": 1},
+                "i-3": {"Status": "Failed", "Disconnected": None},
+            },
+        )
+
+    def test_it_uses_ssm_for_instances_the_pki_agent_did_not_answer_for(self):
+        ssm = RevokeDeviceVpnCertificate.ssm
+        agent = {
+            "revoke": {"i-1": invocation("Success", "DISCONNECTED=1\n")},
+            "disconnect": {"i-2": invocation("Success", "DISCONNECTED=0\n")},
+        }
+        with new_mock_context(), patch.object(
+            RevokeDeviceVpnCertificate.ec2as,
+            "describe_auto_scaling_groups",
+            return_value=asg_with("i-1", "i-2", "i-3"),
+        ), patch.object(
+            RevokeDeviceVpnCertificate.pkiagent,
+            "run",
+            side_effect=lambda op, instance_ids, timer, **kwargs: agent[op],
+        ), patch.object(
+            ssm, "send_command", return_value={"Command": {"CommandId": "cmd-123"}}
+        ) as send_command, patch.object(
+            ssm,
+            "get_command_invocation",
+            return_value=invocation("Success", "DISCONNECTED=1\n"),
+        ):
+            res = handler({"ClientName": "MyThing"}, None)
+
+        send_command.assert_called_once()
+        self.assertEqual(send_command.call_args[1]["InstanceIds"], ["i-3"])
+        self.assertEqual(
+            {i: ack["Disconnected"] for i, ack in res["Instances"].items()},
+            {"i-1": 1, "i-2": 0, "i-3": 1},
+        )
+
+    def test_it_reports_instances_which_do_not_acknowledge(self):
+        ssm = RevokeDeviceVpnCertificate.ssm
+        outputs = {
+            "i-1": invocation("Success", "DISCONNECTED=1\n"),
+            "i-2": invocation("InProgress", ""),
+        }
+        with new_mock_context(), patch.object(
+            RevokeDeviceVpnCertificate.ec2as,
+            "describe_auto_scaling_groups",
+            return_value=asg_with("i-1", "i-2"),
+        ), patch.object(
+            ssm,
+            "get_command_invocation",
+            side_effect=lambda CommandId, InstanceId: outputs[InstanceId],
+        ), patch.object(
+            RevokeDeviceVpnCertificate, "DISCONNECT_TIMEOUT_SECONDS", 0
+        ):
+            res = handler({"ClientName": "MyThing"}, None)
+
+        self.assertEqual(res["Instances"]["i-2"]["Status"], "TimedOut")
 
     def test_it_fails_with_missing_thing_name(self):
         with new_mock_context():
@@ -54,4 +158,4 @@ class TestSuite(unittest.TestCase):
 
 
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,146 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+import ipaddress
+import os
+import sys
+import tempfile
+import unittest
+
+# the scripts import devicename from their own directory, as on the instances
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../assets/ec2/ovpn"))
+
+# the generator runs on the instances and has no .py extension
+loader = SourceFileLoader(
+    "route_policy",
+    os.path.join(os.path.dirname(__file__), "../assets/ec2/ovpn/route-policy"),
+)
+route_policy = module_from_spec(spec_from_loader(loader.name, loader))
+loader.exec_module(route_policy)
+
+
+def nets(*cidrs):
+    return [ipaddress.ip_network(c) for c in cidrs]
+
+
+class FakeResolver(route_policy.Resolver):
+    def __init__(self, hosts):
+        super().__init__()
+        self.hosts = hosts
+
+    def lookup(self, host):
+        return self.hosts.get(host, [])
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+class TestSuite(unittest.TestCase):
+    def test_it_collapses_destinations_into_the_fewest_routes(self):
+        self.assertEqual(
+            route_policy.summarize(
+                nets("10.1.0.0/25", "10.1.0.128/25", "10.1.0.7/32", "192.0.2.1/32")
+            ),
+            nets("10.1.0.0/24", "192.0.2.1/32"),
+        )
+        # past the limit the closest neighbours share a route, the distant one keeps its own
+        self.assertEqual(
+            route_policy.summarize(
+                nets(
+                    "192.0.2.1/32", "192.0.2.6/32", "192.0.2.200/32", "203.0.113.0/24"
+                ),
+                limit=2,
+            ),
+            nets("192.0.2.0/24", "203.0.113.0/24"),
+        )
+        self.assertEqual(
+            route_policy.summarize(nets("192.0.2.1/32", "198.51.100.1/32"), limit=1),
+            nets("192.0.0.0/5"),
+        )
+
+    def test_it_pushes_the_routes_of_the_destinations(self):
+        resolver = FakeResolver({"api.example.com": ["192.0.2.10", "192.0.2.11"]})
+        self.assertEqual(
+            route_policy.ccd(["iot", "all"], resolver, "10.249.0.0/24"),
+            'push "redirect-gateway def1"\n',
+        )
+        # the VPC CIDR is pushed by the server configuration
+        self.assertEqual(
+            route_policy.ccd(
+                ["api.example.com", "10.249.0.64/26", "203.0.113.9", "2001:db8::/32"],
+                resolver,
+                "10.249.0.0/24",
+            ),
+            'push "route 192.0.2.10 255.255.255.254"\n'
+            'push "route 203.0.113.9 255.255.255.255"\n',
+        )
+        self.assertEqual(route_policy.ccd([], resolver, "10.249.0.0/24"), "")
+
+    def test_it_keeps_routing_addresses_a_host_name_stopped_resolving_to(self):
+        resolver = FakeResolver({"iot.example.com": ["192.0.2.1"]})
+        resolver.retain = 3600
+        self.assertEqual(
+            resolver.resolve("iot.example.com", 1000), nets("192.0.2.1/32")
+        )
+        resolver.hosts["iot.example.com"] = ["192.0.2.2"]
+        # looked up once a minute
+        self.assertEqual(
+            resolver.resolve("iot.example.com", 1030), nets("192.0.2.1/32")
+        )
+        self.assertEqual(
+            resolver.resolve("iot.example.com", 1100),
+            nets("192.0.2.1/32", "192.0.2.2/32"),
+        )
+        self.assertEqual(
+            resolver.resolve("iot.example.com", 4700), nets("192.0.2.2/32")
+        )
+
+    def test_it_renders_a_file_per_device_policy(self):
+        resolver = FakeResolver({})
+        with tempfile.TemporaryDirectory() as routes_dir:
+            ccd_dir = os.path.join(routes_dir, "ccd")
+            write(
+                os.path.join(routes_dir, "groups/sensors"), "203.0.113.0/24 # uplink\n"
+            )
+            write(
+                os.path.join(routes_dir, "devices/thing1"), "@sensors, 198.51.100.7\n"
+            )
+            write(os.path.join(routes_dir, "devices/thing2"), "all\n")
+            write(os.path.join(routes_dir, "devices/bad name"), "all\n")
+            write(os.path.join(ccd_dir, "revoked"), "all\n")
+
+            self.assertEqual(route_policy.render(resolver, routes_dir, ccd_dir), (3, 1))
+            # unchanged files are not rewritten
+            self.assertEqual(route_policy.render(resolver, routes_dir, ccd_dir), (0, 0))
+
+            self.assertEqual(
+                sorted(os.listdir(ccd_dir)), ["DEFAULT", "thing1", "thing2"]
+            )
+            with open(os.path.join(ccd_dir, "thing1")) as f:
+                self.assertEqual(
+                    f.read(),
+                    'push "route 198.51.100.7 255.255.255.255"\n'
+                    'push "route 203.0.113.0 255.255.255.0"\n',
+                )
+            # without a default policy, DeviceRoutes keeps the full tunnel
+            with open(os.path.join(ccd_dir, "DEFAULT")) as f:
+                self.assertEqual(f.read(), 'push "redirect-gateway def1"\n')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+from mock import patch
+import csv
+import gzip
+import os
+import sys
+import tempfile
+import unittest
+
+# the scripts import their shared modules from their own directory, as on the instances
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../assets/ec2/ovpn"))
+
+# the exporter runs on the instances and has no .py extension
+loader = SourceFileLoader(
+    "session_export",
+    os.path.join(os.path.dirname(__file__), "../assets/ec2/ovpn/session-export"),
+)
+session_export = module_from_spec(spec_from_loader(loader.name, loader))
+loader.exec_module(session_export)
+
+STATUS = """TITLE,OpenVPN 2.4.11 x86_64-redhat-linux-gnu
+TIME,Mon Oct 19 05:00:00 2026,1792386000
+HEADER,CLIENT_LIST,Common Name,Real Address,Virtual Address,Virtual IPv6 Address,Bytes Received,Bytes Sent,Connected Since,Connected Since (time_t),Username,Client ID,Peer ID
+CLIENT_LIST,thing1,203.0.113.10:51234,198.18.0.6,,1000,2000,Mon Oct 19 04:00:00 2026,1792382400,UNDEF,7,0
+CLIENT_LIST,thing2,203.0.113.11:40000,198.18.0.10,,30,40,Mon Oct 19 04:30:00 2026,1792384200,UNDEF,9,1
+HEADER,ROUTING_TABLE,Virtual Address,Common Name,Real Address,Last Ref,Last Ref (time_t)
+ROUTING_TABLE,198.18.0.6,thing1,203.0.113.10:51234,Mon Oct 19 05:00:00 2026,1792386000
+GLOBAL_STATS,Max bcast/mcast queue length,0
+END
+"""
+
+# 2026-10-19 05:00:00 UTC
+HOUR = 1792386000
+
+
+class TestSuite(unittest.TestCase):
+    def test_it_parses_the_client_list(self):
+        clients = session_export.parse_clients(STATUS)
+        self.assertEqual(sorted(clients.keys()), ["7", "9"])
+        self.assertEqual(clients["7"]["common_name"], "thing1")
+        self.assertEqual(clients["7"]["bytes_received"], 1000)
+        self.assertEqual(clients["9"]["connected_since"], 1792384200)
+
+    def test_it_records_session_events(self):
+        clients = session_export.parse_clients(STATUS)
+        previous = {"7": clients["7"], "3": {**clients["9"], "client_id": 3}}
+        rows = session_export.session_events(previous, clients, HOUR, "i-123")
+        events = {row["client_id"]: row["event"] for row in rows}
+        self.assertEqual(events, {7: "sample", 9: "connect", 3: "disconnect"})
+
+    def test_it_polls_both_servers_in_dual_protocol_mode(self):
+        with tempfile.TemporaryDirectory() as spool_dir:
+            with patch.object(
+                session_export, "management_status", return_value=STATUS
+            ) as status, patch.object(
+                session_export.os.path, "exists", return_value=True
+            ):
+                session_export.poll(spool_dir, "i-123", now=HOUR)
+
+            status.assert_called_with(session_export.TCP_MGMT_SOCKET)
+            with open(os.path.join(spool_dir, "2026101905.jsonl")) as f:
+                rows = f.read().splitlines()
+            # client ids are per server, so the same ids are four sessions
+            self.assertEqual(len(rows), 4)
+
+    @patch.dict("sys.modules", {"pyarrow": None})
+    def test_it_exports_completed_hours_by_partition(self):
+        with tempfile.TemporaryDirectory() as spool_dir:
+            with tempfile.TemporaryDirectory() as dest:
+                clients = session_export.parse_clients(STATUS)
+                for now in [HOUR + 60, HOUR + 3600 + 60]:
+                    rows = session_export.session_events({}, clients, now, "i-123")
+                    session_export.spool(rows, spool_dir)
+
+                # the current hour is kept spooled until it is over
+                written = session_export.export(
+                    spool_dir, dest, "i-123", now=HOUR + 3600 + 120
+                )
+                self.assertEqual(len(written), 1)
+                self.assertTrue(
+                    written[0].startswith("dt=2026-10-19/hour=05/instance=i-123/")
+                )
+                self.assertTrue(written[0].endswith(".csv.gz"))
+                self.assertEqual(os.listdir(spool_dir), ["2026101906.jsonl"])
+
+                with gzip.open(os.path.join(dest, written[0]), "rt") as f:
+                    rows = list(csv.DictReader(f))
+                self.assertEqual(len(rows), 2)
+                self.assertEqual(rows[0]["bytes_sent"], "2000")
+                self.assertEqual(rows[0]["instance_id"], "i-123")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+from botocore.exceptions import ClientError
+from mock import patch
+from Waiter import wait_until, DeadlineExceeded
+import unittest
+
+
+class MockContext:
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+def client_error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "Operation")
+
+
+class TestSuite(unittest.TestCase):
+    @patch("time.sleep")
+    def test_it_retries_retryable_errors(self, sleep):
+        calls = []
+
+        def attempt():
+            calls.append(1)
+            if len(calls) < 3:
+                raise client_error("FileSystemInUse")
+            return "done"
+
+        res = wait_until({}, MockContext(600000), attempt, ["FileSystemInUse"])
+        self.assertEqual(res, "done")
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    @patch("time.sleep")
+    def test_it_raises_fatal_errors_immediately(self, sleep):
+        def attempt():
+            raise client_error("AccessDenied")
+
+        with self.assertRaises(ClientError):
+            wait_until({}, MockContext(600000), attempt, ["FileSystemInUse"])
+        sleep.assert_not_called()
+
+    @patch("time.sleep")
+    def test_it_hands_over_before_the_deadline(self, sleep):
+        def attempt():
+            raise client_error("Throttling")
+
+        with self.assertRaises(DeadlineExceeded) as e:
+            wait_until({"Continuation": {"Attempt": 4}}, MockContext(1000), attempt)
+        self.assertEqual(e.exception.state["Attempt"], 5)
+        sleep.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -13,6 +13,8 @@
 
 import boto3
 import botocore
+import io
+import json
 from mock import patch
 import logging
 
@@ -39,6 +41,20 @@ def _mock_make_api_call(self, operation_name, kwarg):
             "StandardOutputContent": "REPLACE_WITH_PRIVATE_KEY_PEM",
         }
 
+    if operation_name == "Invoke":
+        return {
+            "StatusCode": 200,
+            "Payload": io.BytesIO(json.dumps({"Initialized": True}).encode("utf-8")),
+        }
+
+    if operation_name == "CompleteLifecycleAction":
+        return {}
+
+    if operation_name == "DescribeAccelerator":
+        return {
+            "Accelerator": {"IpSets": [{"IpAddresses": ["192.0.2.1", "192.0.2.2"]}]}
+        }
+
     raise Exception("Don't know how to mock this call")
 
 
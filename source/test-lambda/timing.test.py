@@ -0,0 +1,72 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+import io
+import json
+from contextlib import redirect_stdout
+from timing import Timer, parse_ssm_time
+import unittest
+
+
+class TestSuite(unittest.TestCase):
+    def test_it_sums_durations_and_counts_per_phase(self):
+        timer = Timer("stack/VPN", "MyFunction")
+        for _ in range(3):
+            with timer.span("ssm_poll"):
+                pass
+        timer.add("keygen", 250.0)
+
+        self.assertEqual(timer.phases["ssm_poll"][1], 3)
+        self.assertEqual(timer.phases["keygen"], (250.0, 1))
+
+    def test_it_records_the_phases_of_an_ssm_command(self):
+        timer = Timer("stack/VPN", "MyFunction")
+        dispatched_at = parse_ssm_time("2021-04-01T10:11:12.000Z")
+        timer.add_command_phases(
+            {
+                "ExecutionStartDateTime": "2021-04-01T10:11:13.500Z",
+                "ExecutionEndDateTime": "2021-04-01T10:11:14.000Z",
+                "StandardErrorContent": "PHASE lock_wait 12\nwarning\nPHASE easyrsa_sign 340\n",
+            },
+            dispatched_at,
+        )
+
+        self.assertEqual(timer.phases["ssm_queue"], (1500.0, 1))
+        self.assertEqual(timer.phases["instance"], (500.0, 1))
+        self.assertEqual(timer.phases["lock_wait"], (12.0, 1))
+        self.assertEqual(timer.phases["easyrsa_sign"], (340.0, 1))
+
+    def test_it_prints_an_emf_record_per_phase(self):
+        timer = Timer("stack/VPN", "MyFunction")
+        timer.add("keygen", 250.0)
+        out = io.StringIO()
+        with redirect_stdout(out):
+            timer.flush("Failed")
+
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([r["Phase"] for r in records], ["keygen", "total"])
+        metrics = records[0]["_aws"]["CloudWatchMetrics"][0]
+        self.assertEqual(metrics["Namespace"], "stack/VPN")
+        self.assertEqual(metrics["Dimensions"], [["Function", "Phase"]])
+        self.assertEqual(records[0]["Function"], "MyFunction")
+        self.assertEqual(records[0]["Status"], "Failed")
+        self.assertEqual(records[0]["PhaseDuration"], 250.0)
+        self.assertEqual(records[0]["PhaseCount"], 1)
+
+    def test_it_ignores_unknown_ssm_times(self):
+        self.assertIsNone(parse_ssm_time(None))
+        self.assertIsNone(parse_ssm_time("yesterday"))
+
+
+if __name__ == "__main__":
+    unittest.main()
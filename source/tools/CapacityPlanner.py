@@ -0,0 +1,387 @@
+#
+# Copyright 2021 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You may not use
+# this file except in compliance with the License. A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed on an "AS IS"
+# BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under the License.
+#
+
+# The model of ovpn-capacity-plan. It runs on operator machines, not in the Lambda functions, and
+# is handed the boto3 clients and the stack name.
+
+import functools
+import math
+import os
+import subprocess
+import sys
+import logging as log
+from datetime import datetime, timedelta
+
+# the client slots are sized by the instance scripts themselves, see perf-profile and ovpnserver.py
+OVPN_ASSETS = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "assets", "ec2", "ovpn"
+)
+sys.path.insert(0, OVPN_ASSETS)
+import ovpnserver
+
+# vCPUs, baseline network bandwidth in Mbit/s and the us-east-1 on-demand price per hour, used
+# as the relative cost. All are x86_64, as the default InstanceAMI.
+INSTANCE_TYPES = {
+    "t3.small": (2, 128, 0.0208),
+    "t3.medium": (2, 256, 0.0416),
+    "c5.large": (2, 750, 0.085),
+    "c5.xlarge": (4, 1250, 0.17),
+    "c5.2xlarge": (8, 2500, 0.34),
+    "c5n.large": (2, 3000, 0.108),
+    "c5n.xlarge": (4, 5000, 0.216),
+}
+# the load balancer spreads the instances over both zones
+MIN_INSTANCES = 2
+PERCENTILE = 95
+# scheduled increases start ahead of the hour, instances take a few minutes to boot
+SCHEDULE_LEAD_MINUTES = 10
+
+
+def get_metric_series(
+    cloudwatch,
+    Namespace,
+    MetricName,
+    Dimensions,
+    Days,
+    Statistic="Average",
+    Unit="None",
+    Period=3600,
+):
+    """Datapoints of the last days as {timestamp: value}, in requests of at most 1440 points"""
+    series = {}
+    end = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=Days)
+    while start < end:
+        chunk_end = min(end, start + timedelta(seconds=Period * 1440))
+        res = cloudwatch.get_metric_statistics(
+            Namespace=Namespace,
+            MetricName=MetricName,
+            Dimensions=Dimensions,
+            StartTime=start,
+            EndTime=chunk_end,
+            Period=Period,
+            Statistics=[Statistic],
+            Unit=Unit,
+        )
+        for point in res.get("Datapoints", []):
+            series[point["Timestamp"]] = point[Statistic]
+        start = chunk_end
+    return series
+
+
+def get_stack_parameters(cfn, stack_name):
+    stack = cfn.describe_stacks(StackName=stack_name)["Stacks"][0]
+    return {p["ParameterKey"]: p["ParameterValue"] for p in stack["Parameters"]}
+
+
+def instance_vcpus(ec2, instance_type):
+    if instance_type in INSTANCE_TYPES:
+        return INSTANCE_TYPES[instance_type][0]
+    res = ec2.describe_instance_types(InstanceTypes=[instance_type])
+    return res["InstanceTypes"][0]["VCpuInfo"]["DefaultVCpus"]
+
+
+def openvpn_servers(params):
+    """One server, or a UDP and a TCP server with TcpFallbackPort"""
+    dual = params.get("VPNProtocol") == "UDP" and params.get("TcpFallbackPort") not in [
+        None,
+        "",
+        "0",
+    ]
+    return 2 if dual else 1
+
+
+def usable_cores(vcpus, servers):
+    # every OpenVPN server is single threaded, the kernel's tunnel and NAT work takes about one
+    # more core. vCPUs beyond that add no VPN capacity.
+    return min(vcpus, servers + 1)
+
+
+@functools.lru_cache(maxsize=None)
+def profile_directives(profile, vcpus):
+    """The OpenVPN directives of a performance profile, as init-instance appends them"""
+    res = subprocess.run(
+        [
+            "bash",
+            os.path.join(OVPN_ASSETS, "perf-profile"),
+            "openvpn",
+            profile,
+            str(vcpus),
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return res.stdout
+
+
+def client_slots(vcpus, params, servers):
+    """Clients an instance admits before it is full, see capacity-check"""
+    # dual protocol mode splits the tunnel network between both servers, see init-instance
+    netmask = ovpnserver.DEFAULT_NETMASK if servers == 1 else "255.255.128.0"
+    profile = params.get("PerformanceProfile") or "none"
+    conf = f"server 198.18.0.0 {netmask}\n" + profile_directives(profile, vcpus)
+    percent = float(params.get("CapacityClientPercent") or 90)
+    return ovpnserver.client_slots(conf) * servers * percent / 100
+
+
+def get_stack_dimensions(cfn, stack_name):
+    """Names of the auto scaling group, load balancer and target group for the metrics"""
+    resources = []
+    for page in cfn.get_paginator("list_stack_resources").paginate(
+        StackName=stack_name
+    ):
+        resources += page["StackResourceSummaries"]
+
+    def physical_id(resource_type):
+        return next(
+            r["PhysicalResourceId"]
+            for r in resources
+            if r["ResourceType"] == resource_type
+            # the TCP fallback target group has the same instances
+            and "TcpTargetGroup" not in r["LogicalResourceId"]
+        )
+
+    # the metric dimensions are the ARNs without their prefix
+    lb_arn = physical_id("AWS::ElasticLoadBalancingV2::LoadBalancer")
+    tg_arn = physical_id("AWS::ElasticLoadBalancingV2::TargetGroup")
+    return (
+        physical_id("AWS::AutoScaling::AutoScalingGroup"),
+        lb_arn.split("loadbalancer/")[1],
+        tg_arn.split(":")[-1],
+    )
+
+
+def collect(cloudwatch, stack_name, asg_name, lb_name, tg_name, days):
+    """Hourly samples of the load of the whole cluster"""
+    asg = [{"Name": "AutoScalingGroupName", "Value": asg_name}]
+    lb = [{"Name": "LoadBalancer", "Value": lb_name}]
+    tg = lb + [{"Name": "TargetGroup", "Value": tg_name}]
+
+    cpu = get_metric_series(
+        cloudwatch, "AWS/EC2", "CPUUtilization", asg, days, Unit="Percent"
+    )
+    net_in = get_metric_series(
+        cloudwatch, "AWS/EC2", "NetworkIn", asg, days, Statistic="Sum", Unit="Bytes"
+    )
+    net_out = get_metric_series(
+        cloudwatch, "AWS/EC2", "NetworkOut", asg, days, Statistic="Sum", Unit="Bytes"
+    )
+    instances = get_metric_series(
+        cloudwatch, "AWS/NetworkELB", "HealthyHostCount", tg, days, Unit="Count"
+    )
+    flows = get_metric_series(
+        cloudwatch,
+        "AWS/NetworkELB",
+        "ActiveFlowCount",
+        lb,
+        days,
+        Statistic="Maximum",
+        Unit="Count",
+    )
+    connects = get_metric_series(
+        cloudwatch,
+        f"{stack_name}/VPN",
+        "ClientConnect",
+        [],
+        days,
+        Statistic="Sum",
+        Unit="Count",
+    )
+
+    samples = []
+    for timestamp in sorted(cpu):
+        if not instances.get(timestamp):
+            continue
+        samples.append(
+            {
+                "Time": timestamp,
+                "Instances": instances[timestamp],
+                "Cpu": cpu[timestamp],
+                # the busier direction, averaged over the hour
+                "Mbps": max(net_in.get(timestamp, 0), net_out.get(timestamp, 0))
+                * 8
+                / 3600
+                / 1000000,
+                "Flows": flows.get(timestamp, 0),
+                "Connects": connects.get(timestamp, 0),
+            }
+        )
+    log.info(f"Collected {len(samples)} hourly samples")
+    return samples
+
+
+def demand(sample, current_vcpus, instance_type, params, target_cpu):
+    """Instances of the type each resource needs for the sample's load"""
+    vcpus, mbps, _ = INSTANCE_TYPES[instance_type]
+    servers = openvpn_servers(params)
+    busy_cores = sample["Cpu"] / 100 * current_vcpus * sample["Instances"]
+    return {
+        "cpu": busy_cores / (usable_cores(vcpus, servers) * target_cpu / 100),
+        "sessions": sample["Flows"] / client_slots(vcpus, params, servers),
+        "network": sample["Mbps"] / mbps,
+    }
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def instances_for(load, headroom):
+    return max(MIN_INSTANCES, math.ceil(load * (1 + headroom / 100)))
+
+
+def plan_instance_type(samples, current_vcpus, instance_type, params, opts):
+    """Capacity of one instance type, from the load of each hour of the day"""
+    by_hour = [[] for _ in range(24)]
+    peak = (0, None, None)
+    for sample in samples:
+        resources = demand(
+            sample, current_vcpus, instance_type, params, opts["TargetCpu"]
+        )
+        limit = max(resources, key=resources.get)
+        by_hour[sample["Time"].hour].append(resources[limit])
+        if resources[limit] > peak[0]:
+            peak = (resources[limit], limit, sample["Time"].hour)
+
+    hours = []
+    for hour, loads in enumerate(by_hour):
+        load = percentile(loads, PERCENTILE) if loads else 0
+        instances = instances_for(load, opts["Headroom"])
+        hours.append(
+            {
+                "Hour": hour,
+                "Load": load,
+                "Instances": instances,
+                "Headroom": 100 * (1 - load / instances),
+            }
+        )
+    price = INSTANCE_TYPES[instance_type][2]
+    return {
+        "InstanceType": instance_type,
+        "MinCapacity": min(h["Instances"] for h in hours),
+        # the peak sample plus one instance, to replace an instance at any time
+        "MaxCapacity": instances_for(peak[0], opts["Headroom"]) + 1,
+        "PeakLoad": peak[0],
+        "PeakLimit": peak[1],
+        "PeakHour": peak[2],
+        "Hours": hours,
+        "CostPerDay": sum(h["Instances"] for h in hours) * price,
+    }
+
+
+def plan(samples, params, opts, ec2=None):
+    """Plans of every candidate instance type, cheapest first"""
+    if len(samples) < 24:
+        raise Exception(
+            f"Only {len(samples)} hourly samples, at least a day of metrics is needed"
+        )
+    current_vcpus = instance_vcpus(ec2, params["InstanceType"])
+    plans = [
+        plan_instance_type(samples, current_vcpus, t, params, opts)
+        for t in opts["InstanceTypes"]
+    ]
+    return sorted(plans, key=lambda p: (p["CostPerDay"], p["MaxCapacity"]))
+
+
+def scheduled_actions(recommendation):
+    """Daily minimum sizes for the group, when the load differs over the day"""
+    sizes = [h["Instances"] for h in recommendation["Hours"]]
+    actions = []
+    for hour, size in enumerate(sizes):
+        previous = sizes[hour - 1]
+        if size == previous:
+            continue
+        # raise the minimum ahead of the load, lower it once the busier hour is over
+        minute = hour * 60 - (SCHEDULE_LEAD_MINUTES if size > previous else 0)
+        minute %= 24 * 60
+        actions.append(
+            {
+                "ScheduledActionName": f"capacity-plan-{hour:02d}",
+                "Recurrence": f"{minute % 60} {minute // 60} * * *",
+                "TimeZone": "Etc/UTC",
+                "MinSize": size,
+            }
+        )
+    return actions
+
+
+def parameter_file(params, recommendation):
+    """Stack parameters for update-stack, the others keep their values"""
+    changed = {
+        "InstanceType": recommendation["InstanceType"],
+        "AutoScalingMinCapacity": str(recommendation["MinCapacity"]),
+        "AutoScalingMaxCapacity": str(recommendation["MaxCapacity"]),
+    }
+    return [
+        (
+            {"ParameterKey": key, "ParameterValue": changed[key]}
+            if key in changed
+            else {"ParameterKey": key, "UsePreviousValue": True}
+        )
+        for key in sorted(params)
+    ]
+
+
+def report(stack_name, samples, params, plans, opts):
+    best = plans[0]
+    vcpus = INSTANCE_TYPES[best["InstanceType"]][0]
+    servers = openvpn_servers(params)
+    lines = [
+        f"Capacity plan for {stack_name}, {len(samples)} hourly samples from "
+        f"{samples[0]['Time']:%Y-%m-%d} to {samples[-1]['Time']:%Y-%m-%d}",
+        f"Current: {params['InstanceType']}, {params['AutoScalingMinCapacity']} to "
+        f"{params['AutoScalingMaxCapacity']} instances",
+        f"Recommended: {best['InstanceType']}, {best['MinCapacity']} to {best['MaxCapacity']} instances",
+        f"Peak load: {best['PeakLoad']:.1f} instances, limited by {best['PeakLimit']}, "
+        f"at {best['PeakHour']:02d}:00 UTC",
+        f"Peak client connects: {max(s['Connects'] for s in samples):.0f} per hour",
+        "",
+        f"Load is the p{PERCENTILE} of each hour in instances of {best['InstanceType']}, at "
+        f"{opts['TargetCpu']}% CPU, full client slots or baseline network bandwidth. "
+        f"Headroom is the spare capacity at that load, {opts['Headroom']}% is added.",
+        "",
+        "Hour (UTC)  Load   Instances  Headroom",
+    ]
+    for h in best["Hours"]:
+        lines.append(
+            f"{h['Hour']:02d}:00       {h['Load']:5.1f}  {h['Instances']:9d}  {h['Headroom']:7.0f}%"
+        )
+    lines += ["", "Instance type  Min  Max  Instance hours/day  Cost/day"]
+    for p in plans:
+        lines.append(
+            f"{p['InstanceType']:13s}  {p['MinCapacity']:3d}  {p['MaxCapacity']:3d}  "
+            f"{sum(h['Instances'] for h in p['Hours']):18d}  ${p['CostPerDay']:7.2f}"
+        )
+    if usable_cores(vcpus, servers) < vcpus:
+        lines += [
+            "",
+            f"OpenVPN uses {usable_cores(vcpus, servers)} of the {vcpus} vCPUs of "
+            f"{best['InstanceType']}, average CPU stays below the scale out threshold. Rely on "
+            "the schedule and CapacityHealthCheck.",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def get_plan(opts, stack_name, cfn, cloudwatch, ec2):
+    params = get_stack_parameters(cfn, stack_name)
+    samples = collect(
+        cloudwatch, stack_name, *get_stack_dimensions(cfn, stack_name), opts["Days"]
+    )
+    plans = plan(samples, params, opts, ec2)
+    return (
+        report(stack_name, samples, params, plans, opts),
+        parameter_file(params, plans[0]),
+        scheduled_actions(plans[0]),
+    )